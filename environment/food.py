@@ -1,5 +1,4 @@
-import random
-import numpy as np
+from RandomService import get_stream, FOOD_STREAM
 
 FOOD_DECAY_LOWER_BOUND = .01
 FOOD_DECAY_UPPER_BOUND = .1
@@ -50,15 +49,16 @@ class Food:
         """
         Generate a random food that contains 1-3 chemicals with varying strengths.
         """
-        self._degrade_multiplier = random.randint(FOOD_DECAY_LOWER_BOUND, FOOD_DECAY_UPPER_BOUND)
-        chems = random.randint(1,3)
+        stream = get_stream(FOOD_STREAM)
+        self._degrade_multiplier = stream.uniform(FOOD_DECAY_LOWER_BOUND, FOOD_DECAY_UPPER_BOUND)
+        chems = stream.randint(1,3)
         for i in range(chems):
-            chemical = random.randint(0,15)
-            quant = min(np.random.binomial(100, .04), 15)
+            chemical = stream.randint(0,15)
+            quant = min(stream.binomial(100, .04), 15)
             self._chems[chemical]=(Chemical(bin(chemical)))
             self._chems[chemical].increase(quant)
         if chems <= 2:
-            self._energy = random.uniform(1,10)
+            self._energy = stream.uniform(1,10)
     
     def degrade(self):
         """
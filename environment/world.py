@@ -1,6 +1,6 @@
 from actions import *
 from food import *
-import random
+from RandomService import get_stream, WORLD_STREAM
 HEIGHT = 30
 WIDTH = 30
 CELLS = HEIGHT * WIDTH
@@ -33,9 +33,11 @@ class World:
         """
         Seed the initial grid with a number of food items
         """
+        stream = get_stream(WORLD_STREAM)
         for i in range(len(self._grid)):
+            rolls = stream.uniforms(len(self._grid[i]))
             for q in range(len(self._grid[i])):
-                if random.random() < FOOD_SEED_CHANCE:
+                if rolls[q] < FOOD_SEED_CHANCE:
                     self._grid[i][q].set_food(Food())
                     
     
@@ -56,7 +58,7 @@ class World:
                         self._grid[i][j].set_food(None)
                         food = None
                     self.check_organism(occupant)
-                    action = occupant.take_action()
+                    action = occupant.take_action(self._iterations)
                     self.handle_action(action, occupant)
 
                 # Decay food or check if food should be placed
@@ -152,7 +154,7 @@ class World:
         """
         Roll to see if new food should be placed.
         """
-        if random.random() < FOOD_STEP_CHANCE:
+        if get_stream(WORLD_STREAM).random() < FOOD_STEP_CHANCE:
             self._grid[row][column].set_food(Food())
 
     def place_organism(self,organism, x=0,y=0):
@@ -25,6 +25,9 @@ class BioChemGene:
         self._activation_function = function
         self._func_name = name
 
+    def get_id(self):
+        return self._id
+
     def get_type(self):
         """
         Returns the type of gene
@@ -58,7 +61,9 @@ class Receptor(BioChemGene):
             
     def set_parameter(self, name, parameter):
         """
-        Sets what this gene can adjust in the organ. Presently needs to be passed a function from the organ, such as organ.get_rate() or organ.get_health(), these are then averaged over all receptors in organ
+        Sets what this gene can adjust in the organ, these are then averaged over all receptors in organ
+        :param name: The name of the parameter
+        :param parameter: The organ table column of the parameter, as paired in organ.get_param_at_index()
         """
         self._param_name = name
         self._parameter = parameter
@@ -92,7 +97,7 @@ class Receptor(BioChemGene):
         """
         outputs signal to the parameter it should effect
         """
-        self._parameter(self.get_output())
+        self._organ.adjust_parameter(self._parameter, self.get_output())
 
     def describe(self):
         """
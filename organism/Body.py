@@ -2,13 +2,21 @@
 Creates a simple organism for prototyping purposes
 """
 
+import copy
 from utilities import *
+from Organ import OrganTable
+from RandomService import get_stream, ORGAN_STREAM
+from Quiescence import QuiescenceTracker
 import Chemicals
-import random
 import numpy as np
 
 ORGAN_ENERGY_MULTIPLIER = .4
 HEALTH_DEATH_THRESHOLD = .05
+# Cross check the running health and energy totals against a full recomputation on every read
+DEBUG_AGGREGATES = False
+AGGREGATE_TOLERANCE = 1e-9
+# Replay organ activations once an organisms biochemistry settles, see Quiescence.py
+QUIESCENCE_ENABLED = False
 
 def energy_drain_function(val):
     """
@@ -35,6 +43,8 @@ class Body:
         self._chems = {chem: 0 for chem in Chemicals.CHEMS}
         self._concentrations = {chem: 0 for chem in Chemicals.CHEMS}
         self._organs = []
+        self._organ_table = OrganTable(health_function, HEALTH_DEATH_THRESHOLD)
+        self._debug_aggregates = DEBUG_AGGREGATES
         self._health = 1
         self._alive = True
         self._brain = None
@@ -42,8 +52,88 @@ class Body:
         self._dna_head = None
         self._heading = [0,1]
         self._energy = 1
-        self._max_energy = 1
         self._cell = None
+        self._quiescence = QuiescenceTracker() if QUIESCENCE_ENABLED else None
+        # The template this organism was copied from when its genome was interned
+        self._phenotype = None
+        # The phenotype tables the organism was built from, see Phenotype.py
+        self._tables = None
+
+    def __getstate__(self):
+        """
+        Pickles an organism built from phenotype tables as the tables plus the state that changes while it lives, the organs, genes and brain are rebuilt from the tables when it is loaded.
+        Other organisms pickle every attribute. The cell, world and intern template are never pickled
+        """
+        if self._tables is None:
+            state = dict(vars(self))
+            state.pop('_world', None)
+            state['_cell'] = None
+            state['_phenotype'] = None
+            return state
+        brain = self._brain
+        return {'tables': self._tables,
+                'id': self._id,
+                'chems': self._chems,
+                'concentrations': self._concentrations,
+                'organ table': self._organ_table.get_state(),
+                'organs': [(organ.get_slot(), organ.get_id(), [gene.get_id() for gene in organ.get_genes()]) for organ in self._organs],
+                'lobes': None if brain is None else [lobe.get_id() for lobe in [brain] + brain.get_lobes()],
+                'brain tick': None if brain is None else brain.get_tick_state(),
+                'decision cache': None if brain is None else brain.get_decision_cache(),
+                'profiler': None if brain is None else brain.get_profiler(),
+                'debug aggregates': self._debug_aggregates,
+                'health': self._health,
+                'alive': self._alive,
+                'heading': self._heading,
+                'position': vars(self).get('_position'),
+                'energy': self._energy,
+                'quiescence': self._quiescence}
+
+    def __deepcopy__(self, memo):
+        """
+        Copies every attribute, the compact pickled form is only for sending organisms between processes
+        """
+        organism = Body.__new__(Body)
+        memo[id(self)] = organism
+        vars(organism).update(copy.deepcopy(vars(self), memo))
+        return organism
+
+    def __setstate__(self, state):
+        """
+        Loads an organism pickled by __getstate__, rebuilding it from its phenotype tables if it has them
+        """
+        if 'tables' not in state:
+            vars(self).update(state)
+            return
+        self.__init__()
+        state['tables'].build(self)
+        self._id = state['id']
+        self._chems = state['chems']
+        self._concentrations = state['concentrations']
+        self._organ_table.set_state(state['organ table'])
+        # Organs that died are left out, the rest keep their slots and ids
+        organs = {organ.get_slot(): organ for organ in self._organs}
+        self._organs = []
+        for slot, organ_id, gene_ids in state['organs']:
+            organ = organs[slot]
+            organ._id = organ_id
+            for gene, gene_id in zip(organ.get_genes(), gene_ids):
+                gene._id = gene_id
+            self._organs.append(organ)
+        if self._brain is not None:
+            for lobe, lobe_id in zip([self._brain] + self._brain.get_lobes(), state['lobes']):
+                lobe._id = lobe_id
+            self._brain.set_tick_state(state['brain tick'])
+            self._brain.set_decision_cache(state['decision cache'])
+            self._brain.set_profiler(state['profiler'])
+        self._debug_aggregates = state['debug aggregates']
+        self._health = state['health']
+        self._alive = state['alive']
+        self._heading = state['heading']
+        if state['position'] is not None:
+            self._position = state['position']
+        self._energy = state['energy']
+        self._quiescence = state['quiescence']
 
     def set_world(self, world):
         """
@@ -72,34 +162,103 @@ class Body:
         
     def add_organ(self, organ):
         """
-        Adds a new organ to the creature
+        Adds a new organ to the creature, its health and energy capacity are added to the running totals
         """
-        self._max_energy += organ.get_energy_capacity()*ORGAN_ENERGY_MULTIPLIER
+        self._organ_table.set_alive(organ.get_slot())
         self._organs.append(organ)
 
+    def get_organ_table(self):
+        """
+        Returns the table holding the parameters of every organ in this creature
+        """
+        return self._organ_table
+
     def activate_organs(self):
         """
         Activates each organ based on the activation rate of that organ
         """
-        for organ in self._organs:
-            roll = random.random()
+        # Draw every organs roll at once from the organ stream
+        rolls = get_stream(ORGAN_STREAM).uniforms(len(self._organs))
+        if self._quiescence is not None:
+            self.activate_organs_quiescent(rolls)
+            return
+        for organ, roll in zip(self._organs, rolls):
             if roll <= organ.get_act_rate():
                 organ.activate_organ()
                 gene_count = len(organ.get_genes())
                 fat_cells = organ.get_energy_capacity()
-                self._remove_energy(energy_drain_function(gene_count+fat_cells))
+                self.remove_energy(energy_drain_function(gene_count+fat_cells))
         self.calc_concentrations()
 
+    def activate_organs_quiescent(self, rolls):
+        """
+        Same as activate_organs, but organ activations are replayed from the quiescence tracker while the biochemistry is at a fixed point
+        :param rolls: One activation roll per organ
+        """
+        replayed = 0
+        evaluated = 0
+        for organ, roll in zip(self._organs, rolls):
+            if roll <= organ.get_act_rate():
+                if self._quiescence.activate(self, organ):
+                    replayed += 1
+                else:
+                    evaluated += 1
+                gene_count = len(organ.get_genes())
+                fat_cells = organ.get_energy_capacity()
+                self.remove_energy(energy_drain_function(gene_count+fat_cells))
+        self.calc_concentrations()
+        self._quiescence.end_tick(self, replayed > 0 and evaluated == 0)
+
+    def enable_quiescence(self, tracker=None):
+        """
+        Turns on the quiescence fast path for this creature
+        :param tracker: A QuiescenceTracker, a default one is made if not given
+        """
+        self._quiescence = tracker if tracker is not None else QuiescenceTracker()
+
+    def disable_quiescence(self):
+        self._quiescence = None
+
+    def wake(self):
+        """
+        Tells the quiescence tracker that an input from outside the body changed
+        """
+        if self._quiescence is not None:
+            self._quiescence.wake()
+
+    def get_quiescence_stats(self):
+        """
+        Returns how much work the quiescence fast path skipped, or None if it is off
+        """
+        if self._quiescence is None:
+            return None
+        return self._quiescence.get_stats()
+
     def get_max_energy(self):
         """
-        Calculates the current maximum energy the organism can have.
+        Gets the current maximum energy the organism can have. Read from the running capacity total of the organ table.
         """
-        tot = 1
-        for organ in self._organs:
-            if organ.get_health() > 0:
-                tot += organ.get_energy_capacity()*ORGAN_ENERGY_MULTIPLIER
-        self._max_energy = tot
-        return tot
+        if self._debug_aggregates:
+            self.check_aggregates()
+        return 1 + self._organ_table.get_live_energy_capacity()*ORGAN_ENERGY_MULTIPLIER
+
+    def set_debug_aggregates(self, debug=True):
+        """
+        Turns on cross checking of the running health and energy totals for this creature
+        """
+        self._debug_aggregates = debug
+
+    def check_aggregates(self):
+        """
+        Recomputes overall health and energy capacity from every organ and compares them against the running totals
+        """
+        table = self._organ_table
+        capacity = table.recompute_live_energy_capacity()
+        health = table.recompute_average_health()
+        assert abs(capacity - table.get_live_energy_capacity()) <= AGGREGATE_TOLERANCE * max(1, abs(capacity)), \
+            f"Running energy capacity {table.get_live_energy_capacity()} does not match recomputed {capacity}"
+        assert abs(health - table.get_average_health()) <= AGGREGATE_TOLERANCE * max(1, abs(health)), \
+            f"Running health {table.get_average_health()} does not match recomputed {health}"
 
     def get_energy(self):
         """
@@ -111,7 +270,7 @@ class Body:
         """
         Returns the current energy as a percent of maximum
         """
-        return self._energy/self._max_energy
+        return self._energy/self.get_max_energy()
 
     def get_heading(self):
         """
@@ -130,6 +289,18 @@ class Body:
             total = 1
         self._concentrations = {chem: val/total for chem, val in self._chems.items()}
 
+    def get_chem_vector(self):
+        """
+        Returns the units of every chemical as an array, in the order of Chemicals.CHEMS
+        """
+        return np.fromiter(self._chems.values(), dtype=float, count=len(self._chems))
+
+    def get_concentration_vector(self):
+        """
+        Returns the concentration of every chemical as an array, in the order of Chemicals.CHEMS
+        """
+        return np.fromiter(self._concentrations.values(), dtype=float, count=len(self._concentrations))
+
     def get_concentration(self, chemical):
         """
         Try to get the chemical concentration of a particular chemical
@@ -175,6 +346,12 @@ class Body:
         Sets the dna linked list node for the body, is mostly noncoding
         """
         self._dna_head = node
+
+    def get_dna_head(self):
+        """
+        Returns the first node of the organisms dna linked list
+        """
+        return self._dna_head
         
     def get_genome(self):
         """
@@ -184,16 +361,55 @@ class Body:
             return self._genome
         return self._dna_head.get_entire_genome()
 
-    def take_action(self):
+    def get_packed_genome(self):
+        """
+        Returns the entire genome of the organism as a PackedGenome
+        """
+        if self._dna_head is None:
+            return PackedGenome.from_bits(self._genome)
+        return self._dna_head.get_entire_packed()
+
+    def get_id(self):
+        return self._id
+
+    def set_phenotype(self, template):
+        """
+        Sets the interned template the organism was copied from, keeping it alive while the organism is
+        """
+        self._phenotype = template
+
+    def get_phenotype(self):
+        return self._phenotype
+
+    def set_tables(self, tables):
+        """
+        Sets the phenotype tables the organism was built from, they stand in for the organs and brain when it is pickled
+        """
+        self._tables = tables
+
+    def get_tables(self):
+        return self._tables
+
+    def take_action(self, tick=None):
         """
         Calls the brain to decide on an action
+        :param tick: The current world tick, the brain caches its lobe outputs for the rest of the tick
         """
+        if tick is not None:
+            self._brain.set_tick(tick)
         return self._brain.decide_action()
+
+    def activate_food_chem_lobes(self, food):
+        """
+        Runs the brains food chem lobes on a food item, used by food lobes that see food
+        """
+        return self._brain.activate_food_chem_lobes(food)
     
     def eat_food(self, food):
         """
         Eats a passed food item, incorporating the chemicals and energy into its body
         """
+        self.wake()
         chems = food.get_chems()
         for chem in chems:
             self.add_chemical(chem, chems[chem].get_quantity())
@@ -204,7 +420,7 @@ class Body:
         """
         Adds an amount of energy to the organism
         """
-        self._energy = min(self._max_energy, self._energy + amount)
+        self._energy = min(self.get_max_energy(), self._energy + amount)
 
     def remove_energy(self, amount):
         """
@@ -237,25 +453,16 @@ class Body:
     
     def check_organ_health(self):
         """
-        Checks the health of each organ and modifies the overall health of the creature accordingly. Also rechecks max energy
+        Removes organs that died and updates the overall health of the creature accordingly. Max energy follows from the running totals of the organ table
         """
-        o_healths = 0
+        # Flip any organ that died out of the living mask, and only then rebuild the organ list
+        if self._organ_table.remove_dead():
+            self._organs = [organ for organ in self._organs if organ.is_alive()]
 
-        # Check the health for each organ
-        for organ in self._organs:
-            o_health = organ.get_health()
-            
-            # Remove the organ if it died
-            if o_health < HEALTH_DEATH_THRESHOLD:
-                self._organs.remove(organ)
-            
-            # Calculate the 'overall' health and add that to the running total
-            else:
-                o_healths += health_function(o_health)
-
-        # Overall creature health is the average of the running total
-        self._health = o_healths/len(self._organs)
-        self.get_max_energy()
+        # Overall creature health is the average of the 'overall' health of each living organ
+        self._health = self._organ_table.get_average_health()
+        if self._debug_aggregates:
+            self.check_aggregates()
 
     def get_health(self):
         """
@@ -268,6 +475,8 @@ class Body:
         Set the gridpoint this creature exists on, specifically, the Cell object
         :param cell: The Cell object the creature currently occupies
         """
+        if cell is not self._cell:
+            self.wake()
         self._cell = cell
         
     def get_food_at_space(self, space):
@@ -297,7 +506,7 @@ class Body:
         Gets a quick readout on the biological status of the organism.
         """
         print(f"Creature {self._id}:\n")
-        print(f"Energy -- {self._energy}/{self._max_energy} = {self.get_energy_percent}}")
+        print(f"Energy -- {self._energy}/{self.get_max_energy()} = {self.get_energy_percent()}")
         print(f"Health -- {self._health}")
         for chemical in Chemicals.CHEMS:
             print(f"Chemical {chemical} -- units: {self._chems[chemical]}, concentrations: {self._concentrations[chemical]}\n")
@@ -69,6 +69,15 @@ class BrainNode:
         weighted = [out*weight for weight in self._weights]
         return weighted
 
+    def get_bias(self):
+        return self._bias
+
+    def get_weights(self):
+        return self._weights
+
+    def get_function(self):
+        return self._function
+
 class Lobe:
     """
     Represents a collection of neurons
@@ -76,6 +85,7 @@ class Lobe:
     def __init__(self):
         self._hidden = []
         self._id = generate_id()
+        self._compiled = None
 
     def set_owner(self, owner):
         """
@@ -83,17 +93,32 @@ class Lobe:
         """
         self._owner = owner
 
+    def get_owner(self):
+        return self._owner
+
+    def get_id(self):
+        return self._id
+
     def set_dna_head(self, node):
         """
         Sets the dna linked list node that corresponds to this node
         """
         self._dna_head = node
 
+    def get_dna_head(self):
+        return self._dna_head
+
     def get_genome(self):
         """
         Gets the entire brain genome (from this point)
         """
         return self._dna_head.get_entire_genome()
+
+    def get_packed_genome(self):
+        """
+        Gets the entire brain genome (from this point) as a PackedGenome
+        """
+        return self._dna_head.get_entire_packed()
         
     def set_final_node(self, node):
         """
@@ -119,6 +144,21 @@ class Lobe:
         """
         self._hidden.append(nodes)
 
+    def get_hidden_layers(self):
+        """
+        Returns the hidden layers of BrainNodes
+        """
+        return self._hidden
+
+    def set_compiled(self, compiled):
+        """
+        Sets the compiled form of this lobes neural net, see CompiledBrain.py
+        """
+        self._compiled = compiled
+
+    def get_compiled(self):
+        return self._compiled
+
     def input_action(self, val = 1):
         """
         Generic input function for debugging.
@@ -131,9 +171,9 @@ class Lobe:
         """
         # If debug is a number, we pass that value as the input to each beginning node
         if debug is False:
-            inputs = [self.input_action() for i in range(self._width_layers)]
-        else:
-            inputs = [debug for i in range(self._width_layers)]
+            # The input is the same for every node, so it is only read once
+            debug = self.input_action()
+        inputs = [debug for i in range(self._width_layers)]
 
         # Iterate through each layer
         for i in range(self._num_layers):
@@ -152,6 +192,22 @@ class Lobe:
         # For a generic lobe, we only have 1 output, so we grab the topmost output.
         final_output = outputs[0]
         return final_output
+
+    def read_input(self):
+        """
+        Reads the input of the lobe for the compiled net. A pruned net may not depend on its input, then the sensor isn't read.
+        """
+        if self._compiled is not None and not self._compiled.needs_input():
+            return 0
+        return self.input_action()
+
+    def get_compiled_output(self, debug=False):
+        """
+        Gets the final output of the compiled neural net, the input is read once and given to every node of the first layer
+        """
+        if debug is False:
+            debug = self.read_input()
+        return self._compiled.forward(debug)[0]
     
     
 class ChemLobe(Lobe):
@@ -255,6 +311,19 @@ class Brain(Lobe):
         self._internal_lobes = []
         self._sensory_lobes = []
         self._genome = None
+        self._compiled = None
+        # Lobe outputs are cached for the current world tick
+        self._tick = None
+        self._cache_tick = None
+        self._cached_input = None
+        self._saved_evaluations = 0
+        # Set when the brain is pruned, see BrainPruning.py
+        self._live_lobes = None
+        self._prune_stats = None
+        # Optional cache of decisions, see DecisionCache.py
+        self._decision_cache = None
+        # Optional instrumentation, see BrainProfile.py
+        self._profiler = None
 
     def add_owner(self, owner):
         """
@@ -286,26 +355,133 @@ class Brain(Lobe):
         """
         return self._lobes
 
-    def input_action(self, val=None):
+    def get_input_lobes(self):
         """
-        Gets the outputs of each lobe contained in the brain and sums them. This becomes the input for the brains learnable NN
+        Returns the lobes whose outputs are summed into the brains input, in the order they are added
+        """
+        return self._internal_lobes + self._sensory_lobes
+
+    def set_live_lobes(self, lobes):
+        """
+        Sets the lobes that can affect the chosen action, only these are run by the compiled nets
+        """
+        self._live_lobes = lobes
+
+    def get_live_lobes(self):
+        """
+        Returns the lobes run by the compiled nets
+        """
+        if self._live_lobes is None:
+            return self.get_input_lobes()
+        return self._live_lobes
+
+    def set_prune_stats(self, stats):
+        self._prune_stats = stats
+
+    def get_prune_stats(self):
+        """
+        Returns the counts of pruned nodes, weights and lobes, or None if the brain was not pruned
+        """
+        return self._prune_stats
+
+    def set_profiler(self, profiler):
+        """
+        Sets a BrainProfiler to record every lobe evaluation and decision, or None to stop profiling
+        """
+        self._profiler = profiler
+
+    def get_profiler(self):
+        return self._profiler
+
+    def run_lobe(self, lobe, compiled=False, val=False):
+        """
+        Gets the output of one lobe, through the profiler if one is set
+        :param compiled: If True the lobes compiled net is used
+        :param val: The input of the lobe, read from the lobe if not given
+        """
+        if self._profiler is not None:
+            return self._profiler.run_lobe(lobe, compiled, val)
+        return lobe.get_compiled_output(val) if compiled else lobe.get_output(val)
+
+    def set_decision_cache(self, cache):
         """
+        Sets a DecisionCache for decide_action to use, or None to turn it off
+        """
+        self._decision_cache = cache
+
+    def get_decision_cache(self):
+        return self._decision_cache
+
+    def set_tick(self, tick):
+        """
+        Sets the current world tick. The summed lobe outputs are cached until the tick changes, so the lobes only run once per tick however many times the brain is read.
+        :param tick: The tick number, or None to turn off caching between calls
+        """
+        self._tick = tick
+
+    def get_tick(self):
+        return self._tick
+
+    def get_tick_state(self):
+        """
+        Returns the current tick, the cached lobe total and the count of saved evaluations, for pickling the owner compactly
+        """
+        return (self._tick, self._cache_tick, self._cached_input, self._saved_evaluations)
+
+    def set_tick_state(self, state):
+        """
+        Restores the tick and cached lobe total saved by get_tick_state
+        """
+        self._tick, self._cache_tick, self._cached_input, self._saved_evaluations = state
+
+    def get_saved_evaluations(self):
+        """
+        Returns the number of lobe evaluations avoided by reading the lobes once per decision and caching them per tick
+        """
+        return self._saved_evaluations
+
+    def activate_food_chem_lobes(self, food):
+        """
+        Runs every food chem lobe on a food item and sums their outputs
+        """
+        total = 0
+        for lobe in self._food_chem_lobes:
+            total += self.run_lobe(lobe, False, lobe.input_action(food))
+        return total
+
+    def sum_lobes(self, compiled=False):
+        """
+        Sums the outputs of the internal and sensory lobes, using the cached total if it was already found this tick
+        :param compiled: If True, the lobes are run through their compiled nets
+        """
+        lobes = self.get_live_lobes() if compiled else self.get_input_lobes()
+        if self._tick is not None and self._cache_tick == self._tick:
+            self._saved_evaluations += len(lobes)
+            return self._cached_input
         total = 0
-        for lobe in self._internal_lobes:
-            total += lobe.get_output()
-        for lobe in self._sensory_lobes:
-            total += lobe.get_output()
+        for lobe in lobes:
+            total += self.run_lobe(lobe, compiled)
+        if self._tick is not None:
+            self._cache_tick = self._tick
+            self._cached_input = total
         return total
 
+    def input_action(self, val=None):
+        """
+        Gets the outputs of each lobe contained in the brain and sums them. This becomes the input for the brains learnable NN
+        """
+        return self.sum_lobes()
+
     def get_output(self, debug = False):
         """
         Gets the final outputs of the brains learnable NN
         """
         # Get the total output from each lobe and apply that to the first layer
         if debug is False:
-            inputs = [self.input_action() for i in range(self._width_layers)]
-        else:
-            inputs = [debug for i in range(self._width_layers)]
+            # Every node of the first layer gets the same total, so the lobes are run once instead of once per node
+            debug = self.input_action()
+            self._saved_evaluations += (self._width_layers-1) * (len(self._internal_lobes) + len(self._sensory_lobes))
+        inputs = [debug for i in range(self._width_layers)]
         # Carry the input forward and find the outputs
         for i in range(self._num_layers):
             outputs = [0 for _ in range(self._width_layers)]
@@ -317,13 +493,68 @@ class Brain(Lobe):
             inputs = outputs
         return inputs
 
+    def compiled_input_action(self):
+        """
+        Same as input_action, but each lobe is run through its compiled net
+        """
+        return self.sum_lobes(compiled=True)
+
+    def get_compiled_output(self, debug=False):
+        """
+        Gets the final outputs of the brains compiled neural net
+        """
+        if debug is False:
+            debug = self.compiled_input_action() if self._compiled.needs_input() else 0
+        return self._compiled.forward(debug)
+
     def decide_action(self):
         """
         Gets the output of the neural net, and returns the index of the highest rated action. This index corresponds to the action to take.
+        Uses the compiled nets when the brain has been compiled, and the decision cache when one is set.
+        """
+        if self._profiler is not None:
+            start = self._profiler.start_decision()
+            action = self.choose_action()
+            self._profiler.record_decision(action, start)
+            return action
+        return self.choose_action()
+
+    def choose_action(self):
+        """
+        Runs the nets, or the decision cache, to pick an action
         """
+        if self._decision_cache is not None:
+            return self.decide_cached_action()
+        if self._compiled is not None:
+            outs = self.get_compiled_output()[:4]
+            return int(np.argmax(outs))
         outs = self.get_output()[:4]
         return outs.index(max(outs))
 
+    def decide_cached_action(self):
+        """
+        Reads the input of each lobe and looks the inputs up in the decision cache, only running the nets on a miss
+        """
+        compiled = self._compiled is not None
+        lobes = self.get_live_lobes() if compiled else self.get_input_lobes()
+        inputs = [lobe.read_input() for lobe in lobes]
+        key = self._decision_cache.make_key(inputs)
+        action = self._decision_cache.get(key)
+        if action is not None:
+            return action
+
+        # Same sums as sum_lobes, from the inputs already read
+        total = 0
+        for lobe, val in zip(lobes, inputs):
+            total += self.run_lobe(lobe, compiled, val)
+        if compiled:
+            action = int(np.argmax(self.get_compiled_output(total)[:4]))
+        else:
+            outs = self.get_output(total)[:4]
+            action = outs.index(max(outs))
+        self._decision_cache.put(key, action)
+        return action
+
     def describe(self):
         s1 = f"Brain {self._id}:\n"
         s2 = f"\t This brain has Width: {self._width_layers}, Layers: {self._num_layers}\n"
@@ -341,7 +572,8 @@ def relu(input):
     return max(0, input)
 
 def sigmoid(input):
-    return 1 / (1+(np.e**-input))
+    # np.power rather than ** so scalars and the arrays of the compiled nets round the same way
+    return 1 / (1+np.power(np.e, -input))
 
 def tanh(input):
     return 2 * sigmoid(2*input) - 1
@@ -0,0 +1,147 @@
+"""
+Runs the brains of a whole population at once. Lobes and brains only come in a few dozen shapes, so every net is put into a bucket by its shape, the weights in a bucket are stacked into arrays, and each bucket is evaluated with one batched call per tick.
+The results are exactly those of Brain.decide_action for each brain, see CompiledBrain.py.
+"""
+import numpy as np
+from CompiledBrain import forward_batch, compile_brain, QuantizedNet, WEIGHT_SCALE
+
+class ShapeBucket:
+    """
+    All the compiled nets of one shape, stacked into (nets, layers, width, width) arrays
+    """
+    def __init__(self, nets, indices, quantized=False):
+        """
+        :param nets: The CompiledNets in this bucket
+        :param indices: For each net, where its result goes in the engines output array
+        :param quantized: If True the weights are stacked as int8 numerators, see QuantizedNet
+        """
+        if quantized:
+            self._weights = np.stack([np.array(QuantizedNet.from_compiled(net).get_numerators()) for net in nets])
+            self._scale = WEIGHT_SCALE
+        else:
+            self._weights = np.stack([np.array(net.get_weights()) for net in nets])
+            self._scale = None
+        self._biases = np.stack([np.array(net.get_biases()) for net in nets])
+        self._codes = np.stack([np.array(net.get_codes()) for net in nets])
+        self._indices = np.array(indices, dtype=np.intp)
+
+    def get_indices(self):
+        return self._indices
+
+    def get_size(self):
+        return len(self._indices)
+
+    def get_nbytes(self):
+        """
+        Returns the memory used by the stacked arrays
+        """
+        return self._weights.nbytes + self._biases.nbytes + self._codes.nbytes
+
+    def forward(self, values):
+        """
+        Runs every net in the bucket, each with its own input value
+        :return: (nets, width) array of outputs
+        """
+        return forward_batch(self._weights, self._biases, self._codes, values, self._scale)
+
+
+class PopulationBrainEngine:
+    """
+    Decides the actions of a list of brains in batches grouped by net shape. Call set_brains again whenever the population changes.
+    """
+    def __init__(self, brains=None, quantized=False):
+        """
+        :param brains: The brains of the population
+        :param quantized: If True the weights are stored as int8 numerators, which gives the same actions with an eighth of the weight memory
+        """
+        self._quantized = quantized
+        self.set_brains(brains if brains is not None else [])
+
+    def set_brains(self, brains):
+        """
+        Buckets the lobes and brains of a population by (type, layers, width) and stacks their weights
+        """
+        self._brains = list(brains)
+        self._lobes = []
+        brain_lobes = []
+        lobe_groups = {}
+        brain_groups = {}
+        for b, brain in enumerate(self._brains):
+            if brain.get_compiled() is None:
+                compile_brain(brain)
+            positions = []
+            for lobe in brain.get_input_lobes():
+                net = lobe.get_compiled()
+                key = (type(lobe).__name__, net.get_num_layers(), net.get_width())
+                lobe_groups.setdefault(key, []).append((net, len(self._lobes)))
+                positions.append(len(self._lobes))
+                self._lobes.append(lobe)
+            brain_lobes.append(positions)
+            net = brain.get_compiled()
+            brain_groups.setdefault((net.get_num_layers(), net.get_width()), []).append((net, b))
+
+        self._lobe_buckets = {key: ShapeBucket([net for net, i in group], [i for net, i in group], self._quantized) for key, group in lobe_groups.items()}
+        self._brain_buckets = {key: ShapeBucket([net for net, i in group], [i for net, i in group], self._quantized) for key, group in brain_groups.items()}
+
+        # Each column lists the lobes of one brain in order, padded with a slot that always holds 0
+        most = max([len(positions) for positions in brain_lobes], default=0)
+        self._lobe_index = np.full((most, len(self._brains)), len(self._lobes), dtype=np.intp)
+        for b, positions in enumerate(brain_lobes):
+            self._lobe_index[:len(positions), b] = positions
+
+    def get_bucket_shapes(self):
+        """
+        Returns the number of nets in each lobe and brain bucket, keyed by shape
+        """
+        shapes = {('lobe',) + key: bucket.get_size() for key, bucket in self._lobe_buckets.items()}
+        shapes.update({('brain',) + key: bucket.get_size() for key, bucket in self._brain_buckets.items()})
+        return shapes
+
+    def get_nbytes(self):
+        """
+        Returns the memory used by every bucket
+        """
+        return sum(bucket.get_nbytes() for buckets in (self._lobe_buckets, self._brain_buckets) for bucket in buckets.values())
+
+    def get_lobe_outputs(self, inputs=None):
+        """
+        Runs every lobe in the population
+        :param inputs: Optional array with one input per lobe, read from each lobes input_action if not given
+        :return: Array with one output per lobe, plus a trailing 0 used for padding
+        """
+        if inputs is None:
+            inputs = np.array([lobe.input_action() for lobe in self._lobes], dtype=float)
+        outputs = np.zeros(len(self._lobes) + 1)
+        for bucket in self._lobe_buckets.values():
+            indices = bucket.get_indices()
+            outputs[indices] = bucket.forward(inputs[indices])[:, 0]
+        return outputs
+
+    def get_outputs(self, inputs=None):
+        """
+        Runs every brain in the population
+        :param inputs: Optional array with one input per lobe
+        :return: A list with the output array of each brain, in the same order as the brains
+        """
+        lobe_outputs = self.get_lobe_outputs(inputs)
+        # Sum down the columns so each brain adds its lobes one after another, as Brain.input_action does
+        totals = lobe_outputs[self._lobe_index].sum(axis=0) if len(self._lobe_index) else np.zeros(len(self._brains))
+        outputs = [None] * len(self._brains)
+        for bucket in self._brain_buckets.values():
+            indices = bucket.get_indices()
+            for b, out in zip(indices, bucket.forward(totals[indices])):
+                outputs[b] = out
+        return outputs
+
+    def decide_actions(self, inputs=None):
+        """
+        Decides an action for every brain in the population
+        :return: A list of action indices in the same order as the brains
+        """
+        lobe_outputs = self.get_lobe_outputs(inputs)
+        totals = lobe_outputs[self._lobe_index].sum(axis=0) if len(self._lobe_index) else np.zeros(len(self._brains))
+        actions = np.zeros(len(self._brains), dtype=np.intp)
+        for bucket in self._brain_buckets.values():
+            indices = bucket.get_indices()
+            actions[indices] = np.argmax(bucket.forward(totals[indices])[:, :4], axis=1)
+        return actions.tolist()
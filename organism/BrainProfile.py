@@ -0,0 +1,143 @@
+"""
+Optional instrumentation for brains. A BrainProfiler set on a brain counts every lobe evaluation by lobe type, with the time it took and histograms of the inputs and outputs, and counts how often the chosen action changes. Everything is kept in arrays allocated up front so profiling adds no allocations per tick.
+Lobe times include reading the sensor, and a FoodLobes time includes the FoodChemLobes it runs.
+"""
+import time
+import numpy as np
+
+LOBE_TYPES = ['ChemLobe', 'FoodLobe', 'FoodChemLobe', 'EnergyLobe']
+LOBE_INDEX = {name: i for i, name in enumerate(LOBE_TYPES)}
+NUM_ACTIONS = 4
+# Values outside the range are counted in the end bins
+HISTOGRAM_BINS = 32
+HISTOGRAM_LOW = -4
+HISTOGRAM_HIGH = 4
+
+class BrainProfiler:
+    """
+    Evaluation counts, times and histograms for one brain, or for a population when profilers are added together
+    """
+    def __init__(self, bins=HISTOGRAM_BINS, low=HISTOGRAM_LOW, high=HISTOGRAM_HIGH):
+        """
+        :param bins: The number of histogram bins
+        :param low: The lower edge of the first bin
+        :param high: The upper edge of the last bin
+        """
+        self._bins = bins
+        self._low = low
+        self._high = high
+        self._bin_width = (high-low)/bins
+        self._evaluations = np.zeros(len(LOBE_TYPES), dtype=np.int64)
+        self._times = np.zeros(len(LOBE_TYPES))
+        self._inputs = np.zeros((len(LOBE_TYPES), bins), dtype=np.int64)
+        self._outputs = np.zeros((len(LOBE_TYPES), bins), dtype=np.int64)
+        self._actions = np.zeros(NUM_ACTIONS, dtype=np.int64)
+        self._decisions = 0
+        self._action_changes = 0
+        self._decision_time = 0
+        self._last_action = None
+
+    def get_bin(self, val):
+        """
+        Gets the histogram bin of a value
+        """
+        pos = int((val - self._low) / self._bin_width) if val == val else 0
+        return min(max(pos, 0), self._bins-1)
+
+    def run_lobe(self, lobe, compiled=False, val=False):
+        """
+        Runs a lobe and records the evaluation
+        :param compiled: If True the lobes compiled net is used
+        :param val: The input of the lobe, read from the lobe if not given
+        :return: The output of the lobe
+        """
+        start = time.perf_counter()
+        if val is False:
+            val = lobe.read_input() if compiled else lobe.input_action()
+        out = lobe.get_compiled_output(val) if compiled else lobe.get_output(val)
+        kind = LOBE_INDEX[type(lobe).__name__]
+        self._times[kind] += time.perf_counter() - start
+        self._evaluations[kind] += 1
+        self._inputs[kind, self.get_bin(val)] += 1
+        self._outputs[kind, self.get_bin(out)] += 1
+        return out
+
+    def start_decision(self):
+        """
+        Returns the start time of a decision
+        """
+        return time.perf_counter()
+
+    def record_decision(self, action, start):
+        """
+        Records the action chosen and whether it changed from the last decision
+        :param start: The time from start_decision
+        """
+        self._decision_time += time.perf_counter() - start
+        self._decisions += 1
+        self._actions[action] += 1
+        if self._last_action is not None and action != self._last_action:
+            self._action_changes += 1
+        self._last_action = action
+
+    def add(self, other):
+        """
+        Adds the counts of another profiler to this one, the histograms must have the same bins
+        """
+        self._evaluations += other._evaluations
+        self._times += other._times
+        self._inputs += other._inputs
+        self._outputs += other._outputs
+        self._actions += other._actions
+        self._decisions += other._decisions
+        self._action_changes += other._action_changes
+        self._decision_time += other._decision_time
+
+    def reset(self):
+        """
+        Zeros every count, keeping the arrays
+        """
+        for array in (self._evaluations, self._times, self._inputs, self._outputs, self._actions):
+            array[:] = 0
+        self._decisions = 0
+        self._action_changes = 0
+        self._decision_time = 0
+        self._last_action = None
+
+    def get_bin_edges(self):
+        return np.linspace(self._low, self._high, self._bins+1)
+
+    def get_stats(self):
+        """
+        Exports the profile as a dict, with one entry per lobe type
+        """
+        stats = {'decisions': self._decisions,
+                 'action changes': self._action_changes,
+                 'action change fraction': self._action_changes/max(self._decisions-1, 1),
+                 'action counts': self._actions.copy(),
+                 'decision time': self._decision_time,
+                 'bin edges': self.get_bin_edges(),
+                 'lobes': {}}
+        for i, name in enumerate(LOBE_TYPES):
+            stats['lobes'][name] = {'evaluations': int(self._evaluations[i]),
+                                    'time': self._times[i],
+                                    'mean time': self._times[i]/max(self._evaluations[i], 1),
+                                    'input histogram': self._inputs[i].copy(),
+                                    'output histogram': self._outputs[i].copy()}
+        return stats
+
+
+def aggregate_profiles(organisms):
+    """
+    Adds up the profiles of a population, organisms without a profiler are skipped
+    :return: A BrainProfiler holding the totals
+    """
+    total = None
+    for organism in organisms:
+        profiler = organism.get_brain().get_profiler()
+        if profiler is None:
+            continue
+        if total is None:
+            total = BrainProfiler(profiler._bins, profiler._low, profiler._high)
+        total.add(profiler)
+    return total if total is not None else BrainProfiler()
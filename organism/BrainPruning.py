@@ -0,0 +1,197 @@
+"""
+Prunes the compiled nets of a brain after it is decoded. The range of values each lobe can read is pushed through its net as intervals, which finds relu nodes that can never fire. Those nodes, nodes whose weights into the next layer are all zero, and lobes whose output is always zero are dropped, and the nodes left over are stored as smaller dense matrices.
+Only terms that are always exactly zero are removed and the rest are summed in the same order, so decide_action gives exactly the same action as the full nets.
+"""
+import numpy as np
+from CompiledBrain import CompiledNet, activate, compile_brain, RELU, TANH, SIGMOID
+from Brain import ChemLobe, EnergyLobe, sigmoid, tanh
+
+# The range of inputs each type of lobe can read, lobes not listed here are unbounded
+INPUT_RANGES = {ChemLobe: (0, 1), EnergyLobe: (0, np.inf)}
+UNBOUNDED = (-np.inf, np.inf)
+# Intervals are widened by this relative amount at every layer to cover rounding
+INTERVAL_SLACK = 1e-9
+# Only the first outputs of the brain are used to pick an action, and only the first of a lobe is used at all
+ACTION_OUTPUTS = 4
+LOBE_OUTPUTS = 1
+# Prune every brain the decoder reads
+PRUNE = False
+
+def widen(lo, hi):
+    """
+    Widens an interval slightly so that rounding can't make it smaller than the true range
+    """
+    return lo - INTERVAL_SLACK * (1 + np.abs(lo)), hi + INTERVAL_SLACK * (1 + np.abs(hi))
+
+def activation_interval(lo, hi, codes):
+    """
+    Gets the range of outputs of each node given the range of its inputs, every activation function is increasing
+    """
+    out_lo = lo.copy()
+    out_hi = hi.copy()
+    relus = codes == RELU
+    out_lo[relus] = np.maximum(lo[relus], 0)
+    out_hi[relus] = np.maximum(hi[relus], 0)
+    with np.errstate(over='ignore'):
+        for code, function in ((SIGMOID, sigmoid), (TANH, tanh)):
+            nodes = codes == code
+            out_lo[nodes] = function(lo[nodes])
+            out_hi[nodes] = function(hi[nodes])
+    return out_lo, out_hi
+
+def weighted_interval(lo, hi, weights):
+    """
+    Gets the range of the inputs to the next layer, a zero weight adds nothing even from an unbounded node
+    """
+    with np.errstate(invalid='ignore'):
+        low = np.where(weights > 0, lo[:, None] * weights, np.where(weights < 0, hi[:, None] * weights, 0))
+        high = np.where(weights > 0, hi[:, None] * weights, np.where(weights < 0, lo[:, None] * weights, 0))
+    return low.sum(axis=0), high.sum(axis=0)
+
+def analyse_net(net, lo, hi, outputs):
+    """
+    Finds the nodes of a compiled net that can change its used outputs
+    :param net: A CompiledNet
+    :param lo: The lowest input given to the first layer
+    :param hi: The highest input given to the first layer
+    :param outputs: The indices of the last layer outputs that are used
+    :return: A list with a boolean array of live nodes for each layer, and the lowest and highest value of each used output
+    """
+    weights = net.get_weights()
+    biases = net.get_biases()
+    codes = net.get_codes()
+    lo = np.full(net.get_width(), lo, dtype=float)
+    hi = np.full(net.get_width(), hi, dtype=float)
+
+    # Forward, a relu that can't see a positive input always outputs exactly 0
+    firing = []
+    for i in range(net.get_num_layers()):
+        in_lo, in_hi = widen(lo + biases[i], hi + biases[i])
+        alive = ~((codes[i] == RELU) & (in_hi <= 0))
+        out_lo, out_hi = activation_interval(in_lo, in_hi, codes[i])
+        out_lo[~alive] = 0
+        out_hi[~alive] = 0
+        lo, hi = weighted_interval(out_lo, out_hi, weights[i])
+        firing.append(alive)
+
+    # Backward, a node is only needed if it has a non zero weight into a needed node
+    needed = np.zeros(net.get_width(), dtype=bool)
+    needed[outputs] = True
+    live = [None] * net.get_num_layers()
+    for i in reversed(range(net.get_num_layers())):
+        live[i] = firing[i] & (weights[i][:, needed] != 0).any(axis=1)
+        needed = live[i]
+    out_lo, out_hi = widen(lo[outputs], hi[outputs])
+    return live, out_lo, out_hi
+
+
+class SparseNet(CompiledNet):
+    """
+    A compiled net with its dead nodes removed. The full arrays are still kept so the net can be batched with others of the same shape.
+    """
+    def __init__(self, net, live, outputs):
+        """
+        :param net: The CompiledNet being pruned
+        :param live: A boolean array of live nodes for each layer, from analyse_net
+        :param outputs: The indices of the last layer outputs that are used
+        """
+        super().__init__(net.get_weights(), net.get_biases(), net.get_codes())
+        self._nodes = [np.flatnonzero(nodes) for nodes in live]
+        self._outputs = np.array(outputs, dtype=np.intp)
+        self._layers = []
+        for i, nodes in enumerate(self._nodes):
+            following = self._nodes[i+1] if i+1 < len(self._nodes) else self._outputs
+            self._layers.append((self._biases[i][nodes], self._codes[i][nodes], self._weights[i][np.ix_(nodes, following)]))
+
+    def needs_input(self):
+        """
+        A net with no live node in its first layer gives the same output for any input
+        """
+        return len(self._nodes[0]) > 0
+
+    def get_live_nodes(self):
+        return sum(len(nodes) for nodes in self._nodes)
+
+    def get_live_weights(self):
+        return sum(weights.size for biases, codes, weights in self._layers)
+
+    def forward(self, value):
+        """
+        Runs the live nodes of the net. Outputs that are not used are left at 0.
+        """
+        inputs = np.full(len(self._nodes[0]), value, dtype=float)
+        for biases, codes, weights in self._layers:
+            out = activate(inputs + biases, codes)
+            inputs = (out[:, None] * weights).sum(axis=0)
+        outputs = np.zeros(self.get_width())
+        outputs[self._outputs] = inputs
+        return outputs
+
+
+def prune_brain(brain):
+    """
+    Replaces the compiled nets of a brain and its lobes with pruned ones, and drops lobes that can't affect the chosen action
+    :return: A dict of how many nodes, weights and lobes were pruned
+    """
+    if brain.get_compiled() is None:
+        compile_brain(brain)
+    nodes = 0
+    weights = 0
+    kept_nodes = 0
+    kept_weights = 0
+    live_lobes = []
+    total_lo = 0
+    total_hi = 0
+    lobes = brain.get_input_lobes()
+    for lobe in lobes:
+        net = lobe.get_compiled()
+        lo, hi = INPUT_RANGES.get(type(lobe), UNBOUNDED)
+        live, out_lo, out_hi = analyse_net(net, lo, hi, list(range(LOBE_OUTPUTS)))
+        sparse = SparseNet(net, live, list(range(LOBE_OUTPUTS)))
+        lobe.set_compiled(sparse)
+        nodes += net.get_num_layers() * net.get_width()
+        weights += net.get_num_layers() * net.get_width()**2
+        # A lobe with no live node in its last layer always outputs 0
+        if live[-1].any():
+            live_lobes.append(lobe)
+            kept_nodes += sparse.get_live_nodes()
+            kept_weights += sparse.get_live_weights()
+            total_lo += out_lo[0]
+            total_hi += out_hi[0]
+
+    net = brain.get_compiled()
+    outputs = list(range(min(ACTION_OUTPUTS, net.get_width())))
+    live, out_lo, out_hi = analyse_net(net, *widen(total_lo, total_hi), outputs)
+    sparse = SparseNet(net, live, outputs)
+    brain.set_compiled(sparse)
+    if not sparse.needs_input():
+        # The action doesn't depend on the lobes at all
+        live_lobes = []
+        kept_nodes = 0
+        kept_weights = 0
+    brain.set_live_lobes(live_lobes)
+    nodes += net.get_num_layers() * net.get_width()
+    weights += net.get_num_layers() * net.get_width()**2
+    kept_nodes += sparse.get_live_nodes()
+    kept_weights += sparse.get_live_weights()
+
+    stats = {'nodes': nodes,
+             'pruned nodes': nodes - kept_nodes,
+             'weights': weights,
+             'pruned weights': weights - kept_weights,
+             'lobes': len(lobes),
+             'pruned lobes': len(lobes) - len(live_lobes),
+             'pruned fraction': 1 - kept_weights/weights}
+    brain.set_prune_stats(stats)
+    return stats
+
+
+def pruned_fractions(organisms):
+    """
+    Gets the fraction of weights pruned from each organisms brain, None for brains that were not pruned
+    """
+    fractions = []
+    for organism in organisms:
+        stats = organism.get_brain().get_prune_stats()
+        fractions.append(None if stats is None else stats['pruned fraction'])
+    return fractions
@@ -0,0 +1,194 @@
+"""
+Compiles the neural nets of lobes and brains into numpy arrays once they are decoded. Each layer becomes a weight matrix, a bias vector, and an activation code per node, so a forward pass is a handful of array operations instead of a python loop over every BrainNode.
+Layer outputs are summed node by node in the same order as the object graph, and the activations use the same numpy functions, so the compiled nets give exactly the same outputs.
+"""
+import numpy as np
+from Brain import linr, relu, tanh, sigmoid
+
+# Activation codes, in the order the decoder reads them from the genome
+LINR = 0
+RELU = 1
+TANH = 2
+SIGMOID = 3
+FUNCTION_CODES = {linr: LINR, relu: RELU, tanh: TANH, sigmoid: SIGMOID}
+
+# Weights are read from 6 bit genome fields as (val-31)/32, so every weight is a small integer over 32
+WEIGHT_SCALE = 1/32
+WEIGHT_DENOMINATOR = 32
+# Compile brains into QuantizedNets instead of float nets
+QUANTIZED = False
+
+def activate(values, codes):
+    """
+    Applies each nodes activation function to its input
+    :param values: Array of node inputs (bias already added), the last axis is the node
+    :param codes: Array of activation codes with the same shape as values
+    """
+    out = values.copy()
+    relus = codes == RELU
+    if relus.any():
+        out[relus] = np.where(values[relus] > 0, values[relus], 0)
+    with np.errstate(over='ignore'):
+        tanhs = codes == TANH
+        if tanhs.any():
+            out[tanhs] = tanh(values[tanhs])
+        sigmoids = codes == SIGMOID
+        if sigmoids.any():
+            out[sigmoids] = sigmoid(values[sigmoids])
+    return out
+
+class CompiledNet:
+    """
+    A lobe or brain neural net stored as arrays. weights[i][j, q] is the weight from node j of layer i to output q.
+    """
+    def __init__(self, weights, biases, codes):
+        """
+        :param weights: List of (width, width) arrays, one per layer
+        :param biases: List of width arrays, one per layer
+        :param codes: List of width arrays of activation codes, one per layer
+        """
+        self._weights = weights
+        self._biases = biases
+        self._codes = codes
+
+    @classmethod
+    def from_layers(cls, layers):
+        """
+        Builds the compiled net from the hidden layers of BrainNodes of a lobe or brain
+        """
+        weights = []
+        biases = []
+        codes = []
+        for layer in layers:
+            weights.append(np.array([node.get_weights() for node in layer], dtype=float))
+            biases.append(np.array([node.get_bias() for node in layer], dtype=float))
+            codes.append(np.array([FUNCTION_CODES[node.get_function()] for node in layer], dtype=np.int8))
+        return cls(weights, biases, codes)
+
+    def get_num_layers(self):
+        return len(self._weights)
+
+    def get_width(self):
+        return len(self._biases[0]) if self._biases else 0
+
+    def get_weights(self):
+        return self._weights
+
+    def get_biases(self):
+        return self._biases
+
+    def get_codes(self):
+        return self._codes
+
+    def needs_input(self):
+        """
+        Whether the output depends on the input, only pruned nets can tell that it doesn't
+        """
+        return True
+
+    def get_nbytes(self):
+        """
+        Returns the memory used by the arrays of the net
+        """
+        return sum(array.nbytes for arrays in (self._weights, self._biases, self._codes) for array in arrays)
+
+    def forward(self, value):
+        """
+        Runs the net with every node of the first layer given the same input, as the lobes and the brain do
+        :return: Array of the outputs of the last layer
+        """
+        inputs = np.full(self.get_width(), value, dtype=float)
+        for weights, biases, codes in zip(self._weights, self._biases, self._codes):
+            out = activate(inputs + biases, codes)
+            inputs = (out[:, None] * weights).sum(axis=0)
+        return inputs
+
+
+class QuantizedNet(CompiledNet):
+    """
+    A compiled net whose weights are stored as int8 numerators of WEIGHT_SCALE. Scaling by a power of two is exact in floating point, so summing the products with the numerators and scaling afterwards gives exactly the same outputs as the float weights, at an eighth of the memory.
+    """
+    def __init__(self, numerators, biases, codes):
+        """
+        :param numerators: List of (width, width) int8 arrays, one per layer
+        :param biases: List of width arrays, one per layer
+        :param codes: List of width arrays of activation codes, one per layer
+        """
+        super().__init__(numerators, biases, codes)
+
+    @classmethod
+    def from_compiled(cls, net):
+        """
+        Quantizes a CompiledNet, raises a ValueError if a weight is not a whole number of 32nds
+        """
+        if isinstance(net, QuantizedNet):
+            return net
+        numerators = []
+        for weights in net.get_weights():
+            scaled = weights * WEIGHT_DENOMINATOR
+            if not np.array_equal(scaled, np.rint(scaled)) or np.abs(scaled).max(initial=0) > 127:
+                raise ValueError("Weights can not be stored as int8 numerators")
+            numerators.append(scaled.astype(np.int8))
+        return cls(numerators, net.get_biases(), net.get_codes())
+
+    def get_numerators(self):
+        return self._weights
+
+    def get_weights(self):
+        """
+        Returns the weights as floats
+        """
+        return [numerators * WEIGHT_SCALE for numerators in self._weights]
+
+    def forward(self, value):
+        """
+        Runs the net with every node of the first layer given the same input, as the lobes and the brain do
+        :return: Array of the outputs of the last layer
+        """
+        inputs = np.full(self.get_width(), value, dtype=float)
+        for numerators, biases, codes in zip(self._weights, self._biases, self._codes):
+            out = activate(inputs + biases, codes)
+            inputs = (out[:, None] * numerators).sum(axis=0) * WEIGHT_SCALE
+        return inputs
+
+
+def forward_batch(weights, biases, codes, values, scale=None):
+    """
+    Runs many nets of the same shape at once
+    :param weights: (nets, layers, width, width) array, or int8 numerators if scale is given
+    :param biases: (nets, layers, width) array
+    :param codes: (nets, layers, width) array of activation codes
+    :param values: (nets,) array, the input given to every node of the first layer of each net
+    :param scale: The scale of quantized weights, None for float weights
+    :return: (nets, width) array of the outputs of the last layer
+    """
+    inputs = np.repeat(np.asarray(values, dtype=float)[:, None], weights.shape[2], axis=1)
+    for i in range(weights.shape[1]):
+        out = activate(inputs + biases[:, i], codes[:, i])
+        inputs = (out[:, :, None] * weights[:, i]).sum(axis=1)
+        if scale is not None:
+            inputs *= scale
+    return inputs
+
+
+def compile_net(layers, quantized=False):
+    """
+    Compiles the hidden layers of a lobe or brain
+    :param quantized: If True the net is a QuantizedNet
+    """
+    net = CompiledNet.from_layers(layers)
+    if quantized:
+        net = QuantizedNet.from_compiled(net)
+    return net
+
+
+def compile_brain(brain, quantized=None):
+    """
+    Compiles a brain and each of its lobes, storing the compiled nets on them
+    :param quantized: If True the nets store quantized weights, defaults to QUANTIZED
+    """
+    if quantized is None:
+        quantized = QUANTIZED
+    for lobe in brain.get_lobes():
+        lobe.set_compiled(compile_net(lobe.get_hidden_layers(), quantized))
+    brain.set_compiled(compile_net(brain.get_hidden_layers(), quantized))
@@ -6,6 +6,13 @@ from Chemicals import *
 from Genome import *
 from utilities import *
 from Brain import *
+from CompiledBrain import compile_brain
+import BrainPruning
+import GenomeIntern
+from FrameScan import FrameScan
+import Phenotype
+import numpy as np
+from bisect import bisect_right
 
 GENE_READ_LENGTH = 4
 GENE_TYPES = 3
@@ -20,7 +27,68 @@ ENERGY_UPPER_LIMIT = 60
 LOBE_LOWER_LIMIT = 20
 LOBE_UPPER_LIMIT = 140
 NORMAL_READ_LENGTH = 8 # used to be 5
+# Fields are read out of a window of this many bits, so a read doesn't shift the whole genome
+WINDOW_BITS = 256
+# Pre-scan genomes this long or longer for start codes, so noncoding frames are skipped instead of read. Only pays off when long runs of frames start nothing.
+PRESCAN = False
+PRESCAN_MIN_LENGTH = 1000
 ENERGY_AMOUNT = 1
+# The current gene of a reaction started too close to the end of the genome to be read
+ORPHAN_GENE = -1
+# What an 8 bit frame can start, as bit flags since a frame is several kinds at once if the ranges overlap
+GENE_START = 1
+ORGAN_START = 2
+ENERGY_FRAME = 4
+LOBE_START = 8
+BODY_KINDS = (GENE_START, ORGAN_START, ENERGY_FRAME)
+BRAIN_KINDS = (LOBE_START,)
+_opcode_tables = {}
+
+def merge_ranges(ranges):
+    """
+    Sorts (start, end) bit ranges and merges the ones that overlap or touch
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(span) for span in merged]
+
+def opcode_ranges():
+    """
+    The range of frame values for each kind of frame. Read from the limits each time, so they can be changed while experimenting.
+    """
+    return {GENE_START: (GENE_LOWER_LIMIT, GENE_UPPER_LIMIT),
+            ORGAN_START: (ORGAN_LOWER_LIMIT, ORGAN_UPPER_LIMIT),
+            ENERGY_FRAME: (ENERGY_LOWER_LIMIT, ENERGY_UPPER_LIMIT),
+            LOBE_START: (LOBE_LOWER_LIMIT, LOBE_UPPER_LIMIT)}
+
+def build_opcode_table(ranges):
+    """
+    Classifies every frame value
+    :param ranges: A dict of frame kind to its lowest and highest value
+    :return: A tuple of the kind flags of each of the 256 frame values
+    """
+    table = [0] * 256
+    for kind, (low, high) in ranges.items():
+        for val in range(max(low, 0), min(high, len(table)-1)+1):
+            table[val] |= kind
+    return tuple(table)
+
+def get_opcode_table(kinds):
+    """
+    Gets the classification table for some kinds of frame with the current limits, tables are kept once built
+    """
+    ranges = opcode_ranges()
+    key = tuple((kind, ranges[kind]) for kind in kinds)
+    table = _opcode_tables.get(key)
+    if table is None:
+        table = build_opcode_table(dict(key))
+        _opcode_tables[key] = table
+    return table
+
 class Decoder:
     """
     A second decoder for when the genome is stored as linked list
@@ -30,22 +98,38 @@ class Decoder:
         Initialize to begin reading a dna strand
         """
         self._genome = None
+        # The active genome is also held as one int, fields are read from it by shifting and masking
+        self._value = 0
+        self._length = 0
+        self._window = 0
+        self._window_start = 0
+        self._window_end = 0
         self._current_pos = 1
-        self._current_organism = Body()
+        # The phenotype is collected as rows of tables, the current organ and gene are row numbers
+        self._builder = Phenotype.PhenotypeBuilder()
         self._current_organ = None
         self._current_gene = None
-        self._current_read = b''
-        self._current_node = Node()
+        # Structures are recorded as offsets into a GenomeBuffer, _current_node is the index of the one being read
+        self._buffer = None
+        self._body_buffer = None
+        self._base = 1
+        self._current_node = None
         self._bits_for_funcs = dict(zip(func_names, bits_needed))
         self._brain_genome = None
-        self._current_lobe = None
-        self._current_brain = None
+        # A parent phenotype to reuse, and the bit ranges of each genome that differ from it
+        self._parent = None
+        self._changes = None
+        self._brain_changes = None
 
     def set_genome(self, genome):
         """
-        Sets the active genome. Genome passed should be a byte string of the genome, ideally obtained from the parent.genome_head object
+        Sets the active genome. Genome passed should be a byte string or PackedGenome of the genome, ideally obtained from the parent.genome_head object
         """
-        self._genome = b'1' + genome # prepend a 1 to prevent leading zero discrepensies
+        self.load_bits(b'1' + genome) # prepend a 1 to prevent leading zero discrepensies
+        # The buffer holds the genome as given, so its positions are one less than the decoders
+        self._buffer = GenomeBuffer(genome)
+        self._base = 1
+        self._current_node = self._buffer.add_structure(0)
 
     def set_brain_genome(self, genome):
         """
@@ -53,311 +137,437 @@ class Decoder:
         """
         self._brain_genome = genome
         
-    def finish_organism(self):
+    def set_parent(self, phenotype, changes, brain_changes=()):
         """
-        On reading the whole strand, the organism will be finished, and the decoder will be reset.
-        :return: The final creature of type Body()
+        Decodes the genomes incrementally from a parent phenotype. Structures before the first changed bit are copied from the parent rather than read, and once the reading frame lands on a parent structure past the last changed bit, the rest is copied too.
+        Call after setting the genomes. A genome whose length differs from the parents is read in full.
+        :param phenotype: The PhenotypeIR of the parent
+        :param changes: The (start, end) bit ranges of the body genome that differ from the parents, or None if bits were inserted or removed
+        :param brain_changes: The same for the brain genome
         """
-        # Finalize the last node
-        if self._current_organ is not None:
-            if self._current_gene is not None:
-                self._current_node.set_noncoding(self._current_read)
-                self._current_gene.set_dna_head(self._current_node)
-            else:
-                self._current_organ.set_dna_head(self._current_node)
-            self._current_organism.add_organ(self._current_organ)
+        self._parent = phenotype
+        self._changes = None if changes is None else merge_ranges(changes)
+        self._brain_changes = None if brain_changes is None else merge_ranges(brain_changes)
+
+    def get_parent_offsets(self, index, changes):
+        """
+        Gets the structure offsets of one of the parents genomes, if the genome being read can reuse them
+        :param index: 0 for the body genome, 1 for the brain
+        :return: The offsets, or None to read the genome in full
+        """
+        if self._parent is None or changes is None:
+            return None
+        buffer = self._parent.get_buffers()[index]
+        if buffer is None or len(buffer.get_genome()) != len(self._genome) - self._base:
+            return None
+        return buffer.get_offsets()
+
+    def load_bits(self, genome):
+        """
+        Makes a genome the one being read
+        :param genome: A byte string or PackedGenome
+        """
+        self._genome = genome
+        self._length = len(genome)
+        if isinstance(genome, PackedGenome):
+            self._value = genome.to_int()
+        else:
+            self._value = int(genome, 2) if genome else 0
+        self._window = 0
+        self._window_start = 0
+        self._window_end = 0
+
+    def fill_window(self, pos, end):
+        """
+        Loads the bits from pos up to at least end into the read window
+        """
+        self._window_start = pos
+        self._window_end = min(max(end, pos + WINDOW_BITS), self._length)
+        self._window = (self._value >> (self._length - self._window_end)) & ((1 << (self._window_end - pos)) - 1)
+
+    def finish_phenotype(self):
+        """
+        On reading the whole strand, the brain is read, the phenotype is finished, and the decoder will be reset.
+        :return: The PhenotypeIR of the genome
+        """
+        # The remainder of the genome is the last structures noncoding section
+        self._buffer.freeze()
+        self._body_buffer = self._buffer
         
         # Read the brain data
-        self._current_read=b''
-        self.read_brain()
-        creature = self._current_organism
-        
-        # Reset internal params
-        self._current_organism = Body()
+        brain_buffer = self.read_brain()
+        phenotype = self._builder.finish(self._body_buffer, brain_buffer)
+        self.reset()
+        return phenotype
+
+    def reset(self):
+        """
+        Resets the decoder so it can read another genome
+        """
+        self._builder = Phenotype.PhenotypeBuilder()
         self._genome = None
+        self._value = 0
+        self._length = 0
+        self._window = 0
+        self._window_start = 0
+        self._window_end = 0
         self._brain_genome = None
         self._current_pos = 1
         self._current_organ = None
         self._current_gene = None
-        self._current_node = Node()
-        return creature
+        self._buffer = None
+        self._body_buffer = None
+        self._current_node = None
+        self._parent = None
+        self._changes = None
+        self._brain_changes = None
     
+    def read_int(self, length=NORMAL_READ_LENGTH):
+        """
+        Reads the next length bits of the genome as an unsigned int and moves past them
+        :return: The value of the field
+        """
+        pos = self._current_pos
+        end = pos + length
+        # Reads that reach the last bit are refused, as they always have been
+        if end >= self._length:
+            self._current_pos = self._length
+            raise ValueError("Read past the end of the genome")
+        if end > self._window_end or pos < self._window_start:
+            self.fill_window(pos, end)
+        self._current_pos = end
+        return (self._window >> (self._window_end - end)) & ((1 << length) - 1)
+
+    def make_scan(self, opcodes, stop):
+        """
+        Pre-scans the active genome for candidate frames if it is long enough to be worth it
+        :return: A FrameScan, or None to read every frame
+        """
+        if PRESCAN and self._length >= PRESCAN_MIN_LENGTH:
+            return FrameScan(self._genome, opcodes, stop)
+        return None
+
+    def next_frame(self, opcodes, stop, scan=None):
+        """
+        Moves past the next frame in the reading frame and classifies it. With a scan, frames that are not candidates are skipped.
+        :param opcodes: The table of frame kinds
+        :param stop: The scan ends before a frame starting here
+        :param scan: A FrameScan of the active genome, or None
+        :return: The kind flags of the frame, 0 if the scan has no candidates left
+        """
+        pos = self._current_pos
+        if scan is not None:
+            found = scan.next_candidate(pos)
+            if found is None:
+                # Step past the stop as reading every frame would have
+                self._current_pos = pos + -(-(stop - pos) // NORMAL_READ_LENGTH) * NORMAL_READ_LENGTH
+                return 0
+            self._current_pos = found + NORMAL_READ_LENGTH
+            return scan.get_kind(found)
+        # The scan never reaches the end of the genome, so the frame is read straight from the window
+        end = pos + NORMAL_READ_LENGTH
+        if end > self._window_end:
+            self.fill_window(pos, end)
+        self._current_pos = end
+        return opcodes[(self._window >> (self._window_end - end)) & 0xff]
+
     def read_at_pos(self, pos=None, length = NORMAL_READ_LENGTH):
         """
         Reads a section of Binary DNA, at a starting position and with a length
-        :return: A bytestring that represents the read value from the genome
+        :return: A bytestring that represents the read value from the genome, empty if the read is beyond the genome
         """
         # If no position is specified, get the current position from the class
         if pos == None:
             pos = self._current_pos
         if length == 0:
             return b''
-        if pos >= len(self._genome):
-            self._current_pos = len(self._genome)
-            return b''
         
         # If this tries to read beyond the genome, return an empty string
-        if pos + length >= len(self._genome):
-            self._current_pos = len(self._genome)
+        if pos + length >= self._length:
+            self._current_pos = self._length
             return b''
-        
-        # Read the segment and increment the classes current position
-        val = self._genome[pos:(pos+length)]
+        val = format((self._value >> (self._length - pos - length)) & ((1 << length) - 1), '0' + str(length) + 'b').encode('utf-8')
         if pos == self._current_pos:
             self._current_pos += length
         return val
 
     def read_genome(self):
         """
-        Continually reads the body genome, constructing an organism as it goes.
+        Reads the genome into an organism. If interning is on, a genome that has been decoded before is copied from its template instead of being read again.
+        :return: The creature of type Body()
+        """
+        if not GenomeIntern.INTERN_GENOMES:
+            return self.decode_genome()
+        key = GenomeIntern.genome_key(self._buffer.get_genome(), self._brain_genome)
+        template = GenomeIntern.INTERN_TABLE.get(key)
+        if template is None:
+            template = GenomeIntern.PhenotypeTemplate(self.decode_genome())
+            GenomeIntern.INTERN_TABLE.put(key, template)
+        else:
+            self.reset()
+        return template.instantiate()
+
+    def decode_genome(self):
+        """
+        Reads the genome and builds the organism from its phenotype
+        :return: The creature of type Body()
+        """
+        return Phenotype.build_organism(self.read_phenotype())
+
+    def read_phenotype(self):
+        """
+        Continually reads the body genome, collecting the tables of the phenotype as it goes.
         Refactor brain genome into this method
+        :return: The PhenotypeIR of the genome
         """
         # Stop reading if there is only 100 bits left (prevents out of bound read, need better solution)
-        while self._current_pos < (len(self._genome)-1)-100:
-            read_val = self.read_at_pos()  # Returns a byte string
+        stop = (self._length-1)-100
+        opcodes = get_opcode_table(BODY_KINDS)
+        scan = self.make_scan(opcodes, stop)
+        # With a parent, runs of structures with no changes in them are copied instead of read
+        offsets = self.get_parent_offsets(0, self._changes)
+        if offsets is not None:
+            structure = self.next_changed_structure(offsets, self._changes, 0)
+            if structure > 1:
+                self.copy_body(offsets, 1, structure)
+        while self._current_pos < stop:
+            kind = self.next_frame(opcodes, stop, scan)
+            if not kind:
+                continue
+            if offsets is not None and self.splice_body(offsets):
+                continue
 
             # If the gene start code was encountered begin constructing a gene, unless no organ exists to house it
-            if GENE_LOWER_LIMIT <= int(read_val,2) <= GENE_UPPER_LIMIT and self._current_organ is not None:
+            if kind & GENE_START and self._current_organ is not None:
                 self.start_new_node('gene') # Finish the previously read node, begin a new one
-                self._current_node.set_start(read_val) # Assign the start value
                 self.read_gene_data() # Start reading it
 
             # If the organ start code was encountered, begin constructing an organ
-            elif ORGAN_LOWER_LIMIT <= int(read_val,2) <= ORGAN_UPPER_LIMIT:
+            elif kind & ORGAN_START:
                 self.start_new_node('organ')
-                self._current_node.set_start(read_val)
                 self.read_organ_data()
                 self._current_gene = None # resets the active gene so that we can use this as a flag as well
 
             else:
                 # If a certain value is read in the organs non-coding section, add a 'fat storage' unit. Like how fatty it is.
-                if self._current_gene == None and self._current_organ: # Make sure it occurs in the noncoding space of an organ, not a gene
-                    if ENERGY_LOWER_LIMIT <= int(read_val,2) <= ENERGY_UPPER_LIMIT:
-                        self._current_organ.increase_energy_capacity(ENERGY_AMOUNT)
-                self._current_read += read_val
+                if self._current_gene is None and self._current_organ is not None: # Make sure it occurs in the noncoding space of an organ, not a gene
+                    if kind & ENERGY_FRAME:
+                        self._builder.add_energy_capacity(self._current_organ, ENERGY_AMOUNT)
+
+        # The remainder of the genome is part of the last structures noncoding section
+        # Finalize the phenotype and return it when complete.
+        return self.finish_phenotype()
+
+    def next_changed_structure(self, offsets, changes, pos):
+        """
+        Finds the parent structure holding the first changed bit at or after a position
+        :param changes: Sorted, non overlapping (start, end) ranges
+        :return: Its index, or the number of structures if nothing changes from there on
+        """
+        i = bisect_right([end for start, end in changes], pos)
+        if i == len(changes):
+            return len(offsets)
+        return max(int(np.searchsorted(offsets[:, 0], max(changes[i][0], pos), 'right')) - 1, 0)
 
-        # Add the remainder of the organisms genome to the read amount.
-        if self._current_pos < (len(self._genome)):
-            self._current_read += self._genome[self._current_pos:]
+    def copy_body(self, offsets, first, last):
+        """
+        Copies a run of the parents body structures instead of reading them, and moves to the start of the structure after the run with the state the parent had there
+        """
+        self._builder.copy_body(self._parent, first, last, self._buffer.get_num_structures())
+        self._buffer.add_structures(offsets[first:last])
+        self._current_node = self._buffer.get_num_structures() - 1
+        self._current_pos = int(offsets[last, 0]) + self._base if last < len(offsets) else self._length
+        organs, genes, terms, lobes = self._builder.get_counts()
+        self._current_organ = organs - 1 if organs else None
+        # Energy frames only count in the noncoding section of an organ, so the gene flag is set unless the run ended with an organ
+        parent_organs = self._parent.get_organs()[:, Phenotype.ORGAN_NODE]
+        parent_genes = self._parent.get_genes()[:, Phenotype.GENE_NODE]
+        if (last - 1) in parent_organs:
+            self._current_gene = None
+        elif (last - 1) in parent_genes:
+            self._current_gene = genes - 1
+        else:
+            self._current_gene = ORPHAN_GENE
 
-        # Finalize the organism and return it when complete.
-        final = self.finish_organism()
-        return final
+    def splice_body(self, offsets):
+        """
+        Checks whether the frame just read starts a parent structure with no changes in it, and if so copies the parents structures from there up to the next change
+        :return: True if structures were copied
+        """
+        frame = self._current_pos - NORMAL_READ_LENGTH - self._base
+        structure = int(np.searchsorted(offsets[:, 0], frame))
+        if structure < 1 or structure == len(offsets) or offsets[structure, 0] != frame:
+            return False
+        # A gene start only starts a gene once there is an organ, so the parent must have had one here exactly when the child does
+        had_organ = np.searchsorted(self._parent.get_organs()[:, Phenotype.ORGAN_NODE], structure) > 0
+        if had_organ != (self._current_organ is not None):
+            return False
+        last = self.next_changed_structure(offsets, self._changes, frame)
+        if last <= structure:
+            return False
+        self.copy_body(offsets, structure, last)
+        return True
 
     def read_organ_data(self):
         """
-        Reads organ data (right now, only has 3 parameters: health, activation, and reaction), constructs the organ.
-        """
-        # Assign the current organism the previously active organ
-        if self._current_organ is not None:
-            self._current_organism.add_organ(self._current_organ)
-            
-        # Create a new organ and get the parameters.
-        self._current_organ = InternalOrgan('internal', self._current_organism)
-        self._current_organ.set_def_health()
-        val = self.read_at_pos(length=5)
-        read = val
-        self._current_organ.set_reaction_rate(int(val,2)/32)
-        val = self.read_at_pos(length=5)
-        read += val
-        self._current_organ.set_act_rate(int(val,2)/32)
-        self._current_node.set_params(read)
+        Reads organ data (right now, only has 3 parameters: health, activation, and reaction), adds the organ to the phenotype.
+        """
+        # Start a new organ and get the parameters.
+        self._current_organ = self._builder.add_organ(self._current_node)
+        self._builder.set_organ(self._current_organ, Phenotype.ORGAN_REACTION_RATE, self.read_int(5))
+        self._builder.set_organ(self._current_organ, Phenotype.ORGAN_ACT_RATE, self.read_int(5))
+        self.end_params()
         return
 
     def read_gene_data(self):
         """
-        Constructs a gene (currently only 3 types (emitter, receptor, and reaction)) and gets parameters for it.
+        Reads a gene (currently only 3 types (emitter, receptor, and reaction)) and gets parameters for it.
         NEEDS REFACTORING. IT"S UGLI
         """
 
         # Find out what type of gene it is
-        type = self.read_at_pos(length = GENE_READ_LENGTH)
-
-        # read keeps a running track of what has been read
-        read = type
-        type = int(type,2) % GENE_TYPES
+        type = self.read_int(GENE_READ_LENGTH) % GENE_TYPES
 
         # If its a reaction gene
-        if type == 2:
+        if type == Phenotype.REACTION:
             # It's gonna be easier to separate all the logic into separate functions for now
-            self._current_gene = Reaction(self._current_organ, 'reaction')
             self.read_reaction_data()
             return
+
+        self._current_gene = self._builder.add_gene(self._current_organ, self._current_node, type)
         
         # if it's an emitter gene
-        elif type == 1:
-            self._current_gene = Emitter(self._current_organ, 'emitter')
-            rate = self.read_at_pos(length=5)
-            read += rate
-            self._current_gene.set_output_rate(int(rate,2))
-        
-        # if it's a receptor
-        elif type == 0:
-            self._current_gene = Receptor(self._current_organ, 'receptor')
+        if type == Phenotype.EMITTER:
+            self._builder.set_gene(self._current_gene, Phenotype.GENE_RATE, self.read_int(5))
         
         # Now parse the function this gene uses. Each function needs different parameters
-        func = self.read_at_pos(length = 3)
-        read += func
-
-        # Find out which function it is
-        func = int(func,2)
-        func_name = func_names[func]
-        # Findhow many bits to read for each parameter
-        func_read_lengths = bits_needed[func]
-        params = []
+        func = self.read_int(3)
+        self._builder.set_gene(self._current_gene, Phenotype.GENE_FUNC, func)
         # If the function needs parameters, then read each one as needed
-        for param in func_read_lengths:
-            val = self.read_at_pos(length = param)
-            read += val
-            params.append(int(val,2))
-        
-        # construct the unique function from parameters
-        if params:
-            function = functions[func](*params)
-        else:
-            function = functions[func]()
-        self._current_gene.set_activation(func_name, function)
-
-        # Now handle the other parameters of the gene
-        val = self.read_at_pos(length = 4)
-        read += val
-        val = int(val,2) % self._current_organ.get_param_numbers()
-        p=  self._current_organ._parameters[val]
-        # Give the gene the necessary function to manipulate or read the organs stats
-        self._current_gene.set_parameter(p[0], p[1])
-        val = self.read_at_pos(length = 4)
-        read += val
-        val = int(val,2)
-        self._current_gene.set_chemical(val)
-        self._current_organ.add_gene(self._current_gene)
-        self._current_node.set_params(read)
+        for i, param in enumerate(bits_needed[func]):
+            self._builder.set_gene(self._current_gene, Phenotype.GENE_ARGS + i, self.read_int(param))
+
+        # Now handle the other parameters of the gene, which organ parameter it works on and its chemical
+        self._builder.set_gene(self._current_gene, Phenotype.GENE_PARAM, self.read_int(4))
+        self._builder.set_gene(self._current_gene, Phenotype.GENE_CHEM, self.read_int(4))
+        self.end_params()
 
     def read_reaction_data(self):
         """
         Reads the data for a reaction gene, need to expand to handle energy?
         """
-        # Start off with the opcode for a reaction gene
-        read = b'0010'
-        if self._current_pos > len(self._genome)-50:
+        if self._current_pos > self._length-50:
+            # Too close to the end, the gene is started but never added to the organ
+            self._current_gene = ORPHAN_GENE
             return
+        self._current_gene = self._builder.add_gene(self._current_organ, self._current_node, Phenotype.REACTION)
 
         # Get how many variables on each side of equation
-        left = self.read_at_pos(length = 4)
-        right = self.read_at_pos(length = 4)
-        read += left + right
-        self._current_gene.set_num_of_chems_left(int(left,2))
-        self._current_gene.set_num_of_chems_right(int(right,2))
+        left = self.read_int(4)
+        right = self.read_int(4)
+        self._builder.set_gene(self._current_gene, Phenotype.GENE_LEFT, left)
+        self._builder.set_gene(self._current_gene, Phenotype.GENE_RIGHT, right)
         chems = []
 
         # Iterate thorugh and get which chems for each parameter
-        for i in range((int(left,2) % 2) + 1 + (int(right,2) % 3)):
-            val = self.read_at_pos(length = 6)
-            read += val
-            chem = self.read_at_pos(length = 6)
-            read += chem
-            chems.append((int(val,2),int(chem,2)%20))
-        self._current_gene.set_chems_and_coefficients(chems)
-        self._current_organ.add_gene(self._current_gene)
-        self._current_node.set_params(read)
+        for i in range((left % 2) + 1 + (right % 3)):
+            val = self.read_int(6)
+            chem = self.read_int(6)
+            chems.append((val, chem%20))
+        self._builder.add_terms(self._current_gene, chems)
+        self.end_params()
         
     def start_new_node(self, type):
         """
-        Generates a new DNA node, terminating the existing node
+        Starts a new DNA node, terminating the existing node. Called just after the start code of the new node is read.
         """
-        # Add the noncoding section the current node and establish the next node
-        if self._current_node is not None:
-            self._current_node.set_noncoding(self._current_read)
-            self._current_node.next = Node()
-            self._current_read = b''
-        
-        if self._current_organ is None and type != 'lobe':
-            # If organ opcode was encountered but no organ started yet, this is the first node of the entire critter
-            self._current_organism.set_dna_head(self._current_node)
-
-        # If organ opcode was encountered and no gene was constructed in the last one, then assign this node to the previous organ
-        elif type == 'organ':
-            if self._current_gene is None:
-                self._current_organ.set_dna_head(self._current_node)
-            else:
-                self._current_gene.set_dna_head(self._current_node)
+        # The existing node ends where the start code of the next one begins
+        start = self._current_pos - NORMAL_READ_LENGTH - self._base
+        self._current_node = self._buffer.add_structure(start, start + NORMAL_READ_LENGTH)
 
-        # Handle brain data, probably separate this out
-        elif type == 'lobe':
-            if self._current_lobe is None:
-                self._current_brain.set_dna_head(self._current_node)
-            else:
-                self._current_lobe.set_dna_head(self._current_node)
-        else:
-            if self._current_gene is not None:
-                self._current_gene.set_dna_head(self._current_node)
-        
-        self._current_node = self._current_node.next
+    def end_params(self):
+        """
+        Marks the end of the current nodes parameters, the rest of the node is noncoding
+        """
+        self._buffer.set_noncoding_pos(self._current_node, self._current_pos - self._base)
 
     def read_brain(self):
         """
-        Reads the brain genome and constructs a brain
+        Reads the brain genome into the lobe table
+        :return: The GenomeBuffer of the brain genome, or None if there is no brain
         """
-        # Setup a blank brain and a starting node
+        # Setup a starting node
         if self._brain_genome is None:
-            return
+            return None
         self._current_pos = 0
-        self._current_node = Node()
-        self._current_brain = Brain()
-        self._current_brain.set_owner(self._current_organism)
-        self._genome = self._brain_genome
+        self._buffer = GenomeBuffer(self._brain_genome)
+        self._base = 0
+        self.load_bits(self._brain_genome)
         
-        # Setup the brains basic stuffs
-        self.parse_brain_super()
+        # With a parent, runs of structures with no changes in them are copied instead of read
+        offsets = self.get_parent_offsets(1, self._brain_changes)
+        structure = 0
+        if offsets is not None:
+            structure = self.next_changed_structure(offsets, self._brain_changes, 0)
+        if structure > 0:
+            self.copy_brain(offsets, 0, structure)
+        else:
+            # Setup the brains basic stuffs
+            self._current_node = self._buffer.add_structure(0)
+            self.parse_brain_super()
         
         # Read through the genome
-        while self._current_pos < (len(self._genome)-1)-250:
-            read_val = self.read_at_pos()  # Returns a byte string
-            
+        stop = (self._length-1)-250
+        opcodes = get_opcode_table(BRAIN_KINDS)
+        scan = self.make_scan(opcodes, stop)
+        while self._current_pos < stop:
             # If a lobe start code was encountered, make that lobe
-            if LOBE_LOWER_LIMIT <= int(read_val,2) <= LOBE_UPPER_LIMIT:
+            if self.next_frame(opcodes, stop, scan) & LOBE_START:
+                if offsets is not None and self.splice_brain(offsets):
+                    continue
                 self.start_new_node('lobe') # Finish the previously read node, begin a new one
-                self._current_node.set_start(read_val) # Assign the start value
                 self.read_lobe_data() # Start reading it
 
-            else:
-                # SLowly build the noncoding portion
-                self._current_read += read_val
-
-        # Tack on the last bit of DNA that was not decoded
-        if self._current_pos < (len(self._genome)):
-            self._current_read += self._genome[self._current_pos:]
-            
-        # Finish the brain
-        self._current_node.set_noncoding(self._current_read)
-        if self._current_lobe is None:
-            self._current_brain.set_dna_head(self._current_node)
-        else:
-            self._current_lobe.set_dna_head(self._current_node)
-        self._current_organism.set_brain(self._current_brain)
-        return
+        # Finish the brain, the rest of the genome is noncoding
+        self._buffer.freeze()
+        return self._buffer
+
+    def copy_brain(self, offsets, first, last):
+        """
+        Copies a run of the parents lobes instead of reading them, and moves to the start of the structure after the run
+        """
+        self._builder.copy_brain(self._parent, first, last, self._buffer.get_num_structures())
+        self._buffer.add_structures(offsets[first:last])
+        self._current_node = self._buffer.get_num_structures() - 1
+        self._current_pos = int(offsets[last, 0]) if last < len(offsets) else self._length
+
+    def splice_brain(self, offsets):
+        """
+        Checks whether the lobe start just read starts a parent lobe with no changes in it, and if so copies the parents lobes from there up to the next change
+        :return: True if lobes were copied
+        """
+        frame = self._current_pos - NORMAL_READ_LENGTH
+        structure = int(np.searchsorted(offsets[:, 0], frame))
+        if structure < 1 or structure == len(offsets) or offsets[structure, 0] != frame:
+            return False
+        last = self.next_changed_structure(offsets, self._brain_changes, frame)
+        if last <= structure:
+            return False
+        self.copy_brain(offsets, structure, last)
+        return True
 
     def parse_brain_super(self):
         """
         Reads the basic attributes of the brain organ
         """
-        read_val = b''
-
         # Get width and layers
-        layers = self.read_at_pos(length=1)
-        read_val += layers
-        width = self.read_at_pos(length = 1)
-        read_val += width
-
-        self._current_brain.set_num_layers(int(layers,2)+2)
-        self._current_brain.set_width_layers(int(width,2)+4)
+        layers = self.read_int(1)+2
+        width = self.read_int(1)+4
+        self._builder.add_lobe(self._current_node, Phenotype.BRAIN, layers, width)
 
         # Get each node of the neural net
-        val, hidden_layers = self.read_and_build_neural_net(int(layers,2)+2, int(width,2)+4)
-        read_val += val
-        for layer in hidden_layers:
-            self._current_brain.add_layer(layer)
-            
-        self._current_node.set_params(read_val)
+        self.read_neural_net(layers, width)
+        self.end_params()
 
     def read_lobe_data(self):
         """
@@ -369,73 +579,20 @@ class Decoder:
         Then: Layers * Width * (2+6*Width) bits
         """
         # Get the type and dimensions of neural net
-        read_val = b''
-        type = self.read_at_pos(length=4)
-        read_val += type
-        layers = self.read_at_pos(length=3)
-        read_val += layers
-        width = self.read_at_pos(length=3)
-        read_val += width
-        param = self.read_at_pos(length=6)
-        read_val += param
-        typer = int(type,2)
-        
-        # Parse the read values
-        types = [ChemLobe, FoodLobe, FoodChemLobe, EnergyLobe]
-        lobe = types[typer%4]()
-        lobe.set_owner(self._current_organism)
-        lobe.set_width_layers((int(width,2)%4) + 1)
-        lobe.set_num_layers((int(layers,2) % 3) + 1)
-
-        # Parse parameters based on type
-        if typer%4 == 0 or typer%4 == 2:
-            lobe.set_chem(int(param,2) % 16)
-        if typer%4 == 1:
-            x  = (int(param) % 8) % 5 -2
-            y = (int(param) // 8) % 5 -2
-            lobe.set_direction([x,y])
-
-        # Build the neuralnetwork
-        val, hidden_layers = self.read_and_build_neural_net((int(layers,2) % 3) + 1, (int(width,2)%4) + 1)
-        read_val += val
-        for layer in hidden_layers:
-            lobe.add_layer(layer)
-        
-        # assign the lobe 
-        if type == 2:
-            self._current_brain.add_food_chem_lobe(lobe)
-        elif type == 1:
-            self._current_brain.add_sensory_lobe(lobe)
-        else:
-            self._current_brain.add_internal_lobe(lobe)
-        self._current_lobe = lobe
-        self._current_node.set_params(read_val)
+        typer = self.read_int(4)
+        layers = (self.read_int(3) % 3) + 1
+        width = (self.read_int(3) % 4) + 1
+        param = self.read_int(6)
+        self._builder.add_lobe(self._current_node, typer%4, layers, width, param)
 
-    
-    def read_and_build_neural_net(self, layers, width):
-        read_val =b''
-        hidden_layers = []
-        for i in range(layers):
-            val, layer = self.build_neural_net_layer(width)
-            read_val += val
-            hidden_layers.append(layer)
-        return read_val, hidden_layers
-
-    def build_neural_net_layer(self,width):
-        read_val = b''
-        funcs = [linr, relu, tanh, sigmoid]
-        layer = []
-        for i in range(width):
-            node = BrainNode()
-            func = self.read_at_pos(length=2)
-            read_val += func
-            weights = []
-            for _ in range(width):
-                weight = self.read_at_pos(length=6)
-                read_val += weight
-                weight = (int(weight,2) - 31)/32
-                weights.append(weight)
-            node.set_function(funcs[int(func,2)])
-            node.set_weights(weights)
-            layer.append(node)
-        return read_val, layer
+        # Read the neuralnetwork
+        self.read_neural_net(layers, width)
+        self.end_params()
+
+    def read_neural_net(self, layers, width):
+        """
+        Reads the activation code and weights of every node of a net into the current lobe
+        """
+        for i in range(layers * width):
+            code = self.read_int(2)
+            self._builder.add_net_node(code, [self.read_int(6) - Phenotype.WEIGHT_OFFSET for _ in range(width)])
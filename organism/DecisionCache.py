@@ -0,0 +1,92 @@
+"""
+An optional cache of the actions a brain has chosen, keyed by the inputs its lobes read. The brain is a pure function of those inputs, so an organism sitting still or grazing keeps asking the same question and can reuse the answer.
+With a quantization step of 0 the inputs have to match exactly and the cache never changes a decision. A step above 0 rounds the inputs to that step before looking them up, so nearby inputs share a decision. That is an APPROXIMATION and can pick a different action than the brain would have.
+"""
+from collections import OrderedDict
+
+DECISION_CACHE_SIZE = 256
+DECISION_CACHE_STEP = 0
+
+class DecisionCache:
+    """
+    A bounded least recently used map from quantized lobe inputs to an action. One cache can be shared by brains decoded from the same genome.
+    """
+    def __init__(self, size=DECISION_CACHE_SIZE, step=DECISION_CACHE_STEP):
+        """
+        :param size: The most decisions kept, the least recently used is dropped after that
+        :param step: The quantization step of the inputs, 0 for exact keys. Anything above 0 is approximate.
+        """
+        if size < 1:
+            raise ValueError("The decision cache must hold at least 1 decision")
+        if step < 0:
+            raise ValueError("The quantization step can't be negative")
+        self._size = size
+        self._step = step
+        self._decisions = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def is_approximate(self):
+        """
+        True if inputs are rounded, in which case a cached action may differ from what the brain would choose
+        """
+        return self._step > 0
+
+    def get_size(self):
+        return self._size
+
+    def get_step(self):
+        return self._step
+
+    def make_key(self, inputs):
+        """
+        Turns a list of lobe inputs into a key, rounding each to the quantization step
+        """
+        if self._step > 0:
+            return tuple(round(val/self._step) for val in inputs)
+        return tuple(inputs)
+
+    def get(self, key):
+        """
+        Looks up a decision and marks it as recently used
+        :return: The action, or None on a miss
+        """
+        action = self._decisions.get(key)
+        if action is None:
+            self._misses += 1
+            return None
+        self._decisions.move_to_end(key)
+        self._hits += 1
+        return action
+
+    def put(self, key, action):
+        """
+        Stores a decision, dropping the least recently used one if the cache is full
+        """
+        self._decisions[key] = action
+        self._decisions.move_to_end(key)
+        if len(self._decisions) > self._size:
+            self._decisions.popitem(last=False)
+            self._evictions += 1
+
+    def clear(self):
+        """
+        Drops every decision, the statistics are kept
+        """
+        self._decisions = OrderedDict()
+
+    def __len__(self):
+        return len(self._decisions)
+
+    def get_stats(self):
+        """
+        Returns the hit and miss counts of the cache
+        """
+        lookups = self._hits + self._misses
+        return {'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit rate': self._hits/max(lookups, 1),
+                'entries': len(self._decisions),
+                'approximate': self.is_approximate()}
@@ -0,0 +1,81 @@
+"""
+A pre-scan of a genome for the decoder. The genome is viewed as an array of bits, the value of the 8 bit frame at every offset is computed in one pass, and the offsets holding a start code or energy frame are kept for each of the 8 reading frames.
+The decoder still reads frame by frame in its reading frame, it just jumps from one candidate to the next instead of looking at every noncoding frame in between.
+"""
+from bisect import bisect_left
+import numpy as np
+from PackedGenome import PackedGenome
+
+FRAME_LENGTH = 8
+_tables = {}
+
+def genome_bits(genome):
+    """
+    Gets a genome as an array of 0 and 1
+    :param genome: A byte string or PackedGenome
+    """
+    if isinstance(genome, PackedGenome):
+        return np.unpackbits(np.frombuffer(genome.get_data(), dtype=np.uint8))[:len(genome)]
+    return np.frombuffer(genome, dtype=np.uint8) - ord('0')
+
+def frame_values(bits):
+    """
+    Gets the value of the 8 bit frame starting at every offset of the bits, the last 7 offsets have no frame
+    """
+    count = len(bits) - FRAME_LENGTH + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.uint8)
+    # Bits shifted out of the top of a uint8 are dropped, which leaves exactly the last 8
+    values = np.zeros(count, dtype=np.uint8)
+    for i in range(FRAME_LENGTH):
+        values = (values << 1) | bits[i:i+count]
+    return values
+
+
+class FrameScan:
+    """
+    The candidate frames of one genome, in the positions the decoder uses
+    """
+    def __init__(self, genome, table, stop):
+        """
+        :param genome: The genome as the decoder holds it
+        :param table: A table of the kind flags of each frame value, from Constructor.get_opcode_table
+        :param stop: Frames starting at or after this are never read by the scan
+        """
+        lookup = _tables.get(table)
+        if lookup is None:
+            lookup = _tables[table] = np.asarray(table, dtype=np.uint8)
+        kinds = lookup[frame_values(genome_bits(genome))]
+        # Kept as bytes and lists, the decoder looks them up one at a time
+        self._kinds = kinds.tobytes()
+        starts = np.flatnonzero(kinds[:max(stop, 0)])
+        frames = starts % FRAME_LENGTH
+        bounds = np.cumsum(np.bincount(frames, minlength=FRAME_LENGTH))[:-1]
+        self._candidates = [part.tolist() for part in np.split(starts[np.argsort(frames, kind='stable')], bounds)]
+
+    def get_kind(self, pos):
+        """
+        Gets the kind flags of the frame starting at pos
+        """
+        return self._kinds[pos]
+
+    def get_candidates(self, kind=None):
+        """
+        Gets every offset holding a frame of the given kind, or of any kind, in order
+        """
+        starts = np.sort(np.concatenate([np.array(candidates, dtype=np.intp) for candidates in self._candidates]))
+        if kind is None:
+            return starts
+        kinds = np.frombuffer(self._kinds, dtype=np.uint8)
+        return starts[(kinds[starts] & kind) != 0]
+
+    def next_candidate(self, pos):
+        """
+        Finds the first candidate at or after pos in the same reading frame as pos
+        :return: The position of the candidate, or None if there are no more
+        """
+        candidates = self._candidates[pos % FRAME_LENGTH]
+        i = bisect_left(candidates, pos)
+        if i == len(candidates):
+            return None
+        return candidates[i]
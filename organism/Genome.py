@@ -1,10 +1,13 @@
 """
-Creates a class for the genome in which the entire genome is saved into chunks and is a singly linked list
+Creates a class for the genome in which the entire genome is saved into chunks and is a singly linked list.
+GenomeBuffer keeps a decoded genome in one piece instead, with NodeViews standing in for the Nodes.
 """
+import numpy as np
+from PackedGenome import PackedGenome
 
 class Node:
     """
-    Each node points to the next node in the genome. Contains the bits as the start (opcode), the parameters of the structure, and then all non-coding sections following it. Genome segments must be passed as bytes, and then are prepended with 1 (to preserve leading 0s) and converted to binary(save space while stored in mem). Using the segments means needing to drop the leading 1
+    Each node points to the next node in the genome. Contains the bits as the start (opcode), the parameters of the structure, and then all non-coding sections following it. Genome segments can be passed as bytes or as PackedGenomes, and are stored packed 8 bits to a byte. The getters return the byte string form.
     """
     def __init__(self):
         self._start = None
@@ -19,45 +22,51 @@ class Node:
         """
         return self.get_start() + self.get_params() + self.get_noncoding()
 
+    def get_structure_packed(self):
+        """
+        Return the gene for this node as a PackedGenome
+        """
+        return PackedGenome.join([part for part in (self._start, self._params, self._noncoding) if part is not None])
+
     def set_start(self, start):
-        # Sets the start code of the node, prepends a 1 and converts to binary
-        self._start = bin(int(b'1'+start,2))
+        # Sets the start code of the node, stored packed
+        self._start = PackedGenome.from_bits(start)
 
     def set_params(self, params):
         """
-        # Sets the parameter portion of the node, prepends a 1 and converts to binary
+        # Sets the parameter portion of the node, stored packed
         """
-        self._params = bin(int(b'1'+params,2))
+        self._params = PackedGenome.from_bits(params)
 
     def set_noncoding(self, noncoding):
         """
-        Sets the noncoding section of the node, prepends a 1 and converts to binary
+        Sets the noncoding section of the node, stored packed
         """
-        self._noncoding = bin(int(b'1'+noncoding,2))
+        self._noncoding = PackedGenome.from_bits(noncoding)
 
     def get_start(self):
         """
-        Convert the binary portion into a byte string and remove the prepended one
+        Convert the packed start code into a byte string
         """
         if self._start is None:
             return b''
-        return bytes(str(self._start)[3:],'utf-8')
+        return self._start.to_bits()
         
     def get_params(self):
         """
-        Convert the binary portion into a byte string and remove the prepended one
+        Convert the packed parameters into a byte string
         """
         if self._params is None:
             return b''
-        return bytes(str(self._params)[3:],'utf-8')
+        return self._params.to_bits()
 
     def get_noncoding(self):
         """
-        Convert the binary portion into a byte string and remove the prepended one
+        Convert the packed noncoding section into a byte string
         """
         if self._noncoding is None:
             return b''
-        return bytes(str(self._noncoding)[3:],'utf-8')
+        return self._noncoding.to_bits()
 
     def get_next(self):
         """
@@ -73,3 +82,325 @@ class Node:
         if self.next is not None:
             val += self.next.get_entire_genome()
         return val
+
+    def get_entire_packed(self):
+        """
+        Returns the entire dna strand from this node onwards as a PackedGenome
+        """
+        parts = []
+        node = self
+        while node is not None:
+            parts.extend(part for part in (node._start, node._params, node._noncoding) if part is not None)
+            node = node.next
+        return PackedGenome.join(parts)
+
+
+class GenomeBuffer:
+    """
+    A whole genome kept as one immutable buffer (a byte string or PackedGenome), with the positions of the start code, parameters and noncoding section of every structure in it. Each structure runs until the next one starts.
+    NodeViews read their segments straight out of the buffer, nothing is copied until a segment is asked for, and the whole genome is the buffer itself.
+    """
+    def __init__(self, genome, offsets=None):
+        """
+        :param genome: The genome as a byte string or PackedGenome
+        :param offsets: The offsets of an already decoded genome, from get_offsets
+        """
+        self._genome = genome
+        # Rows of [start, params, noncoding] positions, a list while decoding and an array once frozen
+        self._offsets = [] if offsets is None else offsets
+
+    def add_structure(self, start, params=None):
+        """
+        Adds a structure starting at start, with its parameters at params (defaults to start)
+        :return: The index of the structure
+        """
+        params = start if params is None else params
+        self._offsets.append([start, params, params])
+        return len(self._offsets) - 1
+
+    @classmethod
+    def from_pieces(cls, pieces):
+        """
+        Assembles a frozen buffer out of pieces of other genomes, the structure offsets are worked out from the pieces so the result never has to be decoded to find them
+        :param pieces: A list of (genome, begin, end, header). header is the (params, noncoding) positions in the genome of a structure starting at begin, or None if the piece continues the structure before it
+        :return: A GenomeBuffer, packed if the first piece is
+        """
+        offsets = []
+        pos = 0
+        for genome, begin, end, header in pieces:
+            if header is not None:
+                params, noncoding = header
+                offsets.append([pos, pos + params - begin, pos + noncoding - begin])
+            pos += end - begin
+        if pieces and isinstance(pieces[0][0], PackedGenome):
+            # Each source genome is unpacked once, the pieces are slices of it and the child is packed in one go
+            sources = {}
+            parts = []
+            for genome, begin, end, header in pieces:
+                bits = sources.get(id(genome))
+                if bits is None:
+                    bits = sources[id(genome)] = genome.to_array() if isinstance(genome, PackedGenome) else np.frombuffer(genome, dtype=np.uint8) - ord('0')
+                parts.append(bits[begin:end])
+            genome = PackedGenome.from_array(np.concatenate(parts))
+        else:
+            genome = b''.join([genome[begin:end].to_bits() if isinstance(genome, PackedGenome) else memoryview(genome)[begin:end]
+                               for genome, begin, end, header in pieces])
+        return cls(genome, np.array(offsets, dtype=np.int64).reshape(-1, 3))
+
+    @classmethod
+    def from_nodes(cls, head):
+        """
+        Packs a linked list of Nodes into a frozen buffer
+        """
+        pieces = []
+        node = head
+        while node is not None:
+            start, params, noncoding = node.get_start(), node.get_params(), node.get_noncoding()
+            structure = start + params + noncoding
+            pieces.append((structure, 0, len(structure), (len(start), len(start) + len(params))))
+            node = node.next
+        return cls.from_pieces(pieces)
+
+    def get_piece(self, index):
+        """
+        Returns a structure as a piece for from_pieces
+        """
+        start, params, noncoding, end = self.get_bounds(index)
+        return (self._genome, start, end, (params, noncoding))
+
+    def add_structures(self, offsets):
+        """
+        Adds a run of structures whose offsets are already known, from the offsets of another buffer over the same positions
+        """
+        self._offsets.extend(offsets.tolist())
+
+    def set_noncoding_pos(self, index, pos):
+        """
+        Sets where the noncoding section of a structure starts, ie where its parameters end
+        """
+        self._offsets[index][2] = pos
+
+    def freeze(self):
+        """
+        Packs the offsets into an array once the genome is decoded
+        """
+        self._offsets = np.array(self._offsets, dtype=np.int64).reshape(-1, 3)
+
+    def get_genome(self):
+        return self._genome
+
+    def get_offsets(self):
+        return self._offsets
+
+    def get_num_structures(self):
+        return len(self._offsets)
+
+    def get_bounds(self, index):
+        """
+        Returns the start, params, noncoding and end positions of a structure
+        """
+        start, params, noncoding = self._offsets[index]
+        end = self._offsets[index+1][0] if index+1 < len(self._offsets) else len(self._genome)
+        return int(start), int(params), int(noncoding), int(end)
+
+    def get_segment(self, begin, end):
+        """
+        Returns a piece of the genome as a byte string
+        """
+        segment = self._genome[begin:end]
+        if isinstance(segment, PackedGenome):
+            return segment.to_bits()
+        return segment
+
+    def get_view(self, index):
+        """
+        Returns a NodeView of a structure, or None past the last structure
+        """
+        if 0 <= index < len(self._offsets):
+            return NodeView(self, index)
+        return None
+
+    def get_head(self):
+        return self.get_view(0)
+
+    def to_nodes(self, index=0):
+        """
+        Copies the structures from index onwards into a linked list of Nodes, for code that edits the list
+        """
+        head = None
+        prev = None
+        for i in range(index, len(self._offsets)):
+            start, params, noncoding, end = self.get_bounds(i)
+            node = Node()
+            node.set_start(self._genome[start:params])
+            node.set_params(self._genome[params:noncoding])
+            node.set_noncoding(self._genome[noncoding:end])
+            if prev is None:
+                head = node
+            else:
+                prev.next = node
+            prev = node
+        return head
+
+
+class NodeView:
+    """
+    A read only view of one structure in a GenomeBuffer, used in place of a Node
+    """
+    __slots__ = ('_buffer', '_index')
+
+    def __init__(self, buffer, index):
+        self._buffer = buffer
+        self._index = index
+
+    def get_buffer(self):
+        return self._buffer
+
+    def get_index(self):
+        return self._index
+
+    def get_start(self):
+        start, params, noncoding, end = self._buffer.get_bounds(self._index)
+        return self._buffer.get_segment(start, params)
+
+    def get_params(self):
+        start, params, noncoding, end = self._buffer.get_bounds(self._index)
+        return self._buffer.get_segment(params, noncoding)
+
+    def get_noncoding(self):
+        start, params, noncoding, end = self._buffer.get_bounds(self._index)
+        return self._buffer.get_segment(noncoding, end)
+
+    def get_structure_genome(self):
+        """
+        Return the gene for this node
+        """
+        start, params, noncoding, end = self._buffer.get_bounds(self._index)
+        return self._buffer.get_segment(start, end)
+
+    def get_structure_packed(self):
+        start, params, noncoding, end = self._buffer.get_bounds(self._index)
+        return PackedGenome.from_bits(self._buffer.get_genome()[start:end])
+
+    def get_next(self):
+        return self._buffer.get_view(self._index + 1)
+
+    @property
+    def next(self):
+        return self.get_next()
+
+    def get_entire_genome(self):
+        """
+        Returns the entire dna strand from this node onwards, in the form the buffer holds it. From the first node this is the buffer itself.
+        """
+        start = self._buffer.get_bounds(self._index)[0]
+        genome = self._buffer.get_genome()
+        if start == 0:
+            return genome
+        return genome[start:]
+
+    def get_entire_packed(self):
+        return PackedGenome.from_bits(self.get_entire_genome())
+
+    def to_nodes(self):
+        """
+        Copies this structure and the ones after it into a linked list of Nodes
+        """
+        return self._buffer.to_nodes(self._index)
+
+
+class GenomeBatch:
+    """
+    A batch of genomes kept as the rows of one 2-D array of packed bits, with the length of every row and, if known, its structure offsets.
+    A row is only made into a PackedGenome when it is asked for, so a whole brood of children costs one array.
+    """
+    def __init__(self, matrix, lengths, offsets=None, flips=None):
+        """
+        :param matrix: A (rows, bytes) uint8 array of bits packed most significant first, every bit past the end of a row must be 0
+        :param lengths: The number of bits in each row
+        :param offsets: For each row, its structure offsets as GenomeBuffer.get_offsets returns them
+        :param flips: The rows and positions of the bits flipped since the rows were made, as two arrays
+        """
+        self._matrix = matrix
+        self._lengths = np.asarray(lengths, dtype=np.int64)
+        self._offsets = offsets
+        if flips is None:
+            flips = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        # Kept sorted by row, so the flips of a row are one slice
+        rows, positions = flips
+        order = np.lexsort((positions, rows))
+        self._flip_rows = rows[order]
+        self._flip_positions = positions[order]
+
+    @classmethod
+    def from_genome(cls, genome, count, offsets=None):
+        """
+        Makes a batch holding count copies of one genome
+        :param genome: A byte string or PackedGenome
+        :param offsets: The structure offsets of the genome, shared by every row
+        """
+        packed = PackedGenome.from_bits(genome)
+        row = np.frombuffer(packed.get_data(), dtype=np.uint8)
+        return cls(np.tile(row, (count, 1)), np.full(count, len(packed)), None if offsets is None else [offsets] * count)
+
+    @classmethod
+    def from_bits(cls, bits, lengths, offsets=None):
+        """
+        Packs a (rows, bits) array of 0 and 1 into a batch, every bit past the end of a row must be 0
+        """
+        return cls(np.packbits(bits.astype(np.uint8), axis=1), lengths, offsets)
+
+    def get_matrix(self):
+        return self._matrix
+
+    def get_lengths(self):
+        return self._lengths
+
+    def get_offsets(self, row):
+        return None if self._offsets is None else self._offsets[row]
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def get_genome(self, row):
+        """
+        Copies one row out into a PackedGenome
+        """
+        length = int(self._lengths[row])
+        return PackedGenome(self._matrix[row, :(length+7)//8].tobytes(), length)
+
+    def get_buffer(self, row):
+        """
+        Returns one row as a GenomeBuffer, with its structure offsets
+        """
+        return GenomeBuffer(self.get_genome(row), self.get_offsets(row))
+
+    def get_flips(self, row):
+        """
+        Returns the positions flipped in a row, in order
+        """
+        begin, end = np.searchsorted(self._flip_rows, [row, row+1])
+        return self._flip_positions[begin:end].tolist()
+
+    def flip(self, rows, positions):
+        """
+        Flips bits anywhere in the batch with one XOR, a bit listed twice is flipped back
+        :param rows: The row of each bit
+        :param positions: The position of each bit in its row
+        :return: A new GenomeBatch, this one is not changed
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions) and (positions.min() < 0 or np.any(positions >= self._lengths[rows])):
+            raise IndexError("Bit is outside the genome")
+        matrix = self._matrix.copy()
+        np.bitwise_xor.at(matrix, (rows, positions >> 3), (0x80 >> (positions & 7)).astype(np.uint8))
+        flips = (np.concatenate((self._flip_rows, rows)), np.concatenate((self._flip_positions, positions)))
+        return GenomeBatch(matrix, self._lengths, self._offsets, flips)
+
+    def genomes(self):
+        """
+        Yields the rows one at a time as PackedGenomes
+        """
+        for row in range(len(self)):
+            yield self.get_genome(row)
@@ -0,0 +1,178 @@
+"""
+Interns decoded genomes so that clones share one genome and one decoded phenotype. Each pair of body and brain genomes is hashed with blake2b over its packed bits, and the table keeps a weak reference to a template holding the genome buffer and a freshly decoded prototype organism.
+A clone is made by copying only the per organism state of the prototype (chemicals, energy, organ health, lobe caches), while the genome buffers, node views, compiled nets and brain nodes are shared. A template is dropped once no organism made from it is left.
+"""
+import copy
+import hashlib
+import sys
+import weakref
+import numpy as np
+import CompiledBrain
+import BrainPruning
+from PackedGenome import PackedGenome
+from Genome import NodeView
+from utilities import generate_id
+
+# Look decoded genomes up in the intern table before decoding them
+INTERN_GENOMES = False
+
+def decode_settings():
+    """
+    The settings that change what a genome decodes into, they are part of the key
+    """
+    return (CompiledBrain.QUANTIZED, BrainPruning.PRUNE)
+
+def genome_key(genome, brain_genome):
+    """
+    Hashes a body and brain genome, in either byte string or packed form, into a key
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in (genome, brain_genome):
+        if part is None:
+            hasher.update(b'\xff' * 8)
+            continue
+        packed = PackedGenome.from_bits(part)
+        hasher.update(len(packed).to_bytes(8, 'big'))
+        hasher.update(packed.get_data())
+    hasher.update(repr(decode_settings()).encode('utf-8'))
+    return hasher.digest()
+
+
+class PhenotypeTemplate:
+    """
+    A decoded prototype organism, kept untouched, that clones are copied from
+    """
+    def __init__(self, prototype):
+        """
+        :param prototype: An organism straight out of the decoder, it must never be simulated
+        """
+        self._prototype = prototype
+        self._shared = {}
+        self._shared_bytes = 0
+        for obj in self.find_shared(prototype):
+            if id(obj) not in self._shared:
+                self._shared[id(obj)] = obj
+                self._shared_bytes += self.get_size(obj)
+
+    @staticmethod
+    def find_shared(organism):
+        """
+        Lists the parts of an organism that never change after decoding
+        """
+        shared = []
+        if organism.get_tables() is not None:
+            shared.append(organism.get_tables())
+        heads = [organism.get_dna_head()]
+        for organ in organism.get_organs():
+            heads.append(organ.get_dna_head())
+            heads.extend(gene.get_dna_head() for gene in organ.get_genes())
+        brain = organism.get_brain()
+        if brain is not None:
+            heads.append(brain.get_dna_head())
+            for lobe in [brain] + brain.get_lobes():
+                heads.append(lobe.get_dna_head())
+                if lobe.get_compiled() is not None:
+                    shared.append(lobe.get_compiled())
+                for layer in lobe.get_hidden_layers():
+                    shared.extend(layer)
+        for head in heads:
+            if isinstance(head, NodeView):
+                shared.append(head)
+                shared.append(head.get_buffer())
+        return shared
+
+    @staticmethod
+    def get_size(obj):
+        """
+        Estimates the memory an object takes, for reporting what sharing saves
+        """
+        if isinstance(obj, NodeView):
+            return sys.getsizeof(obj)
+        if hasattr(obj, 'get_offsets'):
+            genome = obj.get_genome()
+            size = len(genome.get_data()) if isinstance(genome, PackedGenome) else sys.getsizeof(genome)
+            offsets = obj.get_offsets()
+            return size + (offsets.nbytes if isinstance(offsets, np.ndarray) else sys.getsizeof(offsets))
+        if hasattr(obj, 'get_nbytes'):
+            return obj.get_nbytes()
+        return sys.getsizeof(obj) + sys.getsizeof(vars(obj)) + sys.getsizeof(obj.get_weights())
+
+    def get_shared_bytes(self):
+        return self._shared_bytes
+
+    def get_prototype(self):
+        return self._prototype
+
+    def instantiate(self):
+        """
+        Makes a new organism from the prototype, sharing everything that doesn't change
+        """
+        memo = dict(self._shared)
+        organism = copy.deepcopy(self._prototype, memo)
+        # Every object gets its own id, as if it had been decoded
+        organism._id = generate_id()
+        for organ in organism.get_organs():
+            organ._id = generate_id()
+            for gene in organ.get_genes():
+                gene._id = generate_id()
+        brain = organism.get_brain()
+        if brain is not None:
+            for lobe in [brain] + brain.get_lobes():
+                lobe._id = generate_id()
+        organism.set_phenotype(self)
+        return organism
+
+
+class InternTable:
+    """
+    Maps genome keys to templates by weak reference, and counts hits
+    """
+    def __init__(self):
+        self._templates = weakref.WeakValueDictionary()
+        self._hits = 0
+        self._misses = 0
+        self._bytes_saved = 0
+
+    def get(self, key):
+        """
+        Looks up a template
+        :return: The template, or None on a miss
+        """
+        template = self._templates.get(key)
+        if template is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        self._bytes_saved += template.get_shared_bytes()
+        return template
+
+    def put(self, key, template):
+        self._templates[key] = template
+
+    def clear(self):
+        """
+        Drops every template and resets the statistics
+        """
+        self._templates = weakref.WeakValueDictionary()
+        self._hits = 0
+        self._misses = 0
+        self._bytes_saved = 0
+
+    def __len__(self):
+        return len(self._templates)
+
+    def get_stats(self):
+        """
+        Returns the hit rate and an estimate of the memory saved by sharing
+        """
+        lookups = self._hits + self._misses
+        return {'lookups': lookups,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit rate': self._hits/max(lookups, 1),
+                'templates': len(self._templates),
+                'bytes saved': self._bytes_saved}
+
+
+# The table shared by every decoder
+INTERN_TABLE = InternTable()
@@ -2,6 +2,260 @@
 A simple structure for prototyping
 """
 from utilities import *
+import numpy as np
+
+ORGAN_TABLE_SIZE = 8
+HEALTH_COLUMN = 0
+ACT_RATE_COLUMN = 1
+REACTION_RATE_COLUMN = 2
+RECEPTOR_COLUMNS = 3
+
+class OrganTable:
+    """
+    Holds the parameters of every organ in a body as arrays indexed by organ slot. Receptor outputs are kept as a running sum and count per parameter instead of a list, so averaging them never depends on how many have been read.
+    The table also keeps running totals of the mapped health and the energy capacity of the living organs, updated on every write so the body can read them without iterating.
+    """
+    def __init__(self, health_map, death_threshold, size=ORGAN_TABLE_SIZE):
+        """
+        :param health_map: Function mapping an organs health to its share of the overall creature health
+        :param death_threshold: Organs below this health are flagged to be removed at the next health check
+        """
+        self._health_map = health_map
+        self._death_threshold = death_threshold
+        self._count = 0
+        self._health = np.ones(size)
+        self._act_rate = np.zeros(size)
+        self._reaction_rate = np.zeros(size)
+        self._energy_capacity = np.ones(size)
+        self._alive = np.zeros(size, dtype=bool)
+        self._receptor_sums = np.zeros((size, RECEPTOR_COLUMNS))
+        self._receptor_counts = np.zeros((size, RECEPTOR_COLUMNS), dtype=np.int64)
+
+        # Running aggregates over the living organs
+        self._health_terms = np.zeros(size)
+        self._health_total = 0
+        self._live_count = 0
+        self._capacity_total = 0
+        self._dying = set()
+
+    def add_row(self):
+        """
+        Reserves a slot for a new organ, growing the arrays if they are full
+        :return: The slot index of the new organ
+        """
+        if self._count == len(self._health):
+            self._grow()
+        slot = self._count
+        self._count += 1
+        return slot
+
+    def _grow(self):
+        """
+        Doubles the size of every array in the table
+        """
+        size = len(self._health)
+        self._health = np.concatenate((self._health, np.ones(size)))
+        self._act_rate = np.concatenate((self._act_rate, np.zeros(size)))
+        self._reaction_rate = np.concatenate((self._reaction_rate, np.zeros(size)))
+        self._energy_capacity = np.concatenate((self._energy_capacity, np.ones(size)))
+        self._alive = np.concatenate((self._alive, np.zeros(size, dtype=bool)))
+        self._receptor_sums = np.concatenate((self._receptor_sums, np.zeros((size, RECEPTOR_COLUMNS))))
+        self._receptor_counts = np.concatenate((self._receptor_counts, np.zeros((size, RECEPTOR_COLUMNS), dtype=np.int64)))
+        self._health_terms = np.concatenate((self._health_terms, np.zeros(size)))
+
+    def get_count(self):
+        """
+        Returns the number of slots in use
+        """
+        return self._count
+
+    def get_state(self):
+        """
+        Returns the arrays and running totals of the table, everything but the health map and death threshold which come from the body
+        """
+        state = dict(vars(self))
+        del state['_health_map']
+        del state['_death_threshold']
+        return state
+
+    def set_state(self, state):
+        """
+        Restores the arrays and running totals saved by get_state
+        """
+        vars(self).update(state)
+
+    def get_health(self, slot):
+        return self._health[slot]
+
+    def set_health(self, slot, val):
+        """
+        Sets an organs health and updates the running health and capacity totals if the organ is alive
+        """
+        old = self._health[slot]
+        self._health[slot] = val
+        if not self._alive[slot]:
+            return
+        term = self._health_map(val)
+        self._health_total += term - self._health_terms[slot]
+        self._health_terms[slot] = term
+        # Organs with no health left do not store energy
+        if (old > 0) != (val > 0):
+            if val > 0:
+                self._capacity_total += self._energy_capacity[slot]
+            else:
+                self._capacity_total -= self._energy_capacity[slot]
+        if val < self._death_threshold:
+            self._dying.add(slot)
+
+    def get_act_rate(self, slot):
+        return self._act_rate[slot]
+
+    def set_act_rate(self, slot, val):
+        self._act_rate[slot] = val
+
+    def get_reaction_rate(self, slot):
+        return self._reaction_rate[slot]
+
+    def set_reaction_rate(self, slot, val):
+        self._reaction_rate[slot] = val
+
+    def get_energy_capacity(self, slot):
+        return self._energy_capacity[slot]
+
+    def set_energy_capacity(self, slot, val):
+        """
+        Sets an organs energy capacity and updates the running capacity total if the organ counts toward it
+        """
+        if self._alive[slot] and self._health[slot] > 0:
+            self._capacity_total += val - self._energy_capacity[slot]
+        self._energy_capacity[slot] = val
+
+    def is_alive(self, slot):
+        return bool(self._alive[slot])
+
+    def set_alive(self, slot, alive=True):
+        """
+        Adds an organ to, or removes it from, the living organs and their running totals
+        """
+        if bool(self._alive[slot]) == alive:
+            return
+        self._alive[slot] = alive
+        health = self._health[slot]
+        if alive:
+            term = self._health_map(health)
+            self._health_terms[slot] = term
+            self._health_total += term
+            self._live_count += 1
+            if health > 0:
+                self._capacity_total += self._energy_capacity[slot]
+            if health < self._death_threshold:
+                self._dying.add(slot)
+        else:
+            self._health_total -= self._health_terms[slot]
+            self._health_terms[slot] = 0
+            self._live_count -= 1
+            if health > 0:
+                self._capacity_total -= self._energy_capacity[slot]
+            self._dying.discard(slot)
+            # Drop any rounding error that built up once nothing is left to count
+            if self._live_count == 0:
+                self._health_total = 0
+                self._capacity_total = 0
+
+    def accumulate(self, slot, column, value):
+        """
+        Adds a receptor output to the running total for one parameter of an organ
+        :param column: One of HEALTH_COLUMN, ACT_RATE_COLUMN or REACTION_RATE_COLUMN
+        """
+        self._receptor_sums[slot, column] += value
+        self._receptor_counts[slot, column] += 1
+
+    def clear_receptors(self, slot):
+        """
+        Resets the running receptor totals of an organ
+        """
+        self._receptor_sums[slot] = 0
+        self._receptor_counts[slot] = 0
+
+    def get_receptor_totals(self, slot):
+        """
+        Returns copies of the running receptor sums and counts of an organ
+        """
+        return self._receptor_sums[slot].copy(), self._receptor_counts[slot].copy()
+
+    def add_receptor_totals(self, slot, sums, counts):
+        """
+        Adds a batch of receptor sums and counts to an organ at once
+        """
+        self._receptor_sums[slot] += sums
+        self._receptor_counts[slot] += counts
+
+    def get_live_params(self):
+        """
+        Returns the health, activation rate and reaction rate of every living organ as one flat array
+        """
+        n = self._count
+        mask = self._alive[:n]
+        return np.concatenate((self._health[:n][mask], self._act_rate[:n][mask], self._reaction_rate[:n][mask]))
+
+    def update_params(self, slot):
+        """
+        Averages all receptor outputs for an organ and applies them to its parameters
+        """
+        averages = self._receptor_sums[slot] / np.maximum(self._receptor_counts[slot], 1)
+        self._reaction_rate[slot] = averages[REACTION_RATE_COLUMN]
+        self._act_rate[slot] = averages[ACT_RATE_COLUMN]
+        self.set_health(slot, health_decay(self._health[slot], averages[HEALTH_COLUMN]))
+
+    def remove_dead(self):
+        """
+        Flips the alive flag off for every organ whose health fell under the death threshold. Only organs flagged when their health crossed the threshold are checked.
+        :return: The number of organs that died
+        """
+        dead = [slot for slot in self._dying if self._health[slot] < self._death_threshold]
+        self._dying.clear()
+        for slot in dead:
+            self.set_alive(slot, False)
+        return len(dead)
+
+    def get_live_count(self):
+        """
+        Returns the number of living organs
+        """
+        return self._live_count
+
+    def get_average_health(self):
+        """
+        Returns the average mapped health of the living organs, or 0 when none are left
+        """
+        if self._live_count == 0:
+            return 0
+        return self._health_total/self._live_count
+
+    def get_live_energy_capacity(self):
+        """
+        Returns the total energy capacity of all living organs with health left
+        """
+        return self._capacity_total
+
+    def recompute_average_health(self):
+        """
+        Recomputes the average mapped health from scratch, used to check the running total
+        """
+        n = self._count
+        healths = self._health[:n][self._alive[:n]]
+        if len(healths) == 0:
+            return 0
+        return np.sum(self._health_map(healths))/len(healths)
+
+    def recompute_live_energy_capacity(self):
+        """
+        Recomputes the total energy capacity from scratch, used to check the running total
+        """
+        n = self._count
+        mask = self._alive[:n] & (self._health[:n] > 0)
+        return np.sum(self._energy_capacity[:n][mask])
+
 
 class Organ:
     """
@@ -12,21 +266,22 @@ class Organ:
         self._genes = []
         self._id = generate_id()
         self._owner = owner
-        self._health = 1
         self._parameters = []
-        self._energy_capacity = 1
-        
+        # Parameters live in the owners organ table, this organ only keeps its slot
+        self._table = owner.get_organ_table()
+        self._slot = self._table.add_row()
+
     def set_energy_capacity(self, number):
         """
         Sets the max energy this organ can store
         """
-        self._energy_capacity = number
+        self._table.set_energy_capacity(self._slot, number)
 
     def get_energy_capacity(self):
         """
         Gets the energy this organ stores
         """
-        return self._energy_capacity
+        return self._table.get_energy_capacity(self._slot)
 
     def get_energy_available(self):
         """
@@ -50,7 +305,7 @@ class Organ:
         """
         Increments energy capacity by the provided value
         """
-        self._energy_capacity += val
+        self._table.set_energy_capacity(self._slot, self._table.get_energy_capacity(self._slot) + val)
         
     def set_dna_head(self, node):
         """
@@ -72,6 +327,15 @@ class Organ:
     def get_id(self):
         return self._id
 
+    def get_slot(self):
+        """
+        Gets the row of the owners organ table that holds this organs parameters
+        """
+        return self._slot
+
+    def is_alive(self):
+        return self._table.is_alive(self._slot)
+
 class InternalOrgan(Organ):
     """
     Internal organs focus on managing bloodstream and chemicals
@@ -83,33 +347,30 @@ class InternalOrgan(Organ):
         """
         Sets the default health
         """
-        self._health = val
-        self._health_receptors = []
-        # Pairs the parameter name and the function to modify
-        self._parameters.append(('health', self.health_adjust))
+        self._table.set_health(self._slot, val)
+        # Pairs the parameter name and the organ table column receptors adjust
+        self._parameters.append(('health', HEALTH_COLUMN))
     
     def set_act_rate(self, act_rate):
         """
         Sets the activation rate for this organ (how often it gets activated by the owner)
         """
-        self._act_rate = act_rate
-        self._act_rate_receptors = []
-        # Pairs the parameter name and the function to modify
-        self._parameters.append(('activation rate', self.act_rate_adjust))
+        self._table.set_act_rate(self._slot, act_rate)
+        # Pairs the parameter name and the organ table column receptors adjust
+        self._parameters.append(('activation rate', ACT_RATE_COLUMN))
 
     def set_reaction_rate(self, rate):
         """
         Sets the reaction rate for this organ
         """
-        self._reaction_rate = rate
-        self._reaction_rate_receptors = []
-        self._parameters.append(('reaction rate', self.reaction_rate_adjust))
+        self._table.set_reaction_rate(self._slot, rate)
+        self._parameters.append(('reaction rate', REACTION_RATE_COLUMN))
     
     def get_genes(self):
         return self._genes
         
     def debug_set_health(self, val):
-        self._health = max(min(val,1),0)
+        self._table.set_health(self._slot, max(min(val,1),0))
         
     def get_param_numbers(self):
         return len(self._parameters)
@@ -119,28 +380,26 @@ class InternalOrgan(Organ):
 
     def read_health_from_gene(self, output):
         """
-        This is passed to the gene(hopefully space efficient) and it should add the output to a queue, which is then averaged
+        This is passed to the gene(hopefully space efficient) and it should add the output to a running total, which is then averaged
         """
-        self._health_receptors.append(output)
+        self._table.accumulate(self._slot, HEALTH_COLUMN, output)
 
     def read_act_rate_from_gene(self, output):
-        self._act_rate_receptors.append(output)
+        self._table.accumulate(self._slot, ACT_RATE_COLUMN, output)
 
     def read_reaction_rate_from_gene(self, output):
-        self._reaction_rate_receptors.append(output)
+        self._table.accumulate(self._slot, REACTION_RATE_COLUMN, output)
 
     def clear_receptors(self):
-        self._health_receptors = []
-        self._act_rate_receptors = []
-        self._reaction_rate_receptors = []
+        self._table.clear_receptors(self._slot)
     
     def get_parameter(self, param):
         if param == 'health':
-            return self._health
+            return self.get_health()
         if param == 'activation rate':
-            return self._act_rate
+            return self.get_act_rate()
         if param == 'reaction rate':
-            return self._reaction_rate
+            return self.get_reaction_rate()
             
     def release_chemical(self, chemical, amount):
         self._owner.add_chemical(chemical, amount)
@@ -148,23 +407,30 @@ class InternalOrgan(Organ):
     def consume_chemical(self, chemical, amount):
         self._owner.rem_chemical(chemical, amount)
 
+    def adjust_parameter(self, column, value):
+        """
+        Adds a receptor output to one of the organs parameters
+        :param column: One of HEALTH_COLUMN, ACT_RATE_COLUMN or REACTION_RATE_COLUMN, as paired in the organs parameters
+        """
+        self._table.accumulate(self._slot, column, value)
+
     def health_adjust(self, value):
-        self._health_receptors.append(value)
+        self._table.accumulate(self._slot, HEALTH_COLUMN, value)
 
     def act_rate_adjust(self, value):
-        self._health_receptors.append(value)
+        self._table.accumulate(self._slot, ACT_RATE_COLUMN, value)
 
     def reaction_rate_adjust(self, value):
-        self._health_receptors.append(value)
+        self._table.accumulate(self._slot, REACTION_RATE_COLUMN, value)
     
     def get_health(self):
-        return self._health
+        return self._table.get_health(self._slot)
 
     def get_act_rate(self):
-        return self._act_rate
+        return self._table.get_act_rate(self._slot)
 
     def get_reaction_rate(self):
-        return self._reaction_rate
+        return self._table.get_reaction_rate(self._slot)
 
     def get_concentration(self, chemical):
         return self._owner.get_concentration(chemical)
@@ -176,9 +442,17 @@ class InternalOrgan(Organ):
         return gene.adjust_parameter()
     
     def activate_organ(self):
+        """
+        Activates every gene in the organ and then updates its parameters
+        :return: A tuple with whether each reaction gene was able to react, in gene order
+        """
+        reacted = []
         for gene in self._genes:
-            self.activate_gene(gene)
+            result = self.activate_gene(gene)
+            if result is not None:
+                reacted.append(result)
         self.update_params()
+        return tuple(reacted)
     
     def activate_gene(self, gene):
         type = gene.get_type()
@@ -187,21 +461,20 @@ class InternalOrgan(Organ):
         elif type == 'emitter':
             gene.release_chemical()
         elif type == 'reaction':
-            if gene.check_for_requirements():
+            ready = gene.check_for_requirements()
+            if ready:
                 gene.react()
+            return ready
 
     def update_params(self):
-        self._reaction_rate = sum(self._reaction_rate_receptors) / max(len(self._reaction_rate_receptors),1)
-        self._act_rate = sum(self._act_rate_receptors) / max(len(self._act_rate_receptors), 1)
-        average_health_change = sum(self._health_receptors) / max(len(self._health_receptors), 1)
-        self._health = health_decay(self._health, average_health_change)
+        self._table.update_params(self._slot)
         
     def describe(self):
         """
         Provide a readout on all aspects of the organ, including parameters and genes
         """
         s1 = f"Organ {self._id}:\n"
-        s2 = f"\t This organ has Health: {self._health}, Activation Rate: {self._act_rate}, Reaction Rate: {self._reaction_rate}\n"
+        s2 = f"\t This organ has Health: {self.get_health()}, Activation Rate: {self.get_act_rate()}, Reaction Rate: {self.get_reaction_rate()}\n"
         s3 = f"\t This organ has {len(self._genes)} genes:\n"
         print(s1, s2, s3)
         for gene in self._genes:
@@ -210,7 +483,7 @@ class InternalOrgan(Organ):
 
     def status(self):
         s1 = f"Organ{self._id}\n"
-        s2 = f"Health: {self._health}\n"
-        s3 = f"Activation Rate: {self._act_rate}\n"
-        s4 = f"Reaction Rate: {self._reaction_rate}\n"
+        s2 = f"Health: {self.get_health()}\n"
+        s3 = f"Activation Rate: {self.get_act_rate()}\n"
+        s4 = f"Reaction Rate: {self.get_reaction_rate()}\n"
         print(s1, s2, s3, s4)
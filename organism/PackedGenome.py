@@ -0,0 +1,180 @@
+"""
+A genome stored as packed bits, 8 to a byte, instead of one ASCII b'0' or b'1' character per bit. Fields are read straight out of the packed bytes, so reading a few bits costs the same anywhere in the genome.
+Converts to and from the byte string form with from_bits and to_bits. Bits are numbered from the left, as in the byte strings.
+"""
+import numpy as np
+from RandomService import get_stream, MUTATION_STREAM
+
+class PackedGenome:
+    """
+    An immutable string of bits. Slicing, concatenation and flipping return new genomes, like bytes.
+    """
+    __slots__ = ('_data', '_length')
+
+    def __init__(self, data=b'', length=None):
+        """
+        :param data: The bits packed most significant first, any unused bits at the end of the last byte must be 0
+        :param length: The number of bits, defaults to every bit of data
+        """
+        self._data = bytes(data)
+        self._length = len(self._data)*8 if length is None else length
+
+    @classmethod
+    def from_int(cls, value, length):
+        """
+        Packs the lowest length bits of an int
+        """
+        if length == 0:
+            return cls()
+        pad = -length % 8
+        return cls(((value & ((1 << length)-1)) << pad).to_bytes((length+7)//8, 'big'), length)
+
+    @classmethod
+    def from_bits(cls, bits):
+        """
+        Packs a byte string of b'0' and b'1' characters
+        """
+        if isinstance(bits, PackedGenome):
+            return bits
+        if len(bits) == 0:
+            return cls()
+        return cls.from_int(int(bits, 2), len(bits))
+
+    @classmethod
+    def random(cls, length):
+        """
+        Makes a random genome of length bits from the mutation stream
+        """
+        data = get_stream(MUTATION_STREAM).get_generator().integers(0, 256, (length+7)//8, dtype='uint8').tobytes()
+        return cls.from_int(int.from_bytes(data, 'big') >> (-length % 8), length)
+
+    @classmethod
+    def join(cls, parts):
+        """
+        Concatenates a list of genomes or byte strings
+        """
+        if not parts:
+            return cls()
+        return cls.from_array(np.concatenate([cls.from_bits(part).to_array() if isinstance(part, PackedGenome) else np.frombuffer(part, dtype=np.uint8) - ord('0')
+                                              for part in parts]))
+
+    @classmethod
+    def from_array(cls, bits):
+        """
+        Packs a numpy array of 0 and 1
+        """
+        return cls(np.packbits(bits.astype(np.uint8)).tobytes(), len(bits))
+
+    def get_data(self):
+        """
+        Returns the packed bytes
+        """
+        return self._data
+
+    def to_int(self):
+        """
+        Returns the whole genome as an int
+        """
+        if self._length == 0:
+            return 0
+        return int.from_bytes(self._data, 'big') >> (-self._length % 8)
+
+    def to_array(self):
+        """
+        Returns the genome as a numpy array of 0 and 1
+        """
+        return np.unpackbits(np.frombuffer(self._data, dtype=np.uint8))[:self._length]
+
+    def to_bits(self):
+        """
+        Returns the genome as a byte string of b'0' and b'1' characters
+        """
+        if self._length == 0:
+            return b''
+        return format(self.to_int(), '0' + str(self._length) + 'b').encode('utf-8')
+
+    def get_int(self, pos, length):
+        """
+        Reads a field of length bits starting at pos as an unsigned int, only the bytes holding the field are touched
+        """
+        if length == 0:
+            return 0
+        if pos < 0 or pos + length > self._length:
+            raise IndexError("Field is outside the genome")
+        first = pos >> 3
+        last = (pos + length - 1) >> 3
+        chunk = int.from_bytes(self._data[first:last+1], 'big')
+        return (chunk >> ((last+1)*8 - pos - length)) & ((1 << length)-1)
+
+    def get_bits(self, pos, length):
+        """
+        Reads a field as a byte string of b'0' and b'1' characters, as read from an unpacked genome
+        """
+        if length == 0:
+            return b''
+        return format(self.get_int(pos, length), '0' + str(length) + 'b').encode('utf-8')
+
+    def get_bit(self, pos):
+        """
+        Returns a single bit as 0 or 1
+        """
+        if pos < 0:
+            pos += self._length
+        if not 0 <= pos < self._length:
+            raise IndexError("Bit is outside the genome")
+        return (self._data[pos >> 3] >> (7 - (pos & 7))) & 1
+
+    def flip(self, pos):
+        """
+        Returns a copy with the bit at pos flipped
+        """
+        return self.flip_bits([pos])
+
+    def flip_bits(self, positions):
+        """
+        Returns a copy with every bit in positions flipped, a position listed twice is flipped back
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions) and (positions.min() < 0 or positions.max() >= self._length):
+            raise IndexError("Bit is outside the genome")
+        data = np.frombuffer(self._data, dtype=np.uint8).copy()
+        np.bitwise_xor.at(data, positions >> 3, (0x80 >> (positions & 7)).astype(np.uint8))
+        return PackedGenome(data.tobytes(), self._length)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, key):
+        """
+        An int index gives the bit as 0 or 1, a slice gives a new genome
+        """
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._length)
+            if step != 1:
+                raise ValueError("Genome slices can't have a step")
+            if stop <= start:
+                return PackedGenome()
+            return PackedGenome.from_int(self.get_int(start, stop-start), stop-start)
+        return self.get_bit(key)
+
+    def __add__(self, other):
+        if not isinstance(other, (PackedGenome, bytes)):
+            return NotImplemented
+        other = PackedGenome.from_bits(other)
+        return PackedGenome.from_int((self.to_int() << len(other)) | other.to_int(), self._length + len(other))
+
+    def __radd__(self, other):
+        if not isinstance(other, bytes):
+            return NotImplemented
+        return PackedGenome.from_bits(other) + self
+
+    def __eq__(self, other):
+        if not isinstance(other, PackedGenome):
+            return NotImplemented
+        return self._length == other._length and self._data == other._data
+
+    def __hash__(self):
+        return hash((self._length, self._data))
+
+    def __repr__(self):
+        return f"PackedGenome({self.to_bits()!r})"
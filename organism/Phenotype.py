@@ -0,0 +1,503 @@
+"""
+A decoded phenotype as plain data. The decoder fills numpy tables of organs, genes, reaction terms and lobes, and the weights and activation codes of every neural net, straight from the fields it reads. Nothing in the tables refers to a live object, so a phenotype is cheap to pickle, hash and cache.
+Backends build from the tables: build_organism makes the Body, organs, genes, brain and lobes the simulation runs, and build_net makes compiled nets without going through BrainNodes.
+"""
+import hashlib
+import pickle
+import time
+import numpy as np
+from utilities import functions, func_names, bits_needed
+from Body import Body
+from Organ import InternalOrgan
+from BioChemGene import Receptor, Emitter, Reaction
+from Brain import BrainNode, Brain, ChemLobe, FoodLobe, FoodChemLobe, EnergyLobe, linr, relu, tanh, sigmoid
+from Genome import GenomeBuffer
+from PackedGenome import PackedGenome
+from CompiledBrain import CompiledNet, QuantizedNet, WEIGHT_SCALE
+import CompiledBrain
+import BrainPruning
+
+# Columns of the organ table, rates are the raw 5 bit fields
+ORGAN_NODE = 0
+ORGAN_REACTION_RATE = 1
+ORGAN_ACT_RATE = 2
+ORGAN_COLUMNS = 3
+
+# Kinds of gene, in the order the decoder reads them
+RECEPTOR = 0
+EMITTER = 1
+REACTION = 2
+GENE_CLASSES = [(Receptor, 'receptor'), (Emitter, 'emitter'), (Reaction, 'reaction')]
+
+# Columns of the gene table, every field is the raw value read from the genome
+GENE_ORGAN = 0
+GENE_NODE = 1
+GENE_KIND = 2
+GENE_FUNC = 3
+GENE_ARGS = 4 # Two columns, the parameters of the activation function
+GENE_PARAM = 6
+GENE_CHEM = 7
+GENE_RATE = 8
+GENE_LEFT = 9
+GENE_RIGHT = 10
+GENE_TERMS_START = 11
+GENE_TERMS_END = 12
+GENE_COLUMNS = 13
+
+# Columns of the reaction term table
+TERM_COEFFICIENT = 0
+TERM_CHEM = 1
+TERM_COLUMNS = 2
+
+# Kinds of lobe, in the order the decoder reads them, the brain itself is the first row of the lobe table
+CHEM_LOBE = 0
+FOOD_LOBE = 1
+FOOD_CHEM_LOBE = 2
+ENERGY_LOBE = 3
+BRAIN = 4
+LOBE_CLASSES = [ChemLobe, FoodLobe, FoodChemLobe, EnergyLobe]
+
+# Columns of the lobe table, nets are stored layer by layer from the weight and code offsets
+LOBE_NODE = 0
+LOBE_KIND = 1
+LOBE_LAYERS = 2
+LOBE_WIDTH = 3
+LOBE_PARAM = 4
+LOBE_WEIGHTS = 5
+LOBE_CODES = 6
+LOBE_COLUMNS = 7
+
+NODE_FUNCTIONS = [linr, relu, tanh, sigmoid]
+NODE_BIAS = .01
+# Weights are read as 6 bit fields, stored as numerators over 32
+WEIGHT_OFFSET = 31
+
+def lobe_direction(param):
+    """
+    Gets the direction a FoodLobe looks in from its raw parameter, which has always been parsed from the bits as a decimal number
+    """
+    param = int(format(param, '06b'))
+    return [(param % 8) % 5 - 2, (param // 8) % 5 - 2]
+
+
+class PhenotypeIR:
+    """
+    The tables of one decoded phenotype, and the genomes and structure offsets they were read from
+    """
+    def __init__(self, organs, capacities, genes, terms, lobes, weights, codes, body_genome, body_offsets, brain_genome=None, brain_offsets=None):
+        """
+        :param organs: (organs, ORGAN_COLUMNS) int array
+        :param capacities: (organs,) array of the energy capacity of each organ
+        :param genes: (genes, GENE_COLUMNS) int array, in the order the genes are added to their organs
+        :param terms: (terms, TERM_COLUMNS) int array of the coefficient and chemical of every reaction term
+        :param lobes: (lobes, LOBE_COLUMNS) int array, the brain first, empty if there is no brain
+        :param weights: int8 array of every weight numerator of every net
+        :param codes: int8 array of every activation code of every net
+        :param body_genome: The body genome as a byte string or PackedGenome
+        :param body_offsets: The structure offsets of the body genome, see GenomeBuffer
+        """
+        self._organs = organs
+        self._capacities = capacities
+        self._genes = genes
+        self._terms = terms
+        self._lobes = lobes
+        self._weights = weights
+        self._codes = codes
+        self._body_genome = body_genome
+        self._body_offsets = body_offsets
+        self._brain_genome = brain_genome
+        self._brain_offsets = brain_offsets
+        # The buffers are made once and shared by every organism built from this phenotype
+        self._buffers = None
+        self._key = None
+
+    def __getstate__(self):
+        """
+        Only the tables and genomes are pickled, the buffers are rebuilt from them. Byte string genomes are pickled packed, 8 bits to a byte
+        """
+        state = self.__dict__.copy()
+        state['_buffers'] = None
+        state['_unpacked'] = []
+        for name in ('_body_genome', '_brain_genome'):
+            if isinstance(state[name], bytes):
+                state[name] = PackedGenome.from_bits(state[name])
+                state['_unpacked'].append(name)
+        return state
+
+    def __setstate__(self, state):
+        for name in state.pop('_unpacked', []):
+            state[name] = state[name].to_bits()
+        self.__dict__.update(state)
+
+    def build(self, organism=None):
+        """
+        Builds the live organism of the phenotype, see build_organism
+        """
+        return build_organism(self, organism)
+
+    def get_organs(self):
+        return self._organs
+
+    def get_capacities(self):
+        return self._capacities
+
+    def get_genes(self):
+        return self._genes
+
+    def get_terms(self):
+        return self._terms
+
+    def get_lobes(self):
+        return self._lobes
+
+    def get_weights(self):
+        return self._weights
+
+    def get_codes(self):
+        return self._codes
+
+    def has_brain(self):
+        return len(self._lobes) > 0
+
+    def get_buffers(self):
+        """
+        Returns the GenomeBuffers of the body and brain genomes, the brain one is None without a brain
+        """
+        if self._buffers is None:
+            body = GenomeBuffer(self._body_genome, self._body_offsets)
+            brain = None if self._brain_genome is None else GenomeBuffer(self._brain_genome, self._brain_offsets)
+            self._buffers = (body, brain)
+        return self._buffers
+
+    def set_buffers(self, body, brain):
+        """
+        Sets the buffers the decoder recorded the offsets in, so they are not made again
+        """
+        self._buffers = (body, brain)
+
+    def get_net(self, row):
+        """
+        Gets the weight numerators and activation codes of the net of one row of the lobe table
+        :return: A (layers, width, width) int8 array and a (layers, width) int8 array
+        """
+        layers, width = self._lobes[row, LOBE_LAYERS], self._lobes[row, LOBE_WIDTH]
+        weights = self._lobes[row, LOBE_WEIGHTS]
+        codes = self._lobes[row, LOBE_CODES]
+        return (self._weights[weights:weights + layers*width*width].reshape(layers, width, width),
+                self._codes[codes:codes + layers*width].reshape(layers, width))
+
+    def get_terms_before(self, gene):
+        """
+        Returns the number of reaction terms belonging to the genes before a row of the gene table
+        """
+        reactions = np.flatnonzero(self._genes[gene:, GENE_KIND] == REACTION)
+        if len(reactions):
+            return int(self._genes[gene + reactions[0], GENE_TERMS_START])
+        return len(self._terms)
+
+    def get_net_bounds(self, row):
+        """
+        Returns where the weights and codes of a row of the lobe table start, the ends of the arrays past the last row
+        """
+        if row < len(self._lobes):
+            return int(self._lobes[row, LOBE_WEIGHTS]), int(self._lobes[row, LOBE_CODES])
+        return len(self._weights), len(self._codes)
+
+    def get_key(self):
+        """
+        Hashes the tables, two phenotypes with the same key make organisms that behave the same. Noncoding DNA is not part of the key
+        """
+        if self._key is None:
+            hasher = hashlib.blake2b(digest_size=16)
+            for array in (self._organs, self._capacities, self._genes, self._terms, self._lobes, self._weights, self._codes):
+                hasher.update(repr(array.shape).encode('utf-8'))
+                hasher.update(np.ascontiguousarray(array).tobytes())
+            self._key = hasher.digest()
+        return self._key
+
+    def __eq__(self, other):
+        if not isinstance(other, PhenotypeIR):
+            return NotImplemented
+        return self.get_key() == other.get_key()
+
+    def __hash__(self):
+        return hash(self.get_key())
+
+    def get_nbytes(self):
+        """
+        Returns the memory used by the tables
+        """
+        return sum(array.nbytes for array in (self._organs, self._capacities, self._genes, self._terms, self._lobes, self._weights, self._codes))
+
+
+class PhenotypeBuilder:
+    """
+    Collects the rows of the tables as the decoder reads them
+    """
+    def __init__(self):
+        self._organs = []
+        self._capacities = []
+        self._genes = []
+        self._terms = []
+        self._lobes = []
+        self._weights = []
+        self._codes = []
+
+    def add_organ(self, node):
+        """
+        Adds an organ read from a structure of the body genome
+        :return: The row of the organ
+        """
+        self._organs.append([node, 0, 0])
+        self._capacities.append(1)
+        return len(self._organs) - 1
+
+    def set_organ(self, organ, column, value):
+        self._organs[organ][column] = value
+
+    def add_energy_capacity(self, organ, amount):
+        self._capacities[organ] += amount
+
+    def add_gene(self, organ, node, kind):
+        """
+        Adds a gene to an organ
+        :return: The row of the gene
+        """
+        row = [0] * GENE_COLUMNS
+        row[GENE_ORGAN] = organ
+        row[GENE_NODE] = node
+        row[GENE_KIND] = kind
+        self._genes.append(row)
+        return len(self._genes) - 1
+
+    def set_gene(self, gene, column, value):
+        self._genes[gene][column] = value
+
+    def add_terms(self, gene, terms):
+        """
+        Adds the terms of a reaction gene
+        :param terms: A list of (coefficient, chemical) pairs
+        """
+        self._genes[gene][GENE_TERMS_START] = len(self._terms)
+        self._terms.extend(terms)
+        self._genes[gene][GENE_TERMS_END] = len(self._terms)
+
+    def add_lobe(self, node, kind, layers, width, param=0):
+        """
+        Adds a lobe, or the brain, its net is added node by node afterwards
+        :return: The row of the lobe
+        """
+        self._lobes.append([node, kind, layers, width, param, len(self._weights), len(self._codes)])
+        return len(self._lobes) - 1
+
+    def add_net_node(self, code, numerators):
+        """
+        Adds a node to the net of the last lobe
+        :param code: The activation code of the node
+        :param numerators: The weight numerators of its outputs
+        """
+        self._codes.append(code)
+        self._weights.extend(numerators)
+
+    def get_counts(self):
+        """
+        Returns the number of organ, gene, term and lobe rows so far
+        """
+        return len(self._organs), len(self._genes), len(self._terms), len(self._lobes)
+
+    def copy_body(self, ir, first, last, node):
+        """
+        Appends the organ, gene and term rows a parent phenotype read from a run of structures of its body genome, renumbered to follow the rows read so far
+        :param ir: The PhenotypeIR of the parent
+        :param first: The index of the first structure of the run in the parent
+        :param last: The index of the structure after the run
+        :param node: The index the first structure of the run has in the child
+        """
+        organs = np.searchsorted(ir.get_organs()[:, ORGAN_NODE], [first, last])
+        genes = np.searchsorted(ir.get_genes()[:, GENE_NODE], [first, last])
+        terms = (ir.get_terms_before(genes[0]), ir.get_terms_before(genes[1]))
+        organ_rows = ir.get_organs()[organs[0]:organs[1]].copy()
+        organ_rows[:, ORGAN_NODE] += node - first
+        gene_rows = ir.get_genes()[genes[0]:genes[1]].copy()
+        gene_rows[:, GENE_NODE] += node - first
+        # Genes before the first organ of the run belong to the current organ, which is the last organ on both sides
+        gene_rows[:, GENE_ORGAN] += len(self._organs) - organs[0]
+        reactions = gene_rows[:, GENE_KIND] == REACTION
+        gene_rows[reactions, GENE_TERMS_START:GENE_TERMS_END+1] += len(self._terms) - terms[0]
+        self._organs.extend(organ_rows.tolist())
+        self._capacities.extend(ir.get_capacities()[organs[0]:organs[1]].tolist())
+        self._genes.extend(gene_rows.tolist())
+        self._terms.extend(ir.get_terms()[terms[0]:terms[1]].tolist())
+
+    def copy_brain(self, ir, first, last, node):
+        """
+        Appends the lobe rows and nets a parent phenotype read from a run of structures of its brain genome, renumbered to follow the rows read so far
+        """
+        lobes = np.searchsorted(ir.get_lobes()[:, LOBE_NODE], [first, last])
+        weights, codes = zip(ir.get_net_bounds(lobes[0]), ir.get_net_bounds(lobes[1]))
+        lobe_rows = ir.get_lobes()[lobes[0]:lobes[1]].copy()
+        lobe_rows[:, LOBE_NODE] += node - first
+        lobe_rows[:, LOBE_WEIGHTS] += len(self._weights) - weights[0]
+        lobe_rows[:, LOBE_CODES] += len(self._codes) - codes[0]
+        self._lobes.extend(lobe_rows.tolist())
+        self._weights.extend(ir.get_weights()[weights[0]:weights[1]].tolist())
+        self._codes.extend(ir.get_codes()[codes[0]:codes[1]].tolist())
+
+    def finish(self, body_buffer, brain_buffer=None):
+        """
+        Packs the rows into a PhenotypeIR
+        :param body_buffer: The frozen GenomeBuffer of the body genome
+        :param brain_buffer: The frozen GenomeBuffer of the brain genome, if there is one
+        """
+        ir = PhenotypeIR(np.array(self._organs, dtype=np.int32).reshape(-1, ORGAN_COLUMNS),
+                         np.array(self._capacities, dtype=float),
+                         np.array(self._genes, dtype=np.int32).reshape(-1, GENE_COLUMNS),
+                         np.array(self._terms, dtype=np.int32).reshape(-1, TERM_COLUMNS),
+                         np.array(self._lobes, dtype=np.int32).reshape(-1, LOBE_COLUMNS),
+                         np.array(self._weights, dtype=np.int8),
+                         np.array(self._codes, dtype=np.int8),
+                         body_buffer.get_genome(), body_buffer.get_offsets(),
+                         None if brain_buffer is None else brain_buffer.get_genome(),
+                         None if brain_buffer is None else brain_buffer.get_offsets())
+        ir.set_buffers(body_buffer, brain_buffer)
+        return ir
+
+
+def build_net(ir, row, quantized=None):
+    """
+    Builds the compiled net of one row of the lobe table straight from the weight arrays
+    :param quantized: If True the net is a QuantizedNet, defaults to CompiledBrain.QUANTIZED
+    """
+    if quantized is None:
+        quantized = CompiledBrain.QUANTIZED
+    numerators, codes = ir.get_net(row)
+    biases = [np.full(codes.shape[1], NODE_BIAS) for _ in range(len(codes))]
+    if quantized:
+        return QuantizedNet(list(numerators), biases, list(codes))
+    return CompiledNet([layer * WEIGHT_SCALE for layer in numerators.astype(float)], biases, list(codes))
+
+def build_layers(ir, row):
+    """
+    Builds the hidden layers of BrainNodes of one row of the lobe table
+    """
+    numerators, codes = ir.get_net(row)
+    hidden_layers = []
+    for layer_weights, layer_codes in zip(numerators.tolist(), codes.tolist()):
+        layer = []
+        for weights, code in zip(layer_weights, layer_codes):
+            node = BrainNode()
+            node.set_function(NODE_FUNCTIONS[code])
+            node.set_weights([weight/32 for weight in weights])
+            layer.append(node)
+        hidden_layers.append(layer)
+    return hidden_layers
+
+def build_brain(ir, owner, buffer):
+    """
+    Builds the brain and its lobes, with their compiled nets
+    """
+    lobes = ir.get_lobes()
+    brain = Brain()
+    brain.set_owner(owner)
+    brain.set_num_layers(int(lobes[0, LOBE_LAYERS]))
+    brain.set_width_layers(int(lobes[0, LOBE_WIDTH]))
+    for layer in build_layers(ir, 0):
+        brain.add_layer(layer)
+    brain.set_dna_head(buffer.get_view(int(lobes[0, LOBE_NODE])))
+    brain.set_compiled(build_net(ir, 0))
+    for row in range(1, len(lobes)):
+        node, kind, layers, width, param = (int(val) for val in lobes[row, :LOBE_WEIGHTS])
+        lobe = LOBE_CLASSES[kind]()
+        lobe.set_owner(owner)
+        lobe.set_width_layers(width)
+        lobe.set_num_layers(layers)
+        if kind == CHEM_LOBE or kind == FOOD_CHEM_LOBE:
+            lobe.set_chem(param % 16)
+        if kind == FOOD_LOBE:
+            lobe.set_direction(lobe_direction(param))
+        for layer in build_layers(ir, row):
+            lobe.add_layer(layer)
+        if kind == FOOD_CHEM_LOBE:
+            brain.add_food_chem_lobe(lobe)
+        elif kind == FOOD_LOBE:
+            brain.add_sensory_lobe(lobe)
+        else:
+            brain.add_internal_lobe(lobe)
+        lobe.set_dna_head(buffer.get_view(node))
+        lobe.set_compiled(build_net(ir, row))
+    if BrainPruning.PRUNE:
+        BrainPruning.prune_brain(brain)
+    return brain
+
+def build_gene(ir, row, organ, buffer):
+    """
+    Builds one gene of an organ
+    """
+    fields = ir.get_genes()[row].tolist()
+    gene_class, name = GENE_CLASSES[fields[GENE_KIND]]
+    gene = gene_class(organ, name)
+    if fields[GENE_KIND] == REACTION:
+        gene.set_num_of_chems_left(fields[GENE_LEFT])
+        gene.set_num_of_chems_right(fields[GENE_RIGHT])
+        terms = ir.get_terms()[fields[GENE_TERMS_START]:fields[GENE_TERMS_END]].tolist()
+        gene.set_chems_and_coefficients([tuple(term) for term in terms])
+    else:
+        if fields[GENE_KIND] == EMITTER:
+            gene.set_output_rate(fields[GENE_RATE])
+        func = fields[GENE_FUNC]
+        args = fields[GENE_ARGS:GENE_ARGS + len(bits_needed[func])]
+        gene.set_activation(func_names[func], functions[func](*args))
+        p = organ.get_param_at_index(fields[GENE_PARAM] % organ.get_param_numbers())
+        gene.set_parameter(p[0], p[1])
+        gene.set_chemical(fields[GENE_CHEM])
+    gene.set_dna_head(buffer.get_view(fields[GENE_NODE]))
+    return gene
+
+def build_organism(ir, organism=None):
+    """
+    Builds the live organism of a phenotype, the same object graph the decoder used to build as it read
+    :param organism: A new Body() to build into, one is made if not given
+    :return: The creature of type Body()
+    """
+    body_buffer, brain_buffer = ir.get_buffers()
+    if organism is None:
+        organism = Body()
+    organism.set_tables(ir)
+    organism.set_dna_head(body_buffer.get_head())
+    organ_genes = [[] for _ in range(len(ir.get_organs()))]
+    for gene, organ in enumerate(ir.get_genes()[:, GENE_ORGAN].tolist()):
+        organ_genes[organ].append(gene)
+    for row, (fields, capacity) in enumerate(zip(ir.get_organs().tolist(), ir.get_capacities().tolist())):
+        organ = InternalOrgan('internal', organism)
+        organ.set_def_health()
+        organ.set_reaction_rate(fields[ORGAN_REACTION_RATE]/32)
+        organ.set_act_rate(fields[ORGAN_ACT_RATE]/32)
+        organ.set_energy_capacity(capacity)
+        for gene in organ_genes[row]:
+            organ.add_gene(build_gene(ir, gene, organ, body_buffer))
+        organ.set_dna_head(body_buffer.get_view(fields[ORGAN_NODE]))
+        organism.add_organ(organ)
+    if ir.has_brain():
+        organism.set_brain(build_brain(ir, organism, brain_buffer))
+    return organism
+
+
+def pickle_benchmark(organisms, repeats=3):
+    """
+    Measures pickling organisms, as they would be sent to worker processes
+    :param organisms: A list of organisms
+    :param repeats: How many times the whole list is pickled and loaded
+    :return: A dict of the mean bytes per organism and the mean seconds to pickle and load one
+    """
+    total_bytes = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for organism in organisms:
+            data = pickle.dumps(organism, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.loads(data)
+            total_bytes += len(data)
+    elapsed = time.perf_counter() - start
+    count = max(len(organisms) * repeats, 1)
+    return {'organisms': len(organisms),
+            'bytes per organism': total_bytes/count,
+            'round trip seconds': elapsed/count}
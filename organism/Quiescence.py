@@ -0,0 +1,163 @@
+"""
+An optional fast path for organisms whose biochemistry has settled. Once the concentrations the genes sense and the organ parameters stop changing, every activation of an organ releases the same chemicals and feeds its receptors the same values. The effect of one activation is recorded and replayed instead of evaluating each gene again, until something from outside (eating, moving) or drift past the tolerance wakes the organism back up.
+"""
+import numpy as np
+import Chemicals
+
+QUIESCENCE_TOLERANCE = 1e-6
+SETTLE_TICKS = 3
+
+class OrganRecord:
+    """
+    The effect of a single organ activation, saved so that it can be replayed
+    """
+    def __init__(self, chem_delta, receptor_sums, receptor_counts, reacted):
+        """
+        :param chem_delta: Array of the change in units of each chemical
+        :param receptor_sums: The receptor outputs added to the organs running totals
+        :param receptor_counts: The number of receptor outputs added for each parameter
+        :param reacted: Tuple of whether each reaction gene reacted
+        """
+        self._chem_delta = [(Chemicals.CHEMS[i], chem_delta[i]) for i in np.flatnonzero(chem_delta)]
+        self._receptor_sums = receptor_sums
+        self._receptor_counts = receptor_counts
+        self._reacted = reacted
+
+    def get_reacted(self):
+        return self._reacted
+
+    def replay(self, body, organ):
+        """
+        Applies the recorded chemical changes and receptor outputs, then updates the organs parameters as a real activation would
+        """
+        for chem, amount in self._chem_delta:
+            if amount > 0:
+                body.add_chemical(chem, amount)
+            else:
+                body.rem_chemical(chem, -amount)
+        body.get_organ_table().add_receptor_totals(organ.get_slot(), self._receptor_sums, self._receptor_counts)
+        organ.update_params()
+
+
+class QuiescenceTracker:
+    """
+    Watches one organism for a biochemical fixed point and replays organ activations while it holds
+    """
+    def __init__(self, tolerance=QUIESCENCE_TOLERANCE, settle_ticks=SETTLE_TICKS):
+        """
+        :param tolerance: The largest change in any concentration or organ parameter that still counts as unchanged
+        :param settle_ticks: How many ticks the state has to hold before activations are replayed
+        """
+        self._tolerance = tolerance
+        self._settle_ticks = settle_ticks
+        self._records = {}
+        self._reaction_genes = {}
+        self._anchor_concentrations = None
+        self._anchor_params = None
+        self._steady_ticks = 0
+
+        # Statistics
+        self._ticks = 0
+        self._skipped_ticks = 0
+        self._replayed = 0
+        self._evaluated = 0
+
+    def __getstate__(self):
+        """
+        The reaction genes are looked up again from the organ, so pickling the tracker never pulls in the organism
+        """
+        state = dict(vars(self))
+        state['_reaction_genes'] = {}
+        return state
+
+    def is_quiescent(self):
+        return self._steady_ticks >= self._settle_ticks
+
+    def wake(self):
+        """
+        Drops every record and starts watching for a fixed point again. Called whenever an input changes.
+        """
+        self._steady_ticks = 0
+        self._records = {}
+        self._anchor_concentrations = None
+        self._anchor_params = None
+
+    def activate(self, body, organ):
+        """
+        Activates one organ, replaying its record if the organism is quiescent and the organs reactions would go the same way
+        :return: True if the activation was replayed
+        """
+        slot = organ.get_slot()
+        record = self._records.get(slot) if self.is_quiescent() else None
+        if record is not None and record.get_reacted() == self._check_reactions(organ):
+            record.replay(body, organ)
+            self._replayed += 1
+            return True
+        self._records[slot] = self._record(body, organ)
+        self._evaluated += 1
+        return False
+
+    def _check_reactions(self, organ):
+        """
+        Reactions depend on the units of a chemical rather than the concentration, so they are rechecked before a replay
+        """
+        genes = self._reaction_genes.get(organ.get_slot())
+        if genes is None:
+            genes = [gene for gene in organ.get_genes() if gene.get_type() == 'reaction']
+            self._reaction_genes[organ.get_slot()] = genes
+        return tuple(gene.check_for_requirements() for gene in genes)
+
+    def _record(self, body, organ):
+        """
+        Activates the organ for real and records what it changed
+        """
+        table = body.get_organ_table()
+        slot = organ.get_slot()
+        chems = body.get_chem_vector()
+        sums, counts = table.get_receptor_totals(slot)
+        reacted = organ.activate_organ()
+        new_sums, new_counts = table.get_receptor_totals(slot)
+        return OrganRecord(body.get_chem_vector() - chems, new_sums - sums, new_counts - counts, reacted)
+
+    def end_tick(self, body, skipped):
+        """
+        Compares what the genes sense against the state the organism settled at, and counts the tick
+        :param skipped: True if organ activations were replayed this tick and no gene had to be evaluated
+        """
+        self._ticks += 1
+        if skipped:
+            self._skipped_ticks += 1
+        concentrations = body.get_concentration_vector()
+        params = body.get_organ_table().get_live_params()
+        if (self._anchor_concentrations is not None and len(params) == len(self._anchor_params)
+                and np.all(np.abs(concentrations - self._anchor_concentrations) <= self._tolerance)
+                and np.all(np.abs(params - self._anchor_params) <= self._tolerance)):
+            self._steady_ticks += 1
+        else:
+            self.wake()
+            self._anchor_concentrations = concentrations
+            self._anchor_params = params
+
+    def get_stats(self):
+        """
+        Returns how many organism ticks and organ activations were skipped
+        """
+        return {'ticks': self._ticks,
+                'skipped ticks': self._skipped_ticks,
+                'skipped fraction': self._skipped_ticks/max(self._ticks, 1),
+                'replayed activations': self._replayed,
+                'evaluated activations': self._evaluated}
+
+
+def skipped_fraction(organisms):
+    """
+    Gets the fraction of organism ticks skipped across a population
+    """
+    ticks = 0
+    skipped = 0
+    for organism in organisms:
+        stats = organism.get_quiescence_stats()
+        if stats is not None:
+            ticks += stats['ticks']
+            skipped += stats['skipped ticks']
+    return skipped/max(ticks, 1)
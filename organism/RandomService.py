@@ -0,0 +1,177 @@
+"""
+Hands out random numbers for the simulation from one numpy Generator per subsystem. Each stream pre-generates a block of values and refills the whole block at once when it runs out, which is much cheaper than drawing numbers one at a time from the random module.
+Streams are derived from a single seed, so a run can be reproduced by seeding the service, and independent services can be spawned for worker processes.
+"""
+import zlib
+import numpy as np
+
+BLOCK_SIZE = 4096
+
+# Names of the subsystems that draw random numbers
+ORGAN_STREAM = 'organs'
+FOOD_STREAM = 'food'
+WORLD_STREAM = 'world'
+MUTATION_STREAM = 'mutation'
+
+class RandomStream:
+    """
+    A stream of random numbers for one subsystem. Values come out of pre-generated blocks which are refilled in bulk.
+    """
+    def __init__(self, generator, block_size=BLOCK_SIZE):
+        self._generator = generator
+        self._block_size = block_size
+        self._uniforms = []
+        self._uniform_pos = 0
+        # Binomial blocks are kept per (n, p) pair
+        self._binomials = {}
+
+    def get_generator(self):
+        """
+        Returns the underlying numpy Generator, for draws that don't fit the block methods
+        """
+        return self._generator
+
+    def _refill_uniforms(self, count=0):
+        """
+        Draws a new block of uniforms, keeping any values not yet handed out
+        """
+        left = self._uniforms[self._uniform_pos:]
+        self._uniforms = left + self._generator.random(max(self._block_size, count)).tolist()
+        self._uniform_pos = 0
+
+    def random(self):
+        """
+        Returns a single float in [0, 1)
+        """
+        if self._uniform_pos >= len(self._uniforms):
+            self._refill_uniforms()
+        val = self._uniforms[self._uniform_pos]
+        self._uniform_pos += 1
+        return val
+
+    def uniforms(self, count):
+        """
+        Returns a list of count floats in [0, 1)
+        """
+        if self._uniform_pos + count > len(self._uniforms):
+            self._refill_uniforms(count)
+        vals = self._uniforms[self._uniform_pos:self._uniform_pos+count]
+        self._uniform_pos += count
+        return vals
+
+    def uniform(self, low, high):
+        """
+        Returns a float in [low, high)
+        """
+        return low + (high-low) * self.random()
+
+    def randint(self, low, high):
+        """
+        Returns an integer in [low, high], inclusive like random.randint
+        """
+        return low + int(self.random() * (high-low+1))
+
+    def choice(self, options):
+        """
+        Picks a random item from a sequence
+        """
+        return options[int(self.random() * len(options))]
+
+    def sample(self, population, k):
+        """
+        Picks k distinct positions out of range(population)
+        """
+        return self._generator.choice(population, k, replace=False).tolist()
+
+    def binomial(self, n, p):
+        """
+        Returns a single binomial draw, taken from a pre-generated block for this (n, p)
+        """
+        key = (n, p)
+        block = self._binomials.get(key)
+        if block is None or block[1] >= len(block[0]):
+            block = [self._generator.binomial(n, p, self._block_size).tolist(), 0]
+            self._binomials[key] = block
+        val = block[0][block[1]]
+        block[1] += 1
+        return val
+
+    def binomials(self, trials, p):
+        """
+        Returns one binomial draw for each entry of trials, as an array
+        :param p: The probability of each trial, one for all of them or one per entry
+        """
+        return self._generator.binomial(trials, p)
+
+
+class RandomService:
+    """
+    Holds one RandomStream per subsystem, all derived from a single seed
+    """
+    def __init__(self, seed=None, block_size=BLOCK_SIZE):
+        """
+        :param seed: An int, None for fresh entropy, or a numpy SeedSequence (used when spawning)
+        """
+        self._block_size = block_size
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """
+        Reseeds the service, discarding every existing stream
+        """
+        if isinstance(seed, np.random.SeedSequence):
+            self._seed_sequence = seed
+        else:
+            self._seed_sequence = np.random.SeedSequence(seed)
+        self._streams = {}
+
+    def get_seed_sequence(self):
+        return self._seed_sequence
+
+    def get_stream(self, name):
+        """
+        Gets the stream for a subsystem, creating it on first use. The stream depends only on the seed and the name, not on the order streams are requested in.
+        """
+        stream = self._streams.get(name)
+        if stream is None:
+            seq = np.random.SeedSequence(self._seed_sequence.entropy,
+                                         spawn_key=self._seed_sequence.spawn_key + (zlib.crc32(name.encode('utf-8')),))
+            stream = RandomStream(np.random.default_rng(seq), self._block_size)
+            self._streams[name] = stream
+        return stream
+
+    def spawn(self, count):
+        """
+        Creates independent services, one per worker
+        :return: A list of count RandomService objects
+        """
+        return [RandomService(seq, self._block_size) for seq in self._seed_sequence.spawn(count)]
+
+
+# The service shared by the whole simulation
+SERVICE = RandomService()
+
+def get_stream(name):
+    """
+    Gets a stream from the shared service
+    """
+    return SERVICE.get_stream(name)
+
+def seed(val=None):
+    """
+    Reseeds the shared service
+    """
+    SERVICE.seed(val)
+
+def spawn(count):
+    """
+    Spawns independent services from the shared one, for worker processes
+    """
+    return SERVICE.spawn(count)
+
+def set_service(service):
+    """
+    Replaces the shared service, a worker calls this with the service it was handed
+    """
+    global SERVICE
+    SERVICE = service
@@ -5,7 +5,8 @@ from Body import *
 from Constructor import *
 from utilities import *
 from Genome import *
-import random
+from RandomService import get_stream, MUTATION_STREAM
+import numpy as np
 
 MUTATION_RATE = .002
 START_FLIP_DIVISOR = 20
@@ -18,30 +19,74 @@ CROSSOVER_RATE = .1
 
 # PARTHENOGENIC METHODS
 def flip_at(pos, strand):
+    if isinstance(strand, PackedGenome):
+        return strand.flip(pos)
     val = int(strand[pos])-48
     chg = val^1
     strand = strand[:pos]+chr(chg+48).encode('utf-8')+strand[pos+1:]
     return strand
 
+def flip_positions(genome, positions):
+    """
+    Flips every bit in positions in a single copy of the genome, the genome itself is not changed
+    :param genome: A byte string or PackedGenome
+    """
+    if isinstance(genome, PackedGenome):
+        return genome.flip_bits(positions)
+    bits = np.frombuffer(genome, dtype=np.uint8).copy()
+    np.bitwise_xor.at(bits, np.asarray(positions, dtype=np.int64), 1) # b'0' and b'1' differ in the lowest bit
+    return bits.tobytes()
+
+def sample_positions(starts, lengths, counts):
+    """
+    Picks counts[i] distinct positions in each region i, for every region at once. Positions are drawn with replacement and any repeat within a region is drawn again, which leaves every set of positions equally likely.
+    :param starts: The first position of each region, as an array
+    :param lengths: The length of each region, as an array
+    :param counts: How many positions to pick in each region, at most its length
+    :return: The region of every position and the positions, sorted by region and then position
+    """
+    stream = get_stream(MUTATION_STREAM)
+    regions = np.repeat(np.arange(len(counts)), counts)
+    positions = starts[regions] + (np.asarray(stream.uniforms(len(regions))) * lengths[regions]).astype(np.int64)
+    while True:
+        order = np.lexsort((positions, regions))
+        regions, positions = regions[order], positions[order]
+        repeats = np.flatnonzero((regions[1:] == regions[:-1]) & (positions[1:] == positions[:-1])) + 1
+        if len(repeats) == 0:
+            return regions, positions
+        positions[repeats] = starts[regions[repeats]] + (np.asarray(stream.uniforms(len(repeats))) * lengths[regions[repeats]]).astype(np.int64)
+
+def region_flips(starts, lengths, rates):
+    """
+    Picks the bits to flip in a set of regions. The number of flips in each region is drawn from a binomial, then that many distinct positions are picked in the region, which flips each bit with its regions rate just as rolling for every bit does.
+    :param starts: The first position of each region
+    :param lengths: The length of each region
+    :param rates: The flip rate of each region, or one rate for all of them
+    :return: A sorted array of positions
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    regions, positions = sample_positions(starts, lengths, get_stream(MUTATION_STREAM).binomials(lengths, rates))
+    positions.sort()
+    return positions
+
+def changed_ranges(positions):
+    """
+    Merges changed bit positions into sorted (start, end) ranges, for Decoder.set_parent
+    """
+    ranges = []
+    for pos in sorted(set(positions)):
+        if ranges and ranges[-1][1] == pos:
+            ranges[-1][1] = pos + 1
+        else:
+            ranges.append([pos, pos + 1])
+    return [tuple(span) for span in ranges]
+
 def flip_segment(segment, mutation_rate=MUTATION_RATE, divisor=1):
-    count = 0
-    for i in range(len(segment)):
-        odds = (1 -(mutation_rate/divisor)) ** len(segment)
-        roll = random.random()
-        while roll > odds:
-            count += 1
-            odds = (1 -(mutation_rate/divisor)) ** (len(segment)-count)
-            roll = random.random()
-        count = min(count, len(segment))
-        choices = random.sample(range(len(segment)),count)
-        for i in choices:
-            segment = flip_at(i, segment)
-        """
-        for _ in range(len(count)):
-            index = random.choice(range(len(segment)))
-            segment = flip_at(index, segment)
-        """
-    return segment
+    """
+    Flips each bit of a segment with the mutation rate divided by the divisor
+    """
+    return flip_positions(segment, region_flips([0], [len(segment)], mutation_rate/divisor))
 
 def increment_frame(frame, val=1):
     """
@@ -67,8 +112,9 @@ def random_bit_flip(organism, mutation_rate = MUTATION_RATE):
     performs random bit flipping across the genome with equal weighting (highly chaotic, probably). Assumes it is getting an int back.
     """
     genome = bin(organism.get_genome())
+    rolls = get_stream(MUTATION_STREAM).uniforms(genome.bit_length())
     for i in range(1, genome.bit_length()):
-        if random.random() < mutation_rate:
+        if rolls[i] < mutation_rate:
             genome = bit_flip(genome, i)
     return genome
 
@@ -76,11 +122,13 @@ def random_bit_flip_string(organism, mutation_rate = MUTATION_RATE):
     """
     Performs random bit flipping across genome, but treats genome as string instead. More promising I think. Assumes byt string returned
     """
-    genome = organism.get_genome()
-    for i in range(len(genome)):
-        if random.random() < mutation_rate:
-            genome = flip_at(i, genome)
-    return genome
+    return flip_segment(organism.get_genome(), mutation_rate)
+
+def random_bit_flip_packed(organism, mutation_rate = MUTATION_RATE):
+    """
+    Same as random_bit_flip_string, but on the packed genome. Every flip is applied in a single copy.
+    """
+    return flip_segment(organism.get_packed_genome(), mutation_rate)
     
 def bit_flip_in_params(organism, mutation_rate = MUTATION_RATE):
     """
@@ -90,28 +138,47 @@ def bit_flip_in_params(organism, mutation_rate = MUTATION_RATE):
     organ_string = b''
     for organ in organism.get_organs():
         node= organ.get_dna_head()
-        params = node.get_params()
-        for i in range(len(params)):
-            if random.random() < mutation_rate:
-                params = flip_at(i, params)
+        params = flip_segment(node.get_params(), mutation_rate)
         organ_string += params
         organ_string = organ_string + node.get_start() + params + node.get_noncoding()
         for gene in organ.get_genes():
             node = gene.get_dna_head()
-            params = node.get_params()
-            for i in range(len(params)):
-                if random.random() < mutation_rate:
-                    params = flip_at(i, params)
+            params = flip_segment(node.get_params(), mutation_rate)
             organ_string += node.get_start() + params + node.get_noncoding()
     genome = organism.get_dna_head().get_noncoding()+organ_string
     return genome
     
+def flip_in_params(buffer, mutation_rate = MUTATION_RATE):
+    """
+    Same as bit_flip_in_params, but on a decoded genome buffer. The parameters of every structure are flipped at the mutation rate, and the flips are applied to a copy so no start code moves and the parent is untouched.
+    :param buffer: The GenomeBuffer of a decoded genome
+    :return: The child genome and the (start, end) ranges of the flipped bits
+    """
+    offsets = buffer.get_offsets()
+    positions = region_flips(offsets[:, 1], offsets[:, 2] - offsets[:, 1], mutation_rate).tolist()
+    return flip_positions(buffer.get_genome(), positions), changed_ranges(positions)
+
+def point_mutant(parent, mutation_rate = MUTATION_RATE):
+    """
+    Makes a child of one parent by flipping parameter bits of its body and brain structures. The child is decoded incrementally from the parents phenotype, so only the structures around the flips are read again.
+    :param parent: An organism built by the decoder, whose genome has not been edited since
+    :return: The child organism
+    """
+    body_buffer, brain_buffer = parent.get_tables().get_buffers()
+    genome, changes = flip_in_params(body_buffer, mutation_rate)
+    brain_genome, brain_changes = (None, ()) if brain_buffer is None else flip_in_params(brain_buffer, mutation_rate)
+    d = Decoder()
+    d.set_genome(genome)
+    d.set_brain_genome(brain_genome)
+    d.set_parent(parent.get_tables(), changes, brain_changes)
+    return d.read_genome()
+    
 def bit_flip_weighted(organism, mutation_rate = MUTATION_RATE):
     """
     Performs bit flipped on genome, but more strongly weighted for non coding sections
     Instead of checking every bit, lets just roll against the whole string? If it has length of 20, then its 1- odds ^ 20
     """
-    genome = b''
+    sections = []
     node = organism.get_dna_head()
     while node.next:
         start = node.get_start()
@@ -123,13 +190,13 @@ def bit_flip_weighted(organism, mutation_rate = MUTATION_RATE):
         noncoding = node.get_noncoding()
         if noncoding is None:
             noncoding = b''
-        start = flip_segment(start, mutation_rate, START_FLIP_DIVISOR)
-        params = flip_segment(params, mutation_rate, PARAM_FLIP_DIVISOR)
-        noncoding = flip_segment(noncoding, mutation_rate, NON_CODING_DIVISOR)
-        
-        genome += start+params+noncoding
+        sections.extend((start, params, noncoding))
         node = node.next
-    return genome
+    # Every section is flipped in one go, with the divisor of its kind
+    lengths = [len(section) for section in sections]
+    starts = np.cumsum([0] + lengths[:-1])
+    rates = mutation_rate/np.tile([START_FLIP_DIVISOR, PARAM_FLIP_DIVISOR, NON_CODING_DIVISOR], len(sections)//3)
+    return flip_positions(b''.join(sections), region_flips(starts, lengths, rates))
 
 
 def insert_to_preserve_order(organism, mutation_rate = MUTATION_RATE):
@@ -144,6 +211,7 @@ def increment_decrement_frame(organism, mutation_rate = MUTATION_RATE):
     Whenever a frame is read, that frame may be decremented or incremented.
     Perhaps test it with weighting as well
     """
+    stream = get_stream(MUTATION_STREAM)
     genome = b''
     node = organism.get_dna_head()
     while node.next:
@@ -155,14 +223,14 @@ def increment_decrement_frame(organism, mutation_rate = MUTATION_RATE):
         noncoding = node.get_noncoding()
         if noncoding is None:
             noncoding = b''
-        if random.random() < mutation_rate:
-            val = random.choice([1,-1])
+        if stream.random() < mutation_rate:
+            val = stream.choice([1,-1])
             start = increment_frame(start, val) 
-        if random.random() < mutation_rate:
-            val = random.choice([1,-1])
+        if stream.random() < mutation_rate:
+            val = stream.choice([1,-1])
             params = increment_frame(params, val) # Wait no, this needs to read frame by frame first.
-        if random.random() < mutation_rate:
-            val = random.choice([1,-1])
+        if stream.random() < mutation_rate:
+            val = stream.choice([1,-1])
             noncoding = increment_frame(noncoding, val) # Wait no, this needs to read frame by frame first.
         genome += start + params + noncoding
         node = node.next
@@ -170,14 +238,25 @@ def increment_decrement_frame(organism, mutation_rate = MUTATION_RATE):
     
 # ANALOGOUS TO REALITY
 
+def get_editable_head(organism):
+    """
+    Structural mutations edit the linked list of nodes, so a genome still held in its decoded GenomeBuffer is copied into Nodes first
+    """
+    head = organism.get_dna_head()
+    if isinstance(head, NodeView):
+        head = head.to_nodes()
+        organism.set_dna_head(head)
+    return head
+
 def retrotransposition(organism, mutation_rate=MUTATION_RATE):
     """
     Copys a structure and pastes it elsewhere in the genome.
     """
-    node = organism.get_dna_head().next # need to skip over the start
+    stream = get_stream(MUTATION_STREAM)
+    node = get_editable_head(organism).next # need to skip over the start
     new_node = None
     while node:
-        if random.random() < mutation_rate:
+        if stream.random() < mutation_rate:
             if new_node is None:
                 new_node = Node()
                 new_node.set_start(node.get_start())
@@ -186,11 +265,11 @@ def retrotransposition(organism, mutation_rate=MUTATION_RATE):
             else:
                 new_node.next = node.next
                 non_coding = node.get_noncoding()
-                place = random.choice(range(len(non_coding)))
+                place = stream.randint(0, len(non_coding)-1)
                 part_a = non_coding[:place]
-                part_b = non_coding[place+1:]
-                node.set_noncoding = part_a
-                new_node.set_noncoding = new_node.get_noncoding() + part_b
+                part_b = non_coding[place:]
+                node.set_noncoding(part_a)
+                new_node.set_noncoding(new_node.get_noncoding() + part_b)
                 node.next = new_node
                 new_node = None
                 node = node.next
@@ -203,10 +282,11 @@ def deletion(organism, mutation_rate=MUTATION_RATE):
     """
     Deletes a structure from the genome, preserve reading frame
     """
-    prev_node = organism.get_dna_head()
+    stream = get_stream(MUTATION_STREAM)
+    prev_node = get_editable_head(organism)
     node = prev_node.next
     while node:
-        if random.random() < mutation_rate:
+        if stream.random() < mutation_rate:
             prev_node.next = node.next
         else:
             prev_node = node
@@ -217,10 +297,11 @@ def duplication(organism, mutation_rate=MUTATION_RATE):
     """
     Duplicates a gene or structure and places it adjacent to this structure
     """
-    prev_node = organism.get_dna_head()
+    stream = get_stream(MUTATION_STREAM)
+    prev_node = get_editable_head(organism)
     node = prev_node.next
     while node:
-        if random.random() < mutation_rate:
+        if stream.random() < mutation_rate:
             new_node = Node()
             new_node.set_start(node.get_start())
             new_node.set_params(node.get_params())
@@ -235,40 +316,34 @@ def point_deletion(organism, mutation_rate= MUTATION_RATE):
     """
     pass
 
-def cross_over(male, female, crossover_chance = CROSSOVER_RATE):
-    male_node = male.get_dna_head()
-    female_node = female.get_dna_head()
-    child_genome = b''
-    current = 'female' if random.random() < .5 else 'male'
-    if current == 'female':
-        child_genome += female_node.get_structure_genome()
-    else:
-        child_genome += male_node.get_structure_genome()
-    female_node = female_node.next
-    male_node = male_node.next
-    while female_node or male_node:
-        if current == 'female' and female_node is None:
-            break
-        if current == 'male' and male_node is None:
-            break
-        if male_node is not None and female_node is not None:
-            # Swapover chance
-            if random.random() < CROSSOVER_RATE:
-                if current == 'female':
-                    current = 'male'
-                else: 
-                    current = 'female'
-
-        # get the current nodes structure
-        if current == 'female':
-            child_genome += female_node.get_structure_genome()
-        else:
-            child_genome += male_node.get_structure_genome()
-        female_node = female_node.next
-        male_node = male_node.next
-    return child_genome
+def cross_over(male, female, crossover_chance = CROSSOVER_RATE, packed = False):
+    """
+    Builds a child genome by walking both parents structures together and swapping parent at random, see cross_over_buffers
+    :param packed: If True the child genome is a PackedGenome
+    """
+    child = cross_over_buffers(get_genome_buffer(male.get_dna_head()), get_genome_buffer(female.get_dna_head()), crossover_chance)
+    genome = child.get_genome()
+    if packed:
+        return PackedGenome.from_bits(genome)
+    return genome.to_bits() if isinstance(genome, PackedGenome) else genome
+
+def sexual_reproduction(parent_one, parent_two, mutation_rate = MUTATION_RATE):
+    """
+    Makes a child of two parents. The parents genomes are crossed over and mutated as genome buffers, and the child is decoded once at the end.
+    :return: The child organism
+    """
+    child_genome_organs = mutate_buffer(cross_over_buffers(get_genome_buffer(parent_one.get_dna_head()), get_genome_buffer(parent_two.get_dna_head())), mutation_rate)
+    d = Decoder()
+    d.set_genome(child_genome_organs.get_genome())
+    if parent_one.get_brain() is not None and parent_two.get_brain() is not None:
+        child_genome_brain = mutate_buffer(cross_over_buffers(get_genome_buffer(parent_one.get_brain().get_dna_head()), get_genome_buffer(parent_two.get_brain().get_dna_head())), mutation_rate)
+        d.set_brain_genome(child_genome_brain.get_genome())
+    return d.read_genome()
 
-def sexual_reproduction(parent_one, parent_two):
+def decode_twice_reproduction(parent_one, parent_two):
+    """
+    The earlier form of sexual_reproduction, which decodes a default child to run mutation_suite on and then decodes the mutated genome again
+    """
     child_genome_organs = cross_over(parent_one, parent_two)
     child_genome_brain = cross_over(parent_one.get_brain(),parent_two.get_brain())
     d = Decoder()
@@ -276,7 +351,7 @@ def sexual_reproduction(parent_one, parent_two):
     d.set_brain_genome(child_genome_brain)
     default_child = d.read_genome()
     child_genome_organs = mutation_suite(default_child)
-    child_genome_brain = muration_suite(default_child.get_brain())
+    child_genome_brain = mutation_suite(default_child.get_brain())
     d = Decoder()
     d.set_genome(child_genome_organs)
     d.set_brain_genome(child_genome_brain)
@@ -289,4 +364,341 @@ def mutation_suite(offspring):
     retrotransposition(offspring, MUTATION_RATE)
     deletion(offspring, MUTATION_RATE)
     duplication(offspring, MUTATION_RATE)
-    return offspring.get_genome()
\ No newline at end of file
+    return offspring.get_genome()
+
+# GENOME BUFFER METHODS
+# These work on the genome as one buffer, with the structure offsets carried over from the parents, so nothing is decoded until the child is finished
+
+def get_genome_buffer(head):
+    """
+    Gets the GenomeBuffer a dna head reads from. A linked list of Nodes, as left by the structural mutations above, is packed into a new one
+    """
+    if isinstance(head, NodeView):
+        return head.get_buffer()
+    return GenomeBuffer.from_nodes(head)
+
+def plan_spans(parents, sources, indices):
+    """
+    Plans a child as spans of its parents genomes, runs of structures that lie next to each other in one parent becoming a single span
+    :param parents: The GenomeBuffers of the parents
+    :param sources: For each structure of the child in order, the parent it comes from
+    :param indices: For each structure of the child, its index in that parent
+    :return: A list of (parent, start, end) spans, and the structure offsets of the child
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    indices = np.asarray(indices, dtype=np.int64)
+    # The start, params, noncoding and end of every structure of every parent, in one table
+    tables = [np.column_stack((buffer.get_offsets(), np.append(buffer.get_offsets()[1:, 0], len(buffer.get_genome())))) for buffer in parents]
+    firsts = np.cumsum([0] + [len(table) for table in tables[:-1]])
+    bounds = np.concatenate(tables)[firsts[sources] + indices]
+    lengths = bounds[:, 3] - bounds[:, 0]
+    positions = np.cumsum(lengths) - lengths
+    offsets = bounds[:, :3] - bounds[:, :1] + positions[:, None]
+    # A new span starts wherever the parent changes or the next structure doesn't follow on in the same parent
+    breaks = np.flatnonzero((sources[1:] != sources[:-1]) | (bounds[1:, 0] != bounds[:-1, 3])) + 1
+    firsts = np.concatenate(([0], breaks))
+    lasts = np.append(breaks, len(indices)) - 1
+    spans = list(zip(sources[firsts].tolist(), bounds[firsts, 0].tolist(), bounds[lasts, 3].tolist()))
+    return spans, offsets
+
+def assemble_spans(parents, spans):
+    """
+    Writes the spans of a child into one preallocated buffer
+    :return: The child genome, packed if the parent of the first span is
+    """
+    length = sum(end - start for parent, start, end in spans)
+    if spans and isinstance(parents[spans[0][0]].get_genome(), PackedGenome):
+        bits = np.empty(length, dtype=np.uint8)
+        sources = {}
+        pos = 0
+        for parent, start, end in spans:
+            if parent not in sources:
+                genome = parents[parent].get_genome()
+                sources[parent] = genome.to_array() if isinstance(genome, PackedGenome) else np.frombuffer(genome, dtype=np.uint8) - ord('0')
+            bits[pos:pos + end - start] = sources[parent][start:end]
+            pos += end - start
+        return PackedGenome.from_array(bits)
+    child = bytearray(length)
+    pos = 0
+    for parent, start, end in spans:
+        genome = parents[parent].get_genome()
+        child[pos:pos + end - start] = genome[start:end].to_bits() if isinstance(genome, PackedGenome) else memoryview(genome)[start:end]
+        pos += end - start
+    return bytes(child)
+
+def cross_over_spans(parents, sources, indices):
+    """
+    Builds the child planned by sources and indices, see plan_spans
+    :return: The GenomeBuffer of the child
+    """
+    spans, offsets = plan_spans(parents, sources, indices)
+    return GenomeBuffer(assemble_spans(parents, spans), offsets)
+
+def cross_over_buffers(male, female, crossover_chance = CROSSOVER_RATE):
+    """
+    Builds a child from the parents genome buffers by walking their structures together, swapping parent at each structure both have with the crossover chance. The child ends where the parent it is on runs out of structures
+    :param male: The GenomeBuffer of one parent
+    :param female: The GenomeBuffer of the other
+    :return: The GenomeBuffer of the child
+    """
+    stream = get_stream(MUTATION_STREAM)
+    counts = (male.get_num_structures(), female.get_num_structures())
+    current = 1 if stream.random() < .5 else 0
+    sources = [current]
+    for index in range(1, max(counts)):
+        if index >= counts[current]:
+            break
+        if index < min(counts):
+            # Swapover chance
+            if stream.random() < crossover_chance:
+                current = 1 - current
+        sources.append(current)
+    return cross_over_spans((male, female), sources, range(len(sources)))
+
+def multi_point_cross_over(male, female, points = 2):
+    """
+    Crosses over at a number of structure boundaries picked at random, anywhere in either parent. The child swaps parent at each one, keeping the structures in line, and ends where the parent it is on runs out of structures
+    :param points: The number of crossover points
+    :return: The GenomeBuffer of the child
+    """
+    stream = get_stream(MUTATION_STREAM)
+    counts = (male.get_num_structures(), female.get_num_structures())
+    longest = max(counts)
+    cuts = np.sort(np.asarray(stream.sample(longest - 1, min(points, longest - 1)), dtype=np.int64) + 1)
+    first = 1 if stream.random() < .5 else 0
+    indices = np.arange(longest)
+    sources = (first + np.searchsorted(cuts, indices, 'right')) % 2
+    # Cut the child off at the first structure its parent doesn't have
+    missing = np.flatnonzero(indices >= np.asarray(counts)[sources])
+    end = missing[0] if len(missing) else longest
+    return cross_over_spans((male, female), sources[:end], indices[:end])
+
+def flip_buffer(buffer, positions):
+    """
+    Flips bits of a buffer, the structures stay where they are
+    :return: A new GenomeBuffer
+    """
+    return GenomeBuffer(flip_positions(buffer.get_genome(), positions), buffer.get_offsets())
+
+def flip_weighted(buffer, mutation_rate = MUTATION_RATE):
+    """
+    Same as bit_flip_weighted, but on a genome buffer. Each bit flips with the mutation rate divided by the divisor of its section, start codes being the least likely to flip and noncoding sections the most
+    :return: The child GenomeBuffer
+    """
+    offsets = buffer.get_offsets()
+    bounds = np.column_stack((offsets, np.append(offsets[1:, 0], len(buffer.get_genome()))))
+    # The start, params and noncoding section of every structure, in genome order
+    lengths = np.diff(bounds, axis=1).ravel()
+    rates = mutation_rate/np.tile([START_FLIP_DIVISOR, PARAM_FLIP_DIVISOR, NON_CODING_DIVISOR], len(offsets))
+    return flip_buffer(buffer, region_flips(offsets.ravel(), lengths, rates))
+
+def splice_buffer(buffer, edits):
+    """
+    Builds a child buffer from a parent and a list of edits, by joining slices of the parent. The parent is not changed
+    :param edits: (kind, structure, position) tuples, see the structural mutations below. Every structure and position is in the parent
+    :return: The child GenomeBuffer, or the parent itself if there are no edits
+    """
+    if not edits:
+        return buffer
+    deleted = {structure for kind, structure, position in edits if kind == 'deletion'}
+    doubled = {structure for kind, structure, position in edits if kind == 'duplication'}
+    inserts = sorted((position, structure) for kind, structure, position in edits if kind == 'retrotransposition')
+    genome = buffer.get_genome()
+    pieces = []
+    for structure in range(buffer.get_num_structures()):
+        if structure in deleted:
+            continue
+        start, params, noncoding, end = buffer.get_bounds(structure)
+        begin = start
+        header = (params, noncoding)
+        while inserts and (inserts[0][0] < end or inserts[0][0] == noncoding):
+            place, copied = inserts.pop(0)
+            pieces.append((genome, begin, place, header))
+            pieces.append(buffer.get_piece(copied))
+            # The rest of the noncoding section now follows the copy
+            begin = place
+            header = None
+        pieces.append((genome, begin, end, header))
+        if structure in doubled:
+            pieces.append(buffer.get_piece(structure))
+    return GenomeBuffer.from_pieces(pieces)
+
+def replay_edits(buffer, log):
+    """
+    Rebuilds a child from its parent and the log of its structural mutations. Each mutation logs edits of its own kind against the buffer it was given, so every run of one kind is spliced in turn
+    :return: The child GenomeBuffer
+    """
+    group = []
+    for edit in log:
+        if group and edit[0] != group[-1][0]:
+            buffer = splice_buffer(buffer, group)
+            group = []
+        group.append(edit)
+    return splice_buffer(buffer, group)
+
+def retrotransposition_buffer(buffer, mutation_rate = MUTATION_RATE, log = None):
+    """
+    Same as retrotransposition, but on a genome buffer. A structure that is picked is copied into the noncoding section of the next structure picked, at a random place, the copy taking the rest of that noncoding section as its own
+    :param log: A list the edits are added to, as ('retrotransposition', structure copied, position of the copy)
+    :return: The child GenomeBuffer
+    """
+    stream = get_stream(MUTATION_STREAM)
+    count = buffer.get_num_structures()
+    edits = []
+    source = None
+    index = 1
+    # Picks run in order, past the end back to the first structure while a copy is waiting to be placed
+    while index < count:
+        if stream.random() < mutation_rate:
+            if source is None:
+                source = index
+            else:
+                start, params, noncoding, end = buffer.get_bounds(index)
+                # The copy goes in on a frame of the noncoding section, so the decoder still finds its start code
+                frames = max(end - noncoding - 1, 0)//NORMAL_READ_LENGTH
+                edits.append(('retrotransposition', source, noncoding + stream.randint(0, frames)*NORMAL_READ_LENGTH))
+                source = None
+        index += 1
+        if index == count and source is not None:
+            index = 1
+    if log is not None:
+        log.extend(edits)
+    return splice_buffer(buffer, edits)
+
+def deletion_buffer(buffer, mutation_rate = MUTATION_RATE, log = None):
+    """
+    Same as deletion, but on a genome buffer. Each structure after the first is dropped with the mutation rate
+    :param log: A list the edits are added to, as ('deletion', structure, None)
+    :return: The child GenomeBuffer
+    """
+    stream = get_stream(MUTATION_STREAM)
+    edits = [('deletion', index, None) for index in range(1, buffer.get_num_structures()) if stream.random() < mutation_rate]
+    if log is not None:
+        log.extend(edits)
+    return splice_buffer(buffer, edits)
+
+def duplication_buffer(buffer, mutation_rate = MUTATION_RATE, log = None):
+    """
+    Same as duplication, but on a genome buffer. Each structure after the first is doubled with the mutation rate, the copy placed right after it
+    :param log: A list the edits are added to, as ('duplication', structure, None)
+    :return: The child GenomeBuffer
+    """
+    stream = get_stream(MUTATION_STREAM)
+    edits = [('duplication', index, None) for index in range(1, buffer.get_num_structures()) if stream.random() < mutation_rate]
+    if log is not None:
+        log.extend(edits)
+    return splice_buffer(buffer, edits)
+
+def mutate_buffer(buffer, mutation_rate = MUTATION_RATE, log = None):
+    """
+    Same as mutation_suite, but on a genome buffer
+    :param log: A list the structural edits are added to, see replay_edits
+    :return: The child GenomeBuffer
+    """
+    genome, changes = flip_in_params(buffer, mutation_rate)
+    buffer = GenomeBuffer(genome, buffer.get_offsets())
+    buffer = flip_weighted(buffer, mutation_rate/4)
+    buffer = retrotransposition_buffer(buffer, mutation_rate, log)
+    buffer = deletion_buffer(buffer, mutation_rate, log)
+    buffer = duplication_buffer(buffer, mutation_rate, log)
+    return buffer
+
+# BATCH METHODS
+# These make a whole brood of children at once, as the rows of a GenomeBatch
+
+def flip_in_params_batch(batch, mutation_rate = MUTATION_RATE):
+    """
+    Same as flip_in_params, for every row of a batch at once. The flips are drawn as (row, bit) pairs and applied with one XOR
+    :param batch: A GenomeBatch with the structure offsets of its rows
+    :return: The mutated GenomeBatch
+    """
+    offsets = [batch.get_offsets(row) for row in range(len(batch))]
+    starts = np.concatenate([rows[:, 1] for rows in offsets])
+    lengths = np.concatenate([rows[:, 2] - rows[:, 1] for rows in offsets])
+    # The row each parameter section belongs to
+    owners = np.repeat(np.arange(len(batch)), [len(rows) for rows in offsets])
+    regions, positions = sample_positions(starts, lengths, get_stream(MUTATION_STREAM).binomials(lengths, mutation_rate))
+    return batch.flip(owners[regions], positions)
+
+def point_mutant_batch(parent, count, mutation_rate = MUTATION_RATE):
+    """
+    Makes count point mutants of one parent, see point_mutant
+    :param parent: An organism built by the decoder, whose genome has not been edited since
+    :return: The GenomeBatch of the children's bodies and of their brains, None if the parent has no brain
+    """
+    body_buffer, brain_buffer = parent.get_tables().get_buffers()
+    body = flip_in_params_batch(GenomeBatch.from_genome(body_buffer.get_genome(), count, body_buffer.get_offsets()), mutation_rate)
+    if brain_buffer is None:
+        return body, None
+    return body, flip_in_params_batch(GenomeBatch.from_genome(brain_buffer.get_genome(), count, brain_buffer.get_offsets()), mutation_rate)
+
+def cross_over_batch(male, female, count, crossover_chance = CROSSOVER_RATE):
+    """
+    Same as calling cross_over_buffers count times, with every crossover point drawn at once and the children gathered into one array of bits
+    :param male: The GenomeBuffer of one parent
+    :param female: The GenomeBuffer of the other
+    :return: A GenomeBatch of the children, with their structure offsets
+    """
+    parents = (male, female)
+    shared = min(male.get_num_structures(), female.get_num_structures())
+    # The first roll of each child picks its first parent, the rest are the swap rolls of the structures both parents have
+    rolls = np.asarray(get_stream(MUTATION_STREAM).uniforms(count * shared)).reshape(count, shared)
+    first = (rolls[:, 0] < .5).astype(np.int64)
+    choices = (first[:, None] + np.cumsum(np.column_stack((np.zeros(count, dtype=np.int64), rolls[:, 1:] < crossover_chance)), axis=1)) % 2
+    # Both genomes end to end, the female after the male
+    bits = np.concatenate([np.unpackbits(np.frombuffer(PackedGenome.from_bits(parent.get_genome()).get_data(), dtype=np.uint8))[:len(parent.get_genome())] for parent in parents])
+    shift = (0, len(male.get_genome()))
+    bounds = []
+    for parent in parents:
+        offsets = parent.get_offsets()
+        bounds.append(np.column_stack((offsets, np.append(offsets[1:, 0], len(parent.get_genome())))))
+    seg_starts = np.where(choices == 1, bounds[1][:shared, 0][None, :] + shift[1], bounds[0][:shared, 0][None, :])
+    seg_lengths = np.where(choices == 1, (bounds[1][:shared, 3] - bounds[1][:shared, 0])[None, :], (bounds[0][:shared, 3] - bounds[0][:shared, 0])[None, :])
+    # A child that ends on the longer parent takes the rest of its structures
+    longer = 1 if female.get_num_structures() > shared else 0
+    tails = (choices[:, -1] == longer) & (parents[longer].get_num_structures() > shared)
+    tail_start = bounds[longer][shared, 0] if parents[longer].get_num_structures() > shared else 0
+    tail_length = len(parents[longer].get_genome()) - tail_start
+    seg_starts = np.column_stack((seg_starts, np.full(count, tail_start + shift[longer])))
+    seg_lengths = np.column_stack((seg_lengths, np.where(tails, tail_length, 0)))
+    # Gather every childs bits out of the parents in one go, then lay the children out as rows
+    row_lengths = seg_lengths.sum(axis=1)
+    flat_lengths = seg_lengths.ravel()
+    flat_begins = np.cumsum(flat_lengths) - flat_lengths
+    total = int(flat_lengths.sum())
+    gathered = bits[np.repeat(seg_starts.ravel() - flat_begins, flat_lengths) + np.arange(total)]
+    row_begins = np.cumsum(row_lengths) - row_lengths
+    rows = np.repeat(np.arange(count), row_lengths)
+    matrix = np.zeros((count, int(row_lengths.max()) if count else 0), dtype=np.uint8)
+    matrix[rows, np.arange(total) - row_begins[rows]] = gathered
+    # Each structure keeps its offsets, moved to where its segment landed
+    positions = flat_begins.reshape(count, shared + 1) - row_begins[:, None]
+    chosen = np.where(choices[:, :, None] == 1, female.get_offsets()[None, :shared], male.get_offsets()[None, :shared])
+    moved = chosen - chosen[:, :, :1] + positions[:, :shared, None]
+    child_offsets = []
+    for row in range(count):
+        if tails[row]:
+            child_offsets.append(np.concatenate((moved[row], parents[longer].get_offsets()[shared:] - tail_start + positions[row, shared])))
+        else:
+            child_offsets.append(moved[row])
+    return GenomeBatch.from_bits(matrix, row_lengths, child_offsets)
+
+def decode_batch(body, brain=None, parent=None):
+    """
+    Decodes the children in a batch one row at a time, as they are asked for
+    :param body: The GenomeBatch of the children's bodies
+    :param brain: The GenomeBatch of their brains, if they have them
+    :param parent: The organism the rows were point mutated from, if they were. Each child is then decoded incrementally around its flips
+    :return: A generator of the children, with None for any child the decoder can't read
+    """
+    for row in range(len(body)):
+        d = Decoder()
+        d.set_genome(body.get_genome(row))
+        if brain is not None:
+            d.set_brain_genome(brain.get_genome(row))
+        if parent is not None:
+            d.set_parent(parent.get_tables(), changed_ranges(body.get_flips(row)), () if brain is None else changed_ranges(brain.get_flips(row)))
+        try:
+            yield d.read_genome()
+        except ValueError:
+            yield None
@@ -1,5 +1,7 @@
 import unittest
 import copy
+import gc
+import pickle
 import random
 import numpy as np
 import pandas as pd
@@ -12,6 +14,17 @@ import Constructor
 from Constructor import Decoder
 from sample import *
 from Reproduction import *
+import RandomService
+from BrainBatch import PopulationBrainEngine
+from CompiledBrain import CompiledNet, QuantizedNet, compile_brain, compile_net
+from BrainPruning import prune_brain, analyse_net, SparseNet
+from DecisionCache import DecisionCache
+from BrainProfile import BrainProfiler, aggregate_profiles
+from PackedGenome import PackedGenome
+import GenomeIntern
+from FrameScan import FrameScan
+import Phenotype
+from Organ import HEALTH_COLUMN
 
 class FirstTest(unittest.TestCase):
     """
@@ -335,7 +348,7 @@ class ThirdTest(unittest.TestCase):
         cls._gene = Receptor(cls._organism.get_organs()[0], 'receptor')
         cls._gene.set_activation('sigmoid',sigmoid(40, 100))
         cls._gene.set_chemical(2)
-        cls._gene.set_parameter('health',cls._organism.get_organs()[0].health_adjust)
+        cls._gene.set_parameter('health',HEALTH_COLUMN)
 
     def setUp(self):
         print(f"\n==================== {self._testMethodName} ====================\n")
@@ -423,7 +436,7 @@ class FourthTest(unittest.TestCase):
         new_child = sexual_reproduction(self._organism, child)
         lengths_genome.append(child.get_genome())
         lengths_genome.append(new_child.get_genome())
-        lengths_brain.append(child.get_brain()get_genome())
+        lengths_brain.append(child.get_brain().get_genome())
         lengths_brain.append(new_child.get_brain().get_genome())
         for i in range(10):
             c = sexual_reproduction(child, new_child)
@@ -437,4 +450,1384 @@ class FourthTest(unittest.TestCase):
         plt.show()
         print(f"Brain lengths: {lengths_brain}")
         plt.plot(lengths_brain)
-        plt.show()
\ No newline at end of file
+        plt.show()
+
+class OrganTableTest(unittest.TestCase):
+    """
+    Tests the array backed organ parameters and the receptor accumulators
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+        decoder = Decoder()
+        decoder.set_genome(TEST_GENOME)
+        decoder.set_brain_genome(TEST_BRAIN_GENOME)
+        self._organism = decoder.read_genome()
+        self._organ = self._organism.get_organs()[0]
+
+    def test01(self):
+        """
+        Test that the running receptor totals average the same as a list of outputs would
+        """
+        outputs = [.2, .7, .4]
+        for val in outputs:
+            self._organ.act_rate_adjust(val)
+            self._organ.reaction_rate_adjust(val/2)
+        self._organ.update_params()
+        self.assertAlmostEqual(self._organ.get_act_rate(), sum(outputs)/len(outputs))
+        self.assertAlmostEqual(self._organ.get_reaction_rate(), sum(outputs)/len(outputs)/2)
+        self.assertEqual(self._organ.get_health(), health_decay(1, 0))
+
+    def test02(self):
+        """
+        Test that clearing the receptors resets the averages
+        """
+        self._organ.act_rate_adjust(.9)
+        self._organ.clear_receptors()
+        self._organ.update_params()
+        self.assertEqual(self._organ.get_act_rate(), 0)
+
+    def test03(self):
+        """
+        Test that a dead organ is masked out of the organism and its energy capacity is dropped
+        """
+        self._organ.debug_set_health(0)
+        self._organism.check_organ_health()
+        self.assertFalse(self._organ.is_alive())
+        self.assertEqual(self._organism.get_organs(), [])
+        self.assertEqual(self._organism.get_health(), 0)
+        self.assertEqual(self._organism.get_max_energy(), 1)
+
+    def test04(self):
+        """
+        Test that the running health and energy totals agree with a full recomputation as organs change
+        """
+        self._organism.set_debug_aggregates()
+        for organ in range(3):
+            self._organism.add_organ(InternalOrgan('internal', self._organism))
+        organs = self._organism.get_organs()
+        for i in range(50):
+            organ = random.choice(organs)
+            organ.debug_set_health(random.random())
+            organ.increase_energy_capacity(random.choice([0, 1]))
+            self._organism.check_organ_health()
+            organs = self._organism.get_organs()
+            if not organs:
+                break
+        self._organism.check_aggregates()
+        self.assertAlmostEqual(self._organism.get_health(), self._organism.get_organ_table().recompute_average_health())
+
+
+class RandomServiceTest(unittest.TestCase):
+    """
+    Tests the seeded random streams
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def test01(self):
+        """
+        Test that the same seed reproduces the same values across block refills
+        """
+        first = RandomService.RandomService(42, block_size=16)
+        second = RandomService.RandomService(42, block_size=16)
+        a = [first.get_stream('organs').random() for i in range(50)] + first.get_stream('organs').uniforms(40)
+        b = [second.get_stream('organs').random() for i in range(50)] + second.get_stream('organs').uniforms(40)
+        self.assertEqual(a, b)
+        self.assertEqual([first.get_stream('food').binomial(100, .04) for i in range(40)],
+                         [second.get_stream('food').binomial(100, .04) for i in range(40)])
+
+    def test02(self):
+        """
+        Test that streams do not depend on the order they are requested in, and that subsystems and spawned workers differ
+        """
+        first = RandomService.RandomService(7)
+        second = RandomService.RandomService(7)
+        second.get_stream('food')
+        self.assertEqual(first.get_stream('organs').uniforms(10), second.get_stream('organs').uniforms(10))
+        self.assertNotEqual(first.get_stream('food').uniforms(10), first.get_stream('world').uniforms(10))
+        workers = first.spawn(2)
+        self.assertNotEqual(workers[0].get_stream('organs').uniforms(10), workers[1].get_stream('organs').uniforms(10))
+
+    def test03(self):
+        """
+        Test that the organs of a seeded organism activate the same way twice
+        """
+        energies = []
+        for i in range(2):
+            RandomService.seed(3)
+            decoder = Decoder()
+            decoder.set_genome(TEST_GENOME)
+            decoder.set_brain_genome(TEST_BRAIN_GENOME)
+            organism = decoder.read_genome()
+            for j in range(20):
+                organism.add_chemical(j % 16, 1)
+                organism.activate_organs()
+            energies.append((organism.get_energy(), organism.get_chemical(5)))
+        self.assertEqual(energies[0], energies[1])
+
+
+class QuiescenceTest(unittest.TestCase):
+    """
+    Tests replaying organ activations once the biochemistry settles
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def build_organism(self, quiescent):
+        """
+        Builds the test organism with an extra receptor that holds organ health steady, so it reaches a fixed point
+        """
+        RandomService.seed(5)
+        decoder = Decoder()
+        decoder.set_genome(TEST_GENOME)
+        decoder.set_brain_genome(TEST_BRAIN_GENOME)
+        organism = decoder.read_genome()
+        organ = organism.get_organs()[0]
+        gene = Receptor(organ, 'receptor')
+        gene.set_activation('linear', linear())
+        gene.set_chemical(5)
+        gene.set_parameter('health', HEALTH_COLUMN)
+        organ.add_gene(gene)
+        organism.add_chemical(5, 1)
+        organism.calc_concentrations()
+        if quiescent:
+            organism.enable_quiescence()
+        return organism
+
+    def test01(self):
+        """
+        Test that replaying activations ends in the same state as evaluating every gene, and that ticks were skipped
+        """
+        full = self.build_organism(False)
+        for i in range(40):
+            full.activate_organs()
+        fast = self.build_organism(True)
+        for i in range(40):
+            fast.activate_organs()
+        self.assertTrue(np.allclose(full.get_chem_vector(), fast.get_chem_vector()))
+        self.assertAlmostEqual(full.get_energy(), fast.get_energy())
+        self.assertAlmostEqual(full.get_organs()[0].get_health(), fast.get_organs()[0].get_health())
+        stats = fast.get_quiescence_stats()
+        print(stats)
+        self.assertGreater(stats['skipped fraction'], 0)
+        self.assertGreater(stats['replayed activations'], 0)
+
+    def test02(self):
+        """
+        Test that eating wakes the organism and a change in concentration stops the replay
+        """
+        organism = self.build_organism(True)
+        for i in range(40):
+            organism.activate_organs()
+        replayed = organism.get_quiescence_stats()['replayed activations']
+        organism.wake()
+        organism.add_chemical(3, 50)
+        organism.activate_organs()
+        self.assertEqual(organism.get_quiescence_stats()['replayed activations'], replayed)
+
+
+class CompiledBrainTest(unittest.TestCase):
+    """
+    Tests that the compiled lobe and brain nets match the BrainNode object graph exactly
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def test01(self):
+        """
+        Test compiled outputs against the object graph on random brain genomes, for a range of inputs
+        """
+        random.seed(11)
+        checked = 0
+        for i in range(50):
+            decoder = Decoder()
+            decoder.set_genome(TEST_GENOME)
+            decoder.set_brain_genome(generate_genome(1200))
+            try:
+                brain = decoder.read_genome().get_brain()
+            except ValueError:
+                # The decoder can still read past the end of a short random brain genome
+                continue
+            for val in [-3, -.5, 0, .25, 1, 4.5]:
+                for lobe in brain.get_lobes():
+                    self.assertEqual(lobe.get_output(val), lobe.get_compiled_output(val))
+                self.assertEqual(brain.get_output(val), list(brain.get_compiled_output(val)))
+            checked += 1
+        self.assertGreater(checked, 0)
+
+    def test02(self):
+        """
+        Test that the compiled brain chooses the same action as the object graph for the test organism
+        """
+        decoder = Decoder()
+        decoder.set_genome(TEST_GENOME)
+        decoder.set_brain_genome(TEST_BRAIN_GENOME)
+        organism = decoder.read_genome()
+        brain = organism.get_brain()
+        for i in range(10):
+            organism.add_chemical(14, .2)
+            organism.calc_concentrations()
+            outs = brain.get_output()[:4]
+            self.assertEqual(brain.decide_action(), outs.index(max(outs)))
+            self.assertEqual(brain.get_output(), list(brain.get_compiled_output()))
+
+
+class BrainBatchTest(unittest.TestCase):
+    """
+    Tests that batched inference across a population chooses the same actions as each brain on its own
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def test01(self):
+        """
+        Test the batched actions and outputs against decide_action for a population of random brains of different shapes
+        """
+        random.seed(12)
+        organisms = []
+        while len(organisms) < 60:
+            decoder = Decoder()
+            decoder.set_genome(TEST_GENOME)
+            decoder.set_brain_genome(generate_genome(random.choice([600, 1200, 2400])))
+            try:
+                organism = decoder.read_genome()
+            except ValueError:
+                continue
+            for chem in range(16):
+                organism.add_chemical(chem, random.random())
+            organism.calc_concentrations()
+            organisms.append(organism)
+        brains = [organism.get_brain() for organism in organisms]
+        engine = PopulationBrainEngine(brains)
+        self.assertLess(len(engine.get_bucket_shapes()), len(brains) * 4)
+        self.assertEqual(engine.decide_actions(), [brain.decide_action() for brain in brains])
+        outputs = engine.get_outputs()
+        for brain, out in zip(brains, outputs):
+            self.assertEqual(brain.get_output(), list(out))
+
+    def test02(self):
+        """
+        Test that an empty population gives no actions
+        """
+        engine = PopulationBrainEngine()
+        self.assertEqual(engine.decide_actions(), [])
+
+
+class BrainCacheTest(unittest.TestCase):
+    """
+    Tests the per tick cache of lobe outputs in the brain
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+        decoder = Decoder()
+        decoder.set_genome(TEST_GENOME)
+        decoder.set_brain_genome(TEST_BRAIN_GENOME)
+        self.organism = decoder.read_genome()
+        self.brain = self.organism.get_brain()
+        self.num_lobes = len(self.brain.get_input_lobes())
+
+    def test01(self):
+        """
+        Test that the lobes are run once per decision, and the savings are counted
+        """
+        self.organism.add_chemical(14, .2)
+        self.organism.calc_concentrations()
+        out = self.brain.get_output()
+        self.assertEqual(self.brain.get_saved_evaluations(), (self.brain._width_layers-1) * self.num_lobes)
+        self.assertEqual(self.brain.get_output(), out)
+
+    def test02(self):
+        """
+        Test that the cached lobe total is reused within a tick and refreshed when the tick changes
+        """
+        self.organism.add_chemical(14, .2)
+        self.organism.calc_concentrations()
+        self.organism.take_action(1)
+        saved = self.brain.get_saved_evaluations()
+        total = self.brain.input_action()
+        self.assertEqual(self.brain.get_saved_evaluations(), saved + self.num_lobes)
+
+        # Within the same tick, changes to the body are not seen
+        self.organism.add_chemical(14, .5)
+        self.organism.calc_concentrations()
+        self.assertEqual(self.brain.input_action(), total)
+
+        # A new tick runs the lobes again
+        self.brain.set_tick(2)
+        fresh = self.brain.input_action()
+        self.brain.set_tick(None)
+        self.assertEqual(fresh, self.brain.input_action())
+        self.assertEqual(self.organism.take_action(3), self.brain.decide_action())
+
+
+class QuantizedBrainTest(unittest.TestCase):
+    """
+    Tests that brains with int8 weight numerators act exactly like the float brains
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def test01(self):
+        """
+        Test that decide_action picks the same action with quantized weights on a corpus of random genomes
+        """
+        random.seed(13)
+        brains = []
+        while len(brains) < 60:
+            decoder = Decoder()
+            decoder.set_genome(TEST_GENOME)
+            decoder.set_brain_genome(generate_genome(random.choice([600, 1200, 2400])))
+            try:
+                organism = decoder.read_genome()
+            except ValueError:
+                continue
+            for chem in range(16):
+                organism.add_chemical(chem, random.random() * 5)
+            organism.calc_concentrations()
+            brains.append(organism.get_brain())
+        actions = [brain.decide_action() for brain in brains]
+        outputs = [list(brain.get_output()) for brain in brains]
+        float_engine = PopulationBrainEngine(brains)
+        for brain in brains:
+            compile_brain(brain, quantized=True)
+            self.assertIsInstance(brain.get_compiled(), QuantizedNet)
+        self.assertEqual([brain.decide_action() for brain in brains], actions)
+        self.assertEqual([list(brain.get_compiled_output()) for brain in brains], outputs)
+        engine = PopulationBrainEngine(brains, quantized=True)
+        self.assertEqual(engine.decide_actions(), actions)
+        self.assertLess(engine.get_nbytes(), float_engine.get_nbytes())
+
+    def test02(self):
+        """
+        Test that the quantized weights match the float weights and that weights off the 1/32 grid are refused
+        """
+        net = CompiledNet([np.array([[-31, 0], [5, 32]]) / 32], [np.full(2, .01)], [np.zeros(2, dtype=np.int8)])
+        quantized = QuantizedNet.from_compiled(net)
+        self.assertEqual(quantized.get_numerators()[0].dtype, np.int8)
+        self.assertTrue(np.array_equal(quantized.get_weights()[0], net.get_weights()[0]))
+        self.assertEqual(list(quantized.forward(.7)), list(net.forward(.7)))
+        bad = CompiledNet([np.array([[.3]])], [np.full(1, .01)], [np.zeros(1, dtype=np.int8)])
+        with self.assertRaises(ValueError):
+            QuantizedNet.from_compiled(bad)
+
+
+class BrainPruningTest(unittest.TestCase):
+    """
+    Tests that pruned brains choose the same actions as the full brains
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def test01(self):
+        """
+        Test pruned brains against the object graph on random genomes and random body states
+        """
+        random.seed(14)
+        pruned = 0
+        checked = 0
+        while checked < 60:
+            decoder = Decoder()
+            decoder.set_genome(TEST_GENOME)
+            decoder.set_brain_genome(generate_genome(random.choice([600, 1200, 2400])))
+            try:
+                organism = decoder.read_genome()
+            except ValueError:
+                continue
+            brain = organism.get_brain()
+            stats = prune_brain(brain)
+            self.assertEqual(brain.get_prune_stats(), stats)
+            self.assertLessEqual(len(brain.get_live_lobes()), len(brain.get_input_lobes()))
+            pruned += stats['pruned weights']
+            for trial in range(5):
+                for chem in range(16):
+                    organism.add_chemical(chem, random.random() * 5)
+                organism.calc_concentrations()
+                outs = brain.get_output()[:4]
+                self.assertEqual(brain.decide_action(), outs.index(max(outs)))
+                self.assertEqual(list(brain.get_compiled_output()[:4]), outs)
+            checked += 1
+        self.assertGreater(pruned, 0)
+
+    def test02(self):
+        """
+        Test that a relu which can't fire and a node with only zero weights are found dead
+        """
+        codes = [np.array([1, 0], dtype=np.int8)]
+        net = CompiledNet([np.array([[1., 0.], [1., 0.]])], [np.full(2, .01)], codes)
+        live, lo, hi = analyse_net(net, -2, -1, [0])
+        self.assertEqual(list(live[0]), [False, True])
+        self.assertTrue(lo[0] <= -1.99 and hi[0] >= -.99)
+        sparse = SparseNet(net, live, [0])
+        for val in [-2, -1.5, -1]:
+            self.assertEqual(sparse.forward(val)[0], net.forward(val)[0])
+
+        net = CompiledNet([np.array([[1., 0.], [0., 0.]])], [np.full(2, .01)], codes)
+        live, lo, hi = analyse_net(net, -2, -1, [0])
+        sparse = SparseNet(net, live, [0])
+        self.assertFalse(sparse.needs_input())
+        self.assertEqual(sparse.get_live_weights(), 0)
+        self.assertEqual(sparse.forward(-1.5)[0], 0)
+
+
+class DecisionCacheTest(unittest.TestCase):
+    """
+    Tests the LRU cache of brain decisions
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def test01(self):
+        """
+        Test that an exact cache gives the same actions as the brain, and hits when a state repeats
+        """
+        random.seed(15)
+        checked = 0
+        while checked < 30:
+            decoder = Decoder()
+            decoder.set_genome(TEST_GENOME)
+            decoder.set_brain_genome(generate_genome(random.choice([600, 1200, 2400])))
+            try:
+                organism = decoder.read_genome()
+            except ValueError:
+                continue
+            brain = organism.get_brain()
+            states = [[random.random() * 5 for chem in range(16)] for i in range(3)]
+            cache = DecisionCache()
+            self.assertFalse(cache.is_approximate())
+            for state in states * 2:
+                for chem in range(16):
+                    organism._chems[chem] = state[chem]
+                organism.calc_concentrations()
+                brain.set_decision_cache(None)
+                action = brain.decide_action()
+                brain.set_decision_cache(cache)
+                self.assertEqual(brain.decide_action(), action)
+            stats = cache.get_stats()
+            self.assertEqual(stats['hits'] + stats['misses'], 6)
+            self.assertGreaterEqual(stats['hits'], 3)
+            checked += 1
+
+    def test02(self):
+        """
+        Test the eviction order, quantization and statistics
+        """
+        cache = DecisionCache(size=2, step=.1)
+        self.assertTrue(cache.is_approximate())
+        self.assertEqual(cache.make_key([.52, 1.04]), cache.make_key([.49, .96]))
+        cache.put((1,), 0)
+        cache.put((2,), 1)
+        self.assertEqual(cache.get((1,)), 0)
+        cache.put((3,), 2)
+        # (2,) was the least recently used
+        self.assertIsNone(cache.get((2,)))
+        self.assertEqual(cache.get((3,)), 2)
+        stats = cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['entries']), (2, 1, 1, 2))
+        self.assertTrue(stats['approximate'])
+        with self.assertRaises(ValueError):
+            DecisionCache(size=0)
+
+
+class BrainProfileTest(unittest.TestCase):
+    """
+    Tests the per lobe profiling of brains
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def test01(self):
+        """
+        Test that profiling counts every lobe evaluation and decision without changing the actions
+        """
+        random.seed(16)
+        organisms = []
+        while len(organisms) < 20:
+            decoder = Decoder()
+            decoder.set_genome(TEST_GENOME)
+            decoder.set_brain_genome(generate_genome(random.choice([600, 1200, 2400])))
+            try:
+                organisms.append(decoder.read_genome())
+            except ValueError:
+                continue
+        lobes = 0
+        for organism in organisms:
+            brain = organism.get_brain()
+            lobes += len(brain.get_input_lobes())
+            for chem in range(16):
+                organism.add_chemical(chem, random.random())
+            organism.calc_concentrations()
+            action = brain.decide_action()
+            brain.set_profiler(BrainProfiler())
+            self.assertEqual(brain.decide_action(), action)
+            self.assertEqual(brain.decide_action(), action)
+            stats = brain.get_profiler().get_stats()
+            self.assertEqual(stats['decisions'], 2)
+            self.assertEqual(stats['action changes'], 0)
+            self.assertEqual(stats['action counts'][action], 2)
+            evaluations = sum(lobe['evaluations'] for lobe in stats['lobes'].values())
+            self.assertEqual(evaluations, 2 * len(brain.get_input_lobes()))
+            for lobe in stats['lobes'].values():
+                self.assertEqual(lobe['input histogram'].sum(), lobe['evaluations'])
+                self.assertEqual(lobe['output histogram'].sum(), lobe['evaluations'])
+        total = aggregate_profiles(organisms).get_stats()
+        self.assertEqual(total['decisions'], 40)
+        self.assertEqual(sum(lobe['evaluations'] for lobe in total['lobes'].values()), 2 * lobes)
+
+    def test02(self):
+        """
+        Test binning of values and counting of action changes
+        """
+        profiler = BrainProfiler(bins=4, low=0, high=4)
+        self.assertEqual([profiler.get_bin(val) for val in [-10, 0, 1.5, 3.99, 100, float('nan')]], [0, 0, 1, 3, 3, 0])
+        for action in [0, 0, 2, 1, 1]:
+            profiler.record_decision(action, profiler.start_decision())
+        stats = profiler.get_stats()
+        self.assertEqual(stats['action changes'], 2)
+        self.assertEqual(list(stats['action counts']), [2, 2, 1, 0])
+        profiler.reset()
+        self.assertEqual(profiler.get_stats()['decisions'], 0)
+
+
+class PackedGenomeTest(unittest.TestCase):
+    """
+    Tests the packed bit genome against the byte string form
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def test01(self):
+        """
+        Test conversion, field reads, slicing, concatenation and flipping against byte strings
+        """
+        random.seed(17)
+        for length in [0, 1, 7, 8, 9, 100, 1003]:
+            bits = generate_genome(length)
+            packed = PackedGenome.from_bits(bits)
+            self.assertEqual(len(packed), length)
+            self.assertEqual(packed.to_bits(), bits)
+            self.assertEqual(len(packed.get_data()), (length+7)//8)
+            for i in range(30):
+                if length == 0:
+                    break
+                pos = random.randrange(length)
+                size = random.randint(0, length-pos)
+                self.assertEqual(packed.get_bits(pos, size), bits[pos:pos+size])
+                self.assertEqual(packed[pos:pos+size].to_bits(), bits[pos:pos+size])
+                self.assertEqual(packed[pos], int(bits[pos:pos+1]))
+                self.assertEqual(flip_at(pos, packed).to_bits(), flip_at(pos, bits))
+            other = generate_genome(13)
+            self.assertEqual((packed + other).to_bits(), bits + other)
+            self.assertEqual((other + packed).to_bits(), other + bits)
+            self.assertEqual(PackedGenome.join([packed, other, packed]).to_bits(), bits + other + bits)
+        with self.assertRaises(IndexError):
+            PackedGenome.from_bits(b'0101').get_int(2, 3)
+
+    def test02(self):
+        """
+        Test that a packed genome decodes to the same organism, and mutates the same way, as the byte string
+        """
+        decoder = Decoder()
+        decoder.set_genome(PackedGenome.from_bits(TEST_GENOME))
+        decoder.set_brain_genome(PackedGenome.from_bits(TEST_BRAIN_GENOME))
+        organism = decoder.read_genome()
+        self.assertEqual(organism.get_genome(), PackedGenome.from_bits(TEST_GENOME))
+        self.assertEqual(organism.get_packed_genome(), PackedGenome.from_bits(TEST_GENOME))
+        self.assertEqual(organism.get_brain().get_packed_genome().to_bits(), TEST_BRAIN_GENOME)
+
+        decoder = Decoder()
+        decoder.set_genome(TEST_GENOME)
+        decoder.set_brain_genome(TEST_BRAIN_GENOME)
+        unpacked = decoder.read_genome()
+        self.assertEqual(len(organism.get_organs()), len(unpacked.get_organs()))
+        self.assertEqual(organism.get_brain().get_output(), unpacked.get_brain().get_output())
+
+        RandomService.seed(5)
+        flipped = random_bit_flip_string(unpacked, .01)
+        RandomService.seed(5)
+        self.assertEqual(random_bit_flip_packed(organism, .01).to_bits(), flipped)
+        RandomService.seed(6)
+        crossed = cross_over(organism, unpacked)
+        RandomService.seed(6)
+        self.assertEqual(cross_over(organism, unpacked, packed=True).to_bits(), crossed)
+
+
+class GenomeBufferTest(unittest.TestCase):
+    """
+    Tests the contiguous genome buffer and the node views into it
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def test01(self):
+        """
+        Test that decoded genomes are kept whole and the structures tile them exactly
+        """
+        random.seed(18)
+        checked = 0
+        while checked < 30:
+            genome = generate_genome(random.choice([400, 2000, 20000]))
+            brain_genome = generate_genome(random.choice([600, 2400]))
+            decoder = Decoder()
+            decoder.set_genome(genome)
+            decoder.set_brain_genome(brain_genome)
+            try:
+                organism = decoder.read_genome()
+            except ValueError:
+                continue
+            self.assertIs(organism.get_genome(), genome)
+            self.assertIs(organism.get_brain().get_genome(), brain_genome)
+            node = organism.get_dna_head()
+            parts = []
+            while node is not None:
+                self.assertEqual(node.get_start() + node.get_params() + node.get_noncoding(), node.get_structure_genome())
+                parts.append(node.get_structure_genome())
+                node = node.next
+            self.assertEqual(b''.join(parts), genome)
+            for organ in organism.get_organs():
+                self.assertIsInstance(organ.get_dna_head(), NodeView)
+            checked += 1
+
+    def test02(self):
+        """
+        Test copying the views into Nodes, and that structural mutations work on a decoded organism
+        """
+        decoder = Decoder()
+        decoder.set_genome(TEST_GENOME)
+        decoder.set_brain_genome(TEST_BRAIN_GENOME)
+        organism = decoder.read_genome()
+        head = organism.get_dna_head()
+        buffer = head.get_buffer()
+        self.assertEqual(buffer.get_offsets().shape, (buffer.get_num_structures(), 3))
+        nodes = head.to_nodes()
+        self.assertEqual(nodes.get_entire_genome(), TEST_GENOME)
+        self.assertEqual(nodes.get_entire_packed(), head.get_entire_packed())
+        deletion(organism, 0)
+        self.assertIsInstance(organism.get_dna_head(), Node)
+        self.assertEqual(organism.get_genome(), TEST_GENOME)
+
+class GenomeInternTest(unittest.TestCase):
+    """
+    Tests sharing decoded genomes between clones
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+        GenomeIntern.INTERN_GENOMES = True
+        GenomeIntern.INTERN_TABLE.clear()
+
+    def tearDown(self):
+        GenomeIntern.INTERN_GENOMES = False
+        GenomeIntern.INTERN_TABLE.clear()
+
+    def decode(self, genome, brain_genome):
+        decoder = Decoder()
+        decoder.set_genome(genome)
+        decoder.set_brain_genome(brain_genome)
+        return decoder.read_genome()
+
+    def test01(self):
+        """
+        Test that clones share the genome and compiled nets but have their own state and ids
+        """
+        first = self.decode(TEST_GENOME, TEST_BRAIN_GENOME)
+        second = self.decode(TEST_GENOME, TEST_BRAIN_GENOME)
+        stats = GenomeIntern.INTERN_TABLE.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['templates']), (1, 1, 1))
+        self.assertGreater(stats['bytes saved'], 0)
+        self.assertIs(first.get_phenotype(), second.get_phenotype())
+        self.assertIs(first.get_dna_head().get_buffer(), second.get_dna_head().get_buffer())
+        self.assertIs(first.get_brain().get_compiled(), second.get_brain().get_compiled())
+        self.assertIsNot(first.get_brain(), second.get_brain())
+        self.assertIs(second.get_brain().get_owner(), second)
+        self.assertNotEqual(first.get_id(), second.get_id())
+        for organ_a, organ_b in zip(first.get_organs(), second.get_organs()):
+            self.assertIsNot(organ_a, organ_b)
+            self.assertNotEqual(organ_a.get_id(), organ_b.get_id())
+
+        # A different genome is a miss
+        self.decode(TEST_GENOME[:-1] + (b'0' if TEST_GENOME[-1:] == b'1' else b'1'), TEST_BRAIN_GENOME)
+        self.assertEqual(GenomeIntern.INTERN_TABLE.get_stats()['misses'], 2)
+
+    def test02(self):
+        """
+        Test that a clone behaves like a freshly decoded organism, and the template is dropped with its clones
+        """
+        clone = self.decode(TEST_GENOME, TEST_BRAIN_GENOME)
+        clone = self.decode(TEST_GENOME, TEST_BRAIN_GENOME)
+        GenomeIntern.INTERN_GENOMES = False
+        fresh = self.decode(TEST_GENOME, TEST_BRAIN_GENOME)
+        self.assertEqual(clone.get_genome(), fresh.get_genome())
+        self.assertEqual(len(clone.get_organs()), len(fresh.get_organs()))
+        for step in range(5):
+            for organism in (clone, fresh):
+                organism.add_chemical(Chemicals.CHEMS[step % len(Chemicals.CHEMS)], 0.5)
+            self.assertEqual(clone.take_action(), fresh.take_action())
+        del clone
+        gc.collect()
+        self.assertEqual(len(GenomeIntern.INTERN_TABLE), 0)
+
+class BitCursorTest(unittest.TestCase):
+    """
+    Tests reading genome fields as ints through the decoders read window
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def test01(self):
+        """
+        Test that fields read as ints match the bits of the genome, across window boundaries
+        """
+        random.seed(40)
+        genome = generate_genome(3000)
+        decoder = Decoder()
+        decoder.set_genome(genome)
+        pos = 1
+        while pos < 2900:
+            length = random.randint(1, 8)
+            self.assertEqual(decoder.read_int(length), int(genome[pos-1:pos-1+length], 2))
+            pos += length
+            self.assertEqual(decoder._current_pos, pos)
+        self.assertEqual(decoder.read_at_pos(pos=5, length=7), (b'1' + genome)[5:12])
+        self.assertEqual(decoder._current_pos, pos)
+
+    def test02(self):
+        """
+        Test that reads reaching the end of the genome are refused
+        """
+        decoder = Decoder()
+        decoder.set_genome(b'0101')
+        self.assertEqual(decoder.read_int(3), 0b010)
+        self.assertRaises(ValueError, decoder.read_int, 1)
+        decoder.set_genome(b'0101')
+        self.assertEqual(decoder.read_at_pos(length=4), b'')
+
+class OpcodeTableTest(unittest.TestCase):
+    """
+    Tests the tables classifying 8 bit frames
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def tearDown(self):
+        Constructor.GENE_UPPER_LIMIT = 120
+
+    def test01(self):
+        """
+        Test that every frame value is classified by the limits
+        """
+        body = Constructor.get_opcode_table(Constructor.BODY_KINDS)
+        brain = Constructor.get_opcode_table(Constructor.BRAIN_KINDS)
+        self.assertEqual(len(body), 256)
+        for val in range(256):
+            self.assertEqual(bool(body[val] & Constructor.GENE_START), Constructor.GENE_LOWER_LIMIT <= val <= Constructor.GENE_UPPER_LIMIT)
+            self.assertEqual(bool(body[val] & Constructor.ORGAN_START), Constructor.ORGAN_LOWER_LIMIT <= val <= Constructor.ORGAN_UPPER_LIMIT)
+            self.assertEqual(bool(body[val] & Constructor.ENERGY_FRAME), Constructor.ENERGY_LOWER_LIMIT <= val <= Constructor.ENERGY_UPPER_LIMIT)
+            self.assertEqual(brain[val], Constructor.LOBE_START if Constructor.LOBE_LOWER_LIMIT <= val <= Constructor.LOBE_UPPER_LIMIT else 0)
+
+    def test02(self):
+        """
+        Test that changing a limit gives a new table, with overlapping ranges flagged as both kinds
+        """
+        Constructor.GENE_UPPER_LIMIT = 202
+        body = Constructor.get_opcode_table(Constructor.BODY_KINDS)
+        self.assertEqual(body[201], Constructor.GENE_START | Constructor.ORGAN_START)
+        self.assertEqual(body[203], Constructor.ORGAN_START)
+        Constructor.GENE_UPPER_LIMIT = 120
+        self.assertEqual(Constructor.get_opcode_table(Constructor.BODY_KINDS)[201], Constructor.ORGAN_START)
+
+class FrameScanTest(unittest.TestCase):
+    """
+    Tests pre-scanning genomes for candidate frames
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def tearDown(self):
+        Constructor.PRESCAN = False
+
+    def summarise(self, organism):
+        """
+        Reduces an organism to the parameters and genome of each of its structures
+        """
+        summary = []
+        for organ in organism.get_organs():
+            summary.append((organ.get_act_rate(), organ.get_energy_capacity(), organ.get_dna_head().get_structure_genome()))
+            for gene in organ.get_genes():
+                summary.append((type(gene).__name__, gene.get_dna_head().get_structure_genome()))
+        brain = organism.get_brain()
+        for lobe in [brain] + brain.get_lobes():
+            summary.append((type(lobe).__name__, lobe.get_dna_head().get_structure_genome(), [[node.get_weights() for node in layer] for layer in lobe.get_hidden_layers()]))
+        return summary
+
+    def test01(self):
+        """
+        Test that the candidates are exactly the frames the opcode table marks, in each reading frame
+        """
+        random.seed(42)
+        genome = generate_genome(2000)
+        table = Constructor.get_opcode_table(Constructor.BODY_KINDS)
+        scan = FrameScan(genome, table, 1900)
+        expected = [pos for pos in range(1900) if table[int(genome[pos:pos+8], 2)]]
+        self.assertEqual(scan.get_candidates().tolist(), expected)
+        organs = [pos for pos in expected if table[int(genome[pos:pos+8], 2)] & Constructor.ORGAN_START]
+        self.assertEqual(scan.get_candidates(Constructor.ORGAN_START).tolist(), organs)
+        self.assertEqual(scan.next_candidate(13), min(pos for pos in expected if pos >= 13 and pos % 8 == 5))
+
+    def test02(self):
+        """
+        Test that decoding with the pre-scan gives the same organisms, on random genomes from 400 to 7200 bits
+        """
+        random.seed(43)
+        for size in range(400, 7201, 400):
+            for _ in range(3):
+                genome = generate_genome(size)
+                brain_genome = generate_genome(random.choice([1200, 3000]))
+                summaries = []
+                for prescan in (False, True):
+                    Constructor.PRESCAN = prescan
+                    decoder = Decoder()
+                    decoder.set_genome(genome)
+                    decoder.set_brain_genome(brain_genome)
+                    try:
+                        summaries.append(self.summarise(decoder.read_genome()))
+                    except ValueError:
+                        summaries.append(None)
+                self.assertEqual(summaries[0], summaries[1])
+
+class PhenotypeTest(unittest.TestCase):
+    """
+    Tests decoding genomes into phenotype tables, and building organisms from them
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def read(self, seed):
+        """
+        Reads a random genome into phenotype tables, skipping genomes the decoder refuses
+        """
+        random.seed(seed)
+        while True:
+            decoder = Decoder()
+            decoder.set_genome(generate_genome(3000))
+            decoder.set_brain_genome(generate_genome(1200))
+            try:
+                return decoder.read_phenotype()
+            except ValueError:
+                continue
+
+    def test01(self):
+        """
+        Test that the tables hold one row per structure of the organism built from them
+        """
+        ir = self.read(43)
+        organism = Phenotype.build_organism(ir)
+        self.assertEqual(len(ir.get_organs()), len(organism.get_organs()))
+        self.assertEqual(len(ir.get_genes()), sum(len(organ.get_genes()) for organ in organism.get_organs()))
+        self.assertEqual(len(ir.get_lobes()), len(organism.get_brain().get_lobes()) + 1)
+        self.assertEqual(ir.get_lobes()[0, Phenotype.LOBE_KIND], Phenotype.BRAIN)
+        for organ, fields in zip(organism.get_organs(), ir.get_organs().tolist()):
+            self.assertEqual(organ.get_act_rate(), fields[Phenotype.ORGAN_ACT_RATE]/32)
+
+    def test02(self):
+        """
+        Test that the tables survive pickling with the same key, and build the same organism
+        """
+        ir = self.read(44)
+        copied = pickle.loads(pickle.dumps(ir))
+        self.assertEqual(copied, ir)
+        self.assertEqual(copied.get_key(), ir.get_key())
+        first = Phenotype.build_organism(ir)
+        second = Phenotype.build_organism(copied)
+        self.assertEqual(first.get_genome(), second.get_genome())
+        for step in range(5):
+            for organism in (first, second):
+                organism.add_chemical(step, .4)
+            self.assertEqual(first.take_action(), second.take_action())
+
+    def test03(self):
+        """
+        Test that nets built from the weight arrays match the nets compiled from the brain nodes
+        """
+        ir = self.read(45)
+        brain = Phenotype.build_organism(ir).get_brain()
+        for quantized in (False, True):
+            built = Phenotype.build_net(ir, 0, quantized)
+            compiled = compile_net(brain.get_hidden_layers(), quantized)
+            for built_array, compiled_array in zip(built.get_weights() + built.get_codes(), compiled.get_weights() + compiled.get_codes()):
+                self.assertTrue(np.array_equal(built_array, compiled_array))
+
+class PickleTest(unittest.TestCase):
+    """
+    Tests pickling organisms to send them to other processes
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def make_organism(self, seed):
+        random.seed(seed)
+        while True:
+            decoder = Decoder()
+            decoder.set_genome(generate_genome(3000))
+            decoder.set_brain_genome(generate_genome(1200))
+            try:
+                return decoder.read_genome()
+            except ValueError:
+                continue
+
+    def test01(self):
+        """
+        Test that every activation function pickles with its parameters and gives the same outputs
+        """
+        for func, args in zip(functions, [(), (), (5,), (5,), (3,), (3,), (40, 100), (40, 100), (12, 30)]):
+            activation = func(*args)
+            copied = pickle.loads(pickle.dumps(activation))
+            self.assertEqual(copied, activation)
+            for x in (.1, .5, .9):
+                self.assertEqual(copied(x), activation(x))
+
+    def test02(self):
+        """
+        Test that an organism built from phenotype tables round trips with its state, and keeps behaving the same
+        """
+        organism = self.make_organism(44)
+        for tick in range(3):
+            organism.add_chemical(tick, .3)
+            organism.take_action(tick)
+        copied = pickle.loads(pickle.dumps(organism))
+        self.assertIs(type(copied.get_tables()), Phenotype.PhenotypeIR)
+        self.assertEqual(copied.get_id(), organism.get_id())
+        self.assertEqual([organ.get_id() for organ in copied.get_organs()], [organ.get_id() for organ in organism.get_organs()])
+        self.assertEqual(copied.get_genome(), organism.get_genome())
+        self.assertEqual(copied.get_brain().get_tick_state(), organism.get_brain().get_tick_state())
+        for tick in range(3, 8):
+            for body in (organism, copied):
+                body.add_chemical(tick, .2)
+                for organ in body.get_organs():
+                    if not any(gene.get_type() == 'reaction' for gene in organ.get_genes()):
+                        organ.activate_organ()
+                body.calc_concentrations()
+            self.assertEqual(copied.take_action(tick), organism.take_action(tick))
+            self.assertEqual(copied.get_max_energy(), organism.get_max_energy())
+
+    def test03(self):
+        """
+        Test that the compact form is smaller than pickling the whole object graph
+        """
+        organisms = [self.make_organism(seed) for seed in range(45, 50)]
+        compact = Phenotype.pickle_benchmark(organisms, 1)
+        for organism in organisms:
+            organism.set_tables(None)
+        graph = Phenotype.pickle_benchmark(organisms, 1)
+        self.assertEqual(compact['organisms'], 5)
+        self.assertLess(compact['bytes per organism'], graph['bytes per organism'])
+        copied = pickle.loads(pickle.dumps(organisms[0]))
+        self.assertEqual(copied.take_action(), organisms[0].take_action())
+
+class IncrementalDecodeTest(unittest.TestCase):
+    """
+    Tests decoding a child genome incrementally from its parents phenotype
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+
+    def read(self, genome, brain_genome, parent=None, changes=None, brain_changes=None):
+        """
+        Reads genomes into phenotype tables, with the parent to copy from if given
+        :return: The PhenotypeIR, or None if the decoder refused the genome
+        """
+        decoder = Decoder()
+        decoder.set_genome(genome)
+        decoder.set_brain_genome(brain_genome)
+        if parent is not None:
+            decoder.set_parent(parent, changes, brain_changes)
+        try:
+            return decoder.read_phenotype()
+        except ValueError:
+            return None
+
+    def assertSamePhenotype(self, first, second):
+        self.assertEqual(first is None, second is None)
+        if first is None:
+            return
+        self.assertEqual(first.get_key(), second.get_key())
+        for first_buffer, second_buffer in zip(first.get_buffers(), second.get_buffers()):
+            self.assertTrue(np.array_equal(first_buffer.get_offsets(), second_buffer.get_offsets()))
+
+    def test01(self):
+        """
+        Test that flipping bits anywhere, start codes included, decodes the same incrementally as in full
+        """
+        random.seed(45)
+        for size in (600, 3000, 7200):
+            for packed in (False, True):
+                genome = generate_genome(size, packed)
+                brain_genome = generate_genome(1200, packed)
+                parent = self.read(genome, brain_genome)
+                if parent is None:
+                    continue
+                for count in (0, 1, 3, 10):
+                    positions = [random.randrange(size) for _ in range(count)]
+                    brain_positions = [random.randrange(1200) for _ in range(count // 2)]
+                    child = flip_positions(genome, positions)
+                    brain_child = flip_positions(brain_genome, brain_positions)
+                    full = self.read(child, brain_child)
+                    self.assertSamePhenotype(self.read(child, brain_child, parent, changed_ranges(positions), changed_ranges(brain_positions)), full)
+                    # Without the changed ranges the genome is read in full
+                    self.assertSamePhenotype(self.read(child, brain_child, parent, None, None), full)
+
+    def test02(self):
+        """
+        Test that parameter flips keep every structure in place, and that point mutants build the same organism as a full decode
+        """
+        random.seed(46)
+        parent = None
+        while parent is None:
+            parent = self.read(generate_genome(3000), generate_genome(1200))
+        body_buffer = parent.get_buffers()[0]
+        genome, changes = flip_in_params(body_buffer, .05)
+        self.assertGreater(len(changes), 0)
+        for start, end in changes:
+            structure = np.searchsorted(body_buffer.get_offsets()[:, 0], start, 'right') - 1
+            begin, params, noncoding, stop = body_buffer.get_bounds(structure)
+            self.assertTrue(params <= start and end <= noncoding)
+        self.assertEqual(len(genome), len(body_buffer.get_genome()))
+        organism = Phenotype.build_organism(parent)
+        child = point_mutant(organism, .01)
+        decoder = Decoder()
+        decoder.set_genome(child.get_genome())
+        decoder.set_brain_genome(child.get_brain().get_genome())
+        self.assertEqual(child.get_tables(), decoder.read_phenotype())
+
+
+class ReproductionPipelineTest(unittest.TestCase):
+    """
+    Tests crossing over and mutating genome buffers, with the child decoded once
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+        random.seed(47)
+        self.parents = []
+        while len(self.parents) < 4:
+            decoder = Decoder()
+            decoder.set_genome(generate_genome(3000))
+            decoder.set_brain_genome(generate_genome(1200))
+            try:
+                self.parents.append(decoder.read_genome())
+            except ValueError:
+                pass
+
+    def test01(self):
+        """
+        Test that crossing over buffers takes each structure from one parent, in line, and that cross_over gives the same genome
+        """
+        for male in self.parents:
+            for female in self.parents:
+                parents = (get_genome_buffer(male.get_dna_head()), get_genome_buffer(female.get_dna_head()))
+                RandomService.seed(7)
+                genome = cross_over(male, female)
+                RandomService.seed(7)
+                child = cross_over_buffers(*parents, .3)
+                RandomService.seed(7)
+                self.assertEqual(child.get_genome(), cross_over(male, female, .3))
+                RandomService.seed(7)
+                self.assertEqual(cross_over_buffers(*parents).get_genome(), genome)
+                segments = []
+                for index in range(child.get_num_structures()):
+                    segment = child.get_segment(*child.get_bounds(index)[::3])
+                    self.assertIn(segment, [parent.get_segment(*parent.get_bounds(index)[::3]) for parent in parents if index < parent.get_num_structures()])
+                    segments.append(segment)
+                self.assertEqual(b''.join(segments), child.get_genome())
+
+    def test02(self):
+        """
+        Test that the mutations leave the parent buffer alone, and keep track of where the structures are
+        """
+        buffer = get_genome_buffer(self.parents[0].get_dna_head())
+        genome = buffer.get_genome()
+        offsets = buffer.get_offsets().copy()
+        for seed in range(10):
+            RandomService.seed(seed)
+            child = mutate_buffer(buffer, .05)
+            for index in range(1, child.get_num_structures()):
+                start, params, noncoding, end = child.get_bounds(index)
+                self.assertEqual(params - start, NORMAL_READ_LENGTH)
+                self.assertTrue(params <= noncoding <= end)
+        self.assertEqual(buffer.get_genome(), genome)
+        self.assertTrue(np.array_equal(buffer.get_offsets(), offsets))
+        # Structures dropped and doubled are whole structures of the parent
+        RandomService.seed(3)
+        child = duplication_buffer(buffer, .5)
+        structures = {buffer.get_segment(*buffer.get_bounds(index)[::3]) for index in range(buffer.get_num_structures())}
+        for index in range(child.get_num_structures()):
+            self.assertIn(child.get_segment(*child.get_bounds(index)[::3]), structures)
+
+    def test03(self):
+        """
+        Test that linked lists of Nodes are packed into buffers, and that sexual reproduction makes a child
+        """
+        organism = self.parents[1]
+        RandomService.seed(2)
+        deletion(organism, .2)
+        self.assertEqual(get_genome_buffer(organism.get_dna_head()).get_genome(), organism.get_dna_head().get_entire_genome())
+        RandomService.seed(4)
+        child = sexual_reproduction(self.parents[0], self.parents[2])
+        self.assertIsNotNone(child.get_brain())
+        self.assertGreater(len(child.get_genome()), 0)
+
+
+class RegionFlipTest(unittest.TestCase):
+    """
+    Tests drawing bit flips per region with binomial counts
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+        RandomService.seed(48)
+
+    def test01(self):
+        """
+        Test that flips land in their regions without repeats, as often as rolling for every bit would
+        """
+        lengths = np.array([8, 40, 300, 0, 900])
+        starts = np.cumsum([0] + list(lengths[:-1]))
+        rates = np.array([.05, .01, .02, .5, .004])
+        hits = np.zeros(lengths.sum())
+        for _ in range(4000):
+            positions = region_flips(starts, lengths, rates)
+            self.assertEqual(len(np.unique(positions)), len(positions))
+            self.assertTrue(np.all(positions[1:] > positions[:-1]))
+            hits[positions] += 1
+        expected = np.repeat(rates, lengths) * 4000
+        for start, length, rate in zip(starts, lengths, rates):
+            if length:
+                self.assertAlmostEqual(hits[start:start+length].mean(), rate * 4000, delta=rate * 4000 * .15)
+        self.assertLess(np.max(np.abs(hits - expected)/np.sqrt(expected)), 5)
+
+    def test02(self):
+        """
+        Test that bulk flips give the same genome packed or not, and that a flip made twice is undone
+        """
+        genome = generate_genome(500)
+        positions = [3, 499, 0, 250, 251]
+        flipped = flip_positions(genome, positions)
+        self.assertEqual(sum(a != b for a, b in zip(genome, flipped)), len(positions))
+        self.assertEqual(flip_positions(PackedGenome.from_bits(genome), positions).to_bits(), flipped)
+        self.assertEqual(flip_positions(flipped, positions), genome)
+        self.assertEqual(PackedGenome.from_bits(genome).flip_bits([7, 7]).to_bits(), genome)
+        with self.assertRaises(IndexError):
+            PackedGenome.from_bits(genome).flip_bits([500])
+        self.assertEqual(flip_segment(genome, 0), genome)
+
+
+class OffspringBatchTest(unittest.TestCase):
+    """
+    Tests making a brood of children at once as the rows of a GenomeBatch
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+        random.seed(49)
+        self.parents = []
+        while len(self.parents) < 3:
+            decoder = Decoder()
+            decoder.set_genome(generate_genome(3000))
+            decoder.set_brain_genome(generate_genome(1200))
+            try:
+                self.parents.append(decoder.read_genome())
+            except ValueError:
+                pass
+
+    def test01(self):
+        """
+        Test that a batch of crossovers holds the same children as crossing over buffers one at a time
+        """
+        for male in self.parents:
+            for female in self.parents:
+                male_buffer = get_genome_buffer(male.get_dna_head())
+                female_buffer = get_genome_buffer(female.get_dna_head())
+                RandomService.seed(8)
+                children = [cross_over_buffers(male_buffer, female_buffer, .3) for _ in range(12)]
+                RandomService.seed(8)
+                batch = cross_over_batch(male_buffer, female_buffer, 12, .3)
+                self.assertEqual(len(batch), 12)
+                for row, child in enumerate(children):
+                    self.assertEqual(batch.get_genome(row), PackedGenome.from_bits(child.get_genome()))
+                    self.assertTrue(np.array_equal(batch.get_offsets(row), child.get_offsets()))
+
+    def test02(self):
+        """
+        Test that point mutants only flip parameters, and decode from the batch the same as in full
+        """
+        parent = self.parents[0]
+        body_buffer = parent.get_tables().get_buffers()[0]
+        RandomService.seed(9)
+        body, brain = point_mutant_batch(parent, 30, .01)
+        offsets = body_buffer.get_offsets()
+        for row in range(len(body)):
+            for pos in body.get_flips(row):
+                structure = np.searchsorted(offsets[:, 0], pos, 'right') - 1
+                self.assertTrue(offsets[structure, 1] <= pos < offsets[structure, 2])
+            genome = body.get_genome(row)
+            self.assertEqual(genome, PackedGenome.from_bits(flip_positions(body_buffer.get_genome(), body.get_flips(row))))
+        for row, child in enumerate(decode_batch(body, brain, parent)):
+            decoder = Decoder()
+            decoder.set_genome(body.get_genome(row))
+            decoder.set_brain_genome(brain.get_genome(row))
+            try:
+                full = decoder.read_phenotype()
+            except ValueError:
+                full = None
+            self.assertEqual(child is None, full is None)
+            if child is not None:
+                self.assertEqual(child.get_tables(), full)
+        # Flipping the same bits again gives back the parent
+        rows = np.repeat(np.arange(len(body)), [len(body.get_flips(row)) for row in range(len(body))])
+        positions = np.concatenate([body.get_flips(row) for row in range(len(body))])
+        restored = body.flip(rows, positions)
+        for genome in restored.genomes():
+            self.assertEqual(genome, PackedGenome.from_bits(body_buffer.get_genome()))
+
+
+class StructuralEditTest(unittest.TestCase):
+    """
+    Tests structural mutations made by splicing genome buffers, and their edit logs
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+        random.seed(50)
+
+    def read(self, packed=False):
+        while True:
+            decoder = Decoder()
+            decoder.set_genome(generate_genome(4000, packed))
+            decoder.set_brain_genome(generate_genome(1200, packed))
+            try:
+                return decoder.read_genome()
+            except ValueError:
+                pass
+
+    def test01(self):
+        """
+        Test that the edit log rebuilds the child from the parent, and that the parent is left alone
+        """
+        for packed in (False, True):
+            buffer = get_genome_buffer(self.read(packed).get_dna_head())
+            genome = buffer.get_genome()
+            for seed in range(10):
+                log = []
+                RandomService.seed(seed)
+                child = retrotransposition_buffer(buffer, .2, log)
+                child = deletion_buffer(child, .2, log)
+                child = duplication_buffer(child, .2, log)
+                self.assertGreater(len(log), 0)
+                self.assertIsInstance(child.get_genome(), type(genome))
+                replayed = replay_edits(buffer, log)
+                self.assertEqual(replayed.get_genome(), child.get_genome())
+                self.assertTrue(np.array_equal(replayed.get_offsets(), child.get_offsets()))
+            self.assertEqual(buffer.get_genome(), genome)
+
+    def test02(self):
+        """
+        Test that each kind of edit changes the genome by whole structures
+        """
+        buffer = get_genome_buffer(self.read().get_dna_head())
+        lengths = [buffer.get_bounds(index)[3] - buffer.get_bounds(index)[0] for index in range(buffer.get_num_structures())]
+        edits = [('deletion', 1, None), ('duplication', 2, None)]
+        child = splice_buffer(buffer, edits)
+        self.assertEqual(len(child.get_genome()), len(buffer.get_genome()) - lengths[1] + lengths[2])
+        self.assertEqual(child.get_num_structures(), buffer.get_num_structures())
+        start, params, noncoding, end = buffer.get_bounds(2)
+        child = splice_buffer(buffer, [('retrotransposition', 1, noncoding)])
+        self.assertEqual(child.get_num_structures(), buffer.get_num_structures() + 1)
+        self.assertEqual(child.get_segment(*child.get_bounds(3)[::3]), buffer.get_segment(*buffer.get_bounds(1)[::3]) + buffer.get_segment(noncoding, end))
+        self.assertIs(splice_buffer(buffer, []), buffer)
+
+    def test03(self):
+        """
+        Test that retrotransposition on Nodes moves the rest of the noncoding section behind the copy, without losing a bit
+        """
+        nodes = []
+        for start, params, noncoding in ((b'', b'', b'0101'), (b'11111000', b'0110', b'001100'), (b'11010000', b'1111', b'10101010')):
+            node = Node()
+            node.set_start(start)
+            node.set_params(params)
+            node.set_noncoding(noncoding)
+            if nodes:
+                nodes[-1].next = node
+            nodes.append(node)
+        organism = Body()
+        organism.set_dna_head(nodes[0])
+        length = len(nodes[0].get_entire_genome())
+        RandomService.seed(1)
+        # The first structure is copied into the noncoding section of the second
+        retrotransposition(organism, 1)
+        self.assertEqual(len(nodes[0].get_entire_genome()), length + 18)
+        copy = nodes[2].next
+        self.assertEqual(copy.get_start() + copy.get_params(), b'111110000110')
+        self.assertEqual(nodes[2].get_noncoding() + copy.get_noncoding()[6:], b'10101010')
+        self.assertTrue(copy.get_noncoding().startswith(b'001100'))
+        for node in nodes:
+            self.assertNotIn('set_noncoding', vars(node))
+
+
+class SpanCrossoverTest(unittest.TestCase):
+    """
+    Tests planning children as spans of their parents genomes
+    """
+    def setUp(self):
+        print(f"\n==================== {self._testMethodName} ====================\n")
+        random.seed(51)
+        self.buffers = []
+        for packed in (False, True):
+            while True:
+                decoder = Decoder()
+                decoder.set_genome(generate_genome(4000, packed))
+                decoder.set_brain_genome(generate_genome(1200, packed))
+                try:
+                    self.buffers.append(get_genome_buffer(decoder.read_genome().get_dna_head()))
+                    break
+                except ValueError:
+                    pass
+
+    def test01(self):
+        """
+        Test that structures lying next to each other in a parent are copied as one span
+        """
+        male, female = self.buffers
+        count = min(male.get_num_structures(), female.get_num_structures())
+        spans, offsets = plan_spans((male, female), [0] * count, range(count))
+        self.assertEqual(len(spans), 1)
+        self.assertTrue(np.array_equal(offsets, male.get_offsets()[:count]))
+        sources = [0, 0, 1, 1, 0]
+        spans, offsets = plan_spans((male, female), sources, range(5))
+        self.assertEqual([span[0] for span in spans], [0, 1, 0])
+        child = cross_over_spans((male, female), sources, range(5))
+        self.assertIsInstance(child.get_genome(), bytes)
+        for index, source in enumerate(sources):
+            parent = (male, female)[source]
+            self.assertEqual(child.get_segment(*child.get_bounds(index)[::3]), parent.get_segment(*parent.get_bounds(index)[::3]))
+        # A packed first parent gives a packed child with the same bits
+        packed = cross_over_spans((GenomeBuffer(PackedGenome.from_bits(male.get_genome()), male.get_offsets()), female), sources, range(5))
+        self.assertEqual(packed.get_genome().to_bits(), child.get_genome())
+        self.assertTrue(np.array_equal(packed.get_offsets(), child.get_offsets()))
+
+    def test02(self):
+        """
+        Test that a multi point crossover swaps parent no more often than it has points
+        """
+        male, female = self.buffers
+        for seed in range(20):
+            RandomService.seed(seed)
+            child = multi_point_cross_over(male, female, 3)
+            sources = []
+            for index in range(child.get_num_structures()):
+                segment = child.get_segment(*child.get_bounds(index)[::3])
+                matches = [source for source, parent in enumerate((male, female)) if index < parent.get_num_structures() and parent.get_segment(*parent.get_bounds(index)[::3]) == segment]
+                self.assertGreater(len(matches), 0)
+                sources.append(matches)
+            swaps = 0
+            current = sources[0]
+            for matches in sources[1:]:
+                if not set(matches) & set(current):
+                    swaps += 1
+                    current = matches
+                else:
+                    current = list(set(matches) & set(current))
+            self.assertLessEqual(swaps, 3)
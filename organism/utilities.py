@@ -1,6 +1,7 @@
 import string
 import random
 import math
+from PackedGenome import PackedGenome
 
 """
 Constants for health decay function
@@ -26,7 +27,13 @@ def generate_id(length=10):
     return ''.join(random.choices(characters, k=length))
 
 
-def generate_genome(length=400):
+def generate_genome(length=400, packed=False):
+    """
+    Generates a random genome
+    :param packed: If True a PackedGenome is returned instead of a byte string
+    """
+    if packed:
+        return PackedGenome.random(length)
     bits = b''
     for i in range(length):
         bits += random.choice([b'0',b'1'])
@@ -74,58 +81,118 @@ def bit_flip(binary_val, position):
 func_names = ['linear', 'inverse linear', 'exponential', 'inverse exponential', 'radical', 'inverse radical', 'sigmoid', 'inverse sigmoid', 'negative square root']
 bits_needed = [tuple(), tuple(), (4,), (4,), (4,), (4,), (7,7), (7,7), (7,7)]
 
-def linear():
-    def linear_func(x):
+class ActivationFunction:
+    """
+    A gene activation function with its parameters read from the genome. Pickles as its class and parameters, so genes can be sent to other processes
+    """
+    def __init__(self, *params):
+        self._params = params
+
+    def get_params(self):
+        return self._params
+
+    def __call__(self, x):
+        raise NotImplementedError
+
+    def __reduce__(self):
+        return (type(self), self._params)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._params == other._params
+
+    def __hash__(self):
+        return hash((type(self), self._params))
+
+    def __repr__(self):
+        return f"{type(self).__name__}{self._params}"
+
+class Linear(ActivationFunction):
+    def __call__(self, x):
         return x
-    return linear_func
 
-def inverse_linear():
-    def inv(x):
+class InverseLinear(ActivationFunction):
+    def __call__(self, x):
         return 1-x
-    return inv
+
+class Exponential(ActivationFunction):
+    def __init__(self, exponent):
+        super().__init__(exponent)
+        self._exponent = exponent
+
+    def __call__(self, x):
+        return x ** self._exponent
+
+class InverseExponential(Exponential):
+    def __call__(self, x):
+        return 1 - x ** self._exponent
+
+class Radical(ActivationFunction):
+    def __init__(self, radicand):
+        super().__init__(radicand)
+        self._radicand = radicand
+
+    def __call__(self, x):
+        return x**(1/max(self._radicand,1))
+
+class InverseRadical(Radical):
+    def __call__(self, x):
+        return 1 - x**(1/max(self._radicand,1))
+
+class Sigmoid(ActivationFunction):
+    def __init__(self, coefficient, mean):
+        super().__init__(coefficient, mean)
+        self._coefficient = coefficient
+        self._mean = mean
+
+    def __call__(self, x):
+        return 1 / (1 + math.e ** ((self._coefficient * x * -1) + (self._mean/128 * self._coefficient)))
+
+class ReverseSigmoid(Sigmoid):
+    def __call__(self, x):
+        return (-1*Sigmoid.__call__(self, x) + 1)
+
+class ReverseSquare(ActivationFunction):
+    def __init__(self, base, coefficient):
+        super().__init__(base, coefficient)
+        self._base = 1 + base/16
+        self._coefficient = coefficient + 1
+
+    def __call__(self, x):
+        return (self._base ** (self._coefficient * x * -1)) ** .5
+
+def linear():
+    return Linear()
+
+def inverse_linear():
+    return InverseLinear()
     
 def exponential(exponent):
     """
     Exponent in range of 1-16?
     """
-    def exp(x):
-        return x ** exponent
-    return exp
+    return Exponential(exponent)
 
 def inverse_exponential(exponent):
-    def inv_exp(x):
-        return 1 - x ** exponent
-    return inv_exp
+    return InverseExponential(exponent)
     
 def radical(radicand):
     """
     Radicand in range of 1-16
     """
-    def rad(x):
-        return x**(1/max(radicand,1))
-    return rad
+    return Radical(radicand)
 
 def inverse_radical(radicand):
-    def rad(x):
-        return 1 - x**(1/max(radicand,1))
-    return rad
+    return InverseRadical(radicand)
 
 def sigmoid(coefficient, mean):
     """
     Coefficient is 1 to 128
     Mean is 0-1 maybe 1/(1 to 128) to avoid IEEE754
     """
-    mean = mean
-    def sig(x):
-        return 1 / (1 + math.e ** ((coefficient * x * -1) + (mean/128 * coefficient)))
-    return sig
+    return Sigmoid(coefficient, mean)
 
 def reverse_sigmoid(coefficient, mean):
-    mean = mean
-    func = sigmoid(coefficient, mean)
-    def sig(x):
-        return (-1*func(x) + 1)
-    return sig
+    return ReverseSigmoid(coefficient, mean)
 
 def reverse_square(base, coefficient):
     """
@@ -133,11 +200,7 @@ def reverse_square(base, coefficient):
     base = 1-65 -> 1+ base/16
     coefficient = 1-65
     """
-    base = 1 + base/16
-    coefficient = coefficient + 1
-    def rev(x):
-        return (base ** (coefficient * x * -1)) ** .5
-    return rev
+    return ReverseSquare(base, coefficient)
 
 def health_decay(health, param):
     """